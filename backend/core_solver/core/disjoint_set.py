@@ -0,0 +1,72 @@
+class DisjointSet:
+    """
+    Cấu trúc hợp - tìm (Union-Find) cho các lớp tương đương của phép bằng nhau.
+    - Nén đường đi (path compression) + hợp theo hạng (union by rank) => gần O(1).
+    - Dữ liệu cấp lớp (ví dụ: Fact giá trị đã biết) được lưu tại gốc của lớp.
+    """
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+        self.data = {}  # {root: {key: value}}
+
+    def copy(self):
+        """Bản sao độc lập (dữ liệu cấp lớp được chép nông từng lớp)."""
+        other = DisjointSet()
+        other.parent = dict(self.parent)
+        other.rank = dict(self.rank)
+        other.data = {root: dict(d) for root, d in self.data.items()}
+        return other
+
+    def __contains__(self, x):
+        return x in self.parent
+
+    def add(self, x):
+        if x not in self.parent:
+            self.parent[x] = x
+            self.rank[x] = 0
+
+    def find(self, x):
+        """Trả về gốc của lớp chứa x (x chưa có thì coi là lớp của riêng nó)."""
+        parent = self.parent
+        if x not in parent: return x
+
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Nén đường đi
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def connected(self, a, b):
+        return a == b or self.find(a) == self.find(b)
+
+    def union(self, a, b):
+        """
+        Hợp hai lớp. Trả về gốc mới, hoặc None nếu đã cùng lớp.
+        Dữ liệu của lớp bị nhập chỉ bổ sung những khóa mà lớp gốc chưa có.
+        """
+        self.add(a); self.add(b)
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb: return None
+
+        if self.rank[ra] < self.rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if self.rank[ra] == self.rank[rb]:
+            self.rank[ra] += 1
+
+        merged = self.data.pop(rb, None)
+        if merged:
+            root_data = self.data.setdefault(ra, {})
+            for k, v in merged.items():
+                root_data.setdefault(k, v)
+        return ra
+
+    def get(self, x, key, default=None):
+        return self.data.get(self.find(x), {}).get(key, default)
+
+    def setdefault(self, x, key, value):
+        """Gắn dữ liệu cho lớp chứa x nếu lớp chưa có khóa này."""
+        self.add(x)
+        return self.data.setdefault(self.find(x), {}).setdefault(key, value)
@@ -1,102 +1,143 @@
+import weakref
+
+
 class Entity:
+    """
+    Lớp cơ sở cho các đối tượng hình học.
+    Đối tượng là bất biến: canonical_id được tính MỘT lần khi khởi tạo,
+    nhờ đó __eq__/__hash__ (được gọi liên tục trong set/dict của các luật) rất rẻ.
+    """
+    __slots__ = ("_cid",)
+
+    def _freeze(self, cid, **fields):
+        for k, v in fields.items():
+            object.__setattr__(self, k, v)
+        object.__setattr__(self, "_cid", cid)
+
     @property
     def canonical_id(self):
         """ID định danh duy nhất (dùng để so sánh trong Knowledge Graph)."""
-        raise NotImplementedError
+        return self._cid
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} là đối tượng bất biến")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} là đối tượng bất biến")
 
     def __repr__(self):
-        return self.canonical_id
+        return self._cid
 
     def __eq__(self, other):
-        return self.canonical_id == other.canonical_id
+        if self is other: return True
+        if not isinstance(other, Entity): return NotImplemented
+        return self._cid == other._cid
 
     def __hash__(self):
-        return hash(self.canonical_id)
+        return hash(self._cid)
 
 
 class Point(Entity):
-    def __init__(self, name):
-        self.name = name.upper()
-
-    @property
-    def canonical_id(self):
-        return self.name
+    """
+    Điểm được intern theo tên (flyweight): Point("a") is Point("A").
+    Registry dùng tham chiếu yếu nên điểm không còn ai dùng sẽ được giải phóng.
+    """
+    __slots__ = ("name", "__weakref__")
+    _registry = weakref.WeakValueDictionary()
+
+    def __new__(cls, name):
+        key = name.upper()
+        point = cls._registry.get(key)
+        if point is None:
+            point = super().__new__(cls)
+            point._freeze(key, name=key)
+            cls._registry[key] = point
+        return point
+
+    def __reduce__(self):
+        return (Point, (self.name,))
 
 
 class Segment(Entity):
+    __slots__ = ("p1", "p2")
+
     def __init__(self, p1, p2):
-        self.p1 = p1
-        self.p2 = p2
+        n1, n2 = p1.name, p2.name
+        if n2 < n1: n1, n2 = n2, n1
+        self._freeze(f"Seg_{n1}{n2}", p1=p1, p2=p2)
+
+    def __reduce__(self):
+        return (Segment, (self.p1, self.p2))
 
-    @property
-    def canonical_id(self):
-        names = sorted([self.p1.name, self.p2.name])
-        return f"Seg_{names[0]}{names[1]}"
-    
     def __repr__(self):
         return f"Đoạn {self.p1.name}{self.p2.name}"
 
 
 class Angle(Entity):
+    __slots__ = ("p1", "vertex", "p3")
+
     def __init__(self, p1, vertex, p3):
-        self.p1 = p1
-        self.vertex = vertex
-        self.p3 = p3
+        n1, n3 = p1.name, p3.name
+        if n3 < n1: n1, n3 = n3, n1
+        self._freeze(f"Angle_{n1}{vertex.name}{n3}", p1=p1, vertex=vertex, p3=p3)
+
+    def __reduce__(self):
+        return (Angle, (self.p1, self.vertex, self.p3))
 
-    @property
-    def canonical_id(self):
-        names = sorted([self.p1.name, self.p3.name])
-        return f"Angle_{names[0]}{self.vertex.name}{names[1]}"
-    
     def __repr__(self):
         return f"Góc {self.p1.name}{self.vertex.name}{self.p3.name}"
 
 
 class Triangle(Entity):
+    __slots__ = ("p1", "p2", "p3")
+
     def __init__(self, p1, p2, p3):
-        self.p1 = p1
-        self.p2 = p2
-        self.p3 = p3
+        names = sorted([p1.name, p2.name, p3.name])
+        self._freeze(f"Tri_{names[0]}{names[1]}{names[2]}", p1=p1, p2=p2, p3=p3)
+
+    def __reduce__(self):
+        return (Triangle, (self.p1, self.p2, self.p3))
 
-    @property
-    def canonical_id(self):
-        names = sorted([self.p1.name, self.p2.name, self.p3.name])
-        return f"Tri_{names[0]}{names[1]}{names[2]}"
-    
     def __repr__(self):
         return f"Tam giác {self.p1.name}{self.p2.name}{self.p3.name}"
 
 class Quadrilateral(Entity):
+    __slots__ = ("points",)
+
     def __init__(self, p1, p2, p3, p4):
-        self.points = [p1, p2, p3, p4]
+        points = (p1, p2, p3, p4)
+        self._freeze(self._min_rotation(points), points=points)
 
-    @property
-    def canonical_id(self):
+    @staticmethod
+    def _min_rotation(points):
         """
         Tìm ra cái tên 'nhỏ nhất' để làm ID duy nhất trong Database.
         Máy cần biết ADHE và HEDA là một hình duy nhất.
         """
-        names = [p.name for p in self.points]
+        names = [p.name for p in points]
         n = len(names)
         candidates = []
-        
+
         # 1. Xoay vòng
         for i in range(n):
             rotated = names[i:] + names[:i]
             candidates.append("".join(rotated))
-            
+
         # 2. Đảo chiều
         reversed_names = names[::-1]
         for i in range(n):
             rotated_rev = reversed_names[i:] + reversed_names[:i]
             candidates.append("".join(rotated_rev))
-            
+
         # Trả về ID theo alphabet
         return f"Quad_{min(candidates)}"
-    
+
+    def __reduce__(self):
+        return (Quadrilateral, self.points)
+
     def __repr__(self):
         """
         Hiển thị đúng thứ tự gốc mà người dùng (hoặc LLM) đã nhập.
         """
         names = "".join([p.name for p in self.points])
-        return f"Tứ giác {names}"
\ No newline at end of file
+        return f"Tứ giác {names}"
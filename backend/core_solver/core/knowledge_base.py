@@ -1,18 +1,44 @@
+import sys
+import itertools
 import networkx as nx
+from core_solver.core.disjoint_set import DisjointSet
+from core_solver.core.entities import Point, Segment, Angle
+from core_solver.utils import tracing
+from core_solver.utils.geometry_utils import value_key
+
+_trace = tracing.get_tracer("kb")
+
+class FactSource:
+    """Một cách chứng minh của Fact: lý do + các Fact cha."""
+    __slots__ = ("reason", "parents")
+
+    def __init__(self, reason, parents):
+        self.reason = reason
+        self.parents = parents
+
+    def __repr__(self):
+        return f"FactSource({self.reason!r}, {len(self.parents)} parents)"
+
 
 class Fact:
     """
     Đại diện cho một đơn vị tri thức.
     Hỗ trợ nhiều cách giải và tương thích ngược.
+    - id: số nguyên do KnowledgeGraph cấp (tăng dần theo thứ tự tạo).
+    - key: tuple (type, entity ids, value) đã intern, dùng để khử trùng lặp.
+    - Các thuộc tính mở rộng là tập cố định (OPTIONAL_FIELDS), chưa gán thì chưa tồn tại.
     """
-    def __init__(self, type_name, entities, value=None, reason=None, parents=None, **kwargs):
+    OPTIONAL_FIELDS = ("subtype", "vertex", "center", "lines", "point", "points1", "points2", "properties")
+    __slots__ = ("id", "key", "type", "entities", "value", "sources", "_hash") + OPTIONAL_FIELDS
+
+    def __init__(self, type_name, entities, value=None, reason=None, parents=None, fact_id=None, key=None, **kwargs):
         self.type = type_name
         self.entities = entities   
         self.value = value
         
-        entity_str = ",".join(self.entities)
-        val_str = str(self.value) if self.value is not None else "None"
-        self.id = f"{type_name}:{entity_str}:{val_str}"
+        self.key = key if key is not None else make_fact_key(type_name, entities, value)
+        self._hash = hash(self.key)
+        self.id = fact_id
 
         self.sources = [] 
         if reason:
@@ -25,43 +51,319 @@ class Fact:
     @property
     def parents(self):
         """Trả về parents của cách giải đầu tiên (Primary Source)."""
-        return self.sources[0]['parents'] if self.sources else []
+        return self.sources[0].parents if self.sources else []
 
     @property
     def reason(self):
         """Trả về reason của cách giải đầu tiên."""
-        return self.sources[0]['reason'] if self.sources else ""
+        return self.sources[0].reason if self.sources else ""
 
     def __eq__(self, other):
-        return isinstance(other, Fact) and self.id == other.id
+        return self is other or (isinstance(other, Fact) and self.key == other.key)
 
     def __hash__(self):
-        return hash(self.id)
+        return self._hash
     
     def __repr__(self):
         return f"Fact({self.type}, {self.entities}, {self.value})"
 
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__ if k != "_hash" and hasattr(self, k)}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        self._hash = hash(self.key) # Hash chuỗi khác nhau giữa các tiến trình => tính lại
+
+    def copy(self):
+        """Bản sao nông (danh sách sources riêng) dùng khi KB fork cần sửa Fact dùng chung."""
+        clone = object.__new__(Fact)
+        for k in self.__slots__:
+            if hasattr(self, k): setattr(clone, k, getattr(self, k))
+        clone.sources = list(self.sources)
+        return clone
+
     def add_source(self, reason, parents):
         """Thêm một cách chứng minh mới."""
         for s in self.sources:
-            if s["reason"] == reason: 
-                print(f"DEBUG_KB: KHÔNG thêm source '{reason}' cho fact {self.id} vì ĐÃ TỒN TẠI.")
+            if s.reason == reason: 
+                if _trace.is_debug:
+                    _trace.debug("source_exists", f"KHÔNG thêm source '{reason}' cho fact {self.id} vì ĐÃ TỒN TẠI.",
+                                 fact=self.id, reason=reason)
                 return False
         
-        print(f"DEBUG_KB: Đã thêm source MỚI '{reason}' cho fact {self.id}.")
+        if _trace.is_debug:
+            _trace.debug("source_added", f"Đã thêm source MỚI '{reason}' cho fact {self.id}.", fact=self.id, reason=reason)
         
-        self.sources.append({
-            "reason": reason,
-            "parents": parents if parents else []
-        })
+        self.sources.append(FactSource(reason, parents if parents else []))
         return True
 
+
+class Delta:
+    """
+    Phần tri thức thay đổi kể từ một mốc (marker) của KnowledgeGraph:
+    - facts: Fact mới tạo hoặc vừa được cập nhật (thêm source / bổ sung thuộc tính), không trùng lặp.
+    - objects: canonical_id của các đối tượng mới đăng ký vào id_map.
+    Dùng cho suy diễn semi-naive: luật chỉ cần xét các tổ hợp có ít nhất một Fact mới.
+    """
+    __slots__ = ("facts", "objects", "by_type")
+
+    def __init__(self, facts, objects):
+        self.facts = list(dict.fromkeys(facts))
+        self.objects = objects
+        self.by_type = {}
+        for f in self.facts:
+            self.by_type.setdefault(f.type, []).append(f)
+
+    def __bool__(self):
+        return bool(self.facts or self.objects)
+
+    def of_type(self, type_name):
+        return self.by_type.get(type_name, [])
+
+    def has(self, *type_names):
+        return any(t in self.by_type for t in type_names)
+
+
+class JournalEntry:
+    """
+    Một thao tác ghi lên KnowledgeGraph: op là tên phương thức (OP_*), args chỉ gồm dữ liệu thuần
+    (đối tượng hình học, chuỗi, số, khóa Fact) để gửi được sang tiến trình khác / phát lại trên KB khác.
+    rule / round: luật và vòng suy diễn gây ra thao tác (None / 0 nếu từ đề bài).
+    """
+    __slots__ = ("op", "args", "rule", "round")
+
+    def __init__(self, op, args, rule=None, round=0):
+        self.op = op
+        self.args = args
+        self.rule = rule
+        self.round = round
+
+    def __repr__(self):
+        return f"JournalEntry({self.op}, {self.rule}, round {self.round})"
+
+
+class JournalDelta:
+    """Các thao tác của nhật ký kể từ một mốc (KnowledgeGraph.diff), phát lại bằng KnowledgeGraph.apply."""
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def of_round(self, round):
+        return [e for e in self.entries if e.round == round]
+
+    def of_rule(self, rule):
+        return [e for e in self.entries if e.rule == rule]
+
+
+def make_fact_key(type_name, entity_ids, value=None):
+    """Khóa khử trùng lặp của Fact: các chuỗi được intern để so sánh/hash nhanh."""
+    return (sys.intern(type_name), tuple(sys.intern(e) for e in entity_ids), value)
+
+
+# Các thao tác trong nhật ký (JournalEntry.op)
+OP_REGISTER = "register_object"    # (đối tượng,)
+OP_ADD_PROPERTY = "add_property"   # (type, entity ids, value, reason, [khóa cha], {thuộc tính mở rộng})
+OP_ADD_SOURCE = "add_source"       # (khóa Fact, reason, [khóa cha])
+OP_UPDATE = "update_fact"          # (khóa Fact, {thuộc tính: giá trị})
+OP_ADD_EQUALITY = "add_equality"   # (id1, id2, reason, [khóa cha], subtype)
+
+
+def _parent_keys(parents):
+    return [p.key for p in parents] if parents else []
+
+
+def _copy_nested(table):
+    return {k: v.copy() for k, v in table.items()}
+
+
+# Các loại Fact cho biết điểm thẳng hàng / điểm nằm giữa (dựng đường thẳng và tia)
+LINE_TYPES = ("INTERSECTION", "POINT_ON_LINE", "ALTITUDE", "MIDPOINT")
+
+
+# Các bảng của KnowledgeGraph được dùng chung giữa KB cha và các fork, chỉ chép khi bị sửa lần đầu
+_COW_COPIERS = {
+    "facts": dict,
+    "id_map": dict,
+    "_fact_log": list,
+    "_object_log": list,
+    "_journal": list,
+    "_type_versions": dict,
+    "equality_graph": nx.Graph.copy,
+    "equality_classes": DisjointSet.copy,
+    "_angle_values": dict,
+    "_length_values": dict,
+    "_entity_values": dict,
+    "_value_reps": dict,
+    "point_ids": dict,
+    "point_names": list,
+    "_fact_masks": dict,
+    "_segments_at": _copy_nested,
+    "lines": dict,
+    "_lines_at": _copy_nested,
+    "rays": DisjointSet.copy,
+    "_ray_angles": _copy_nested,
+}
+
+
 class KnowledgeGraph:
     def __init__(self):
         self.facts = {} # Dict {id: Fact}
         self.properties = {}
         self.id_map = {}
+        self._fact_ids = itertools.count(1)
+        # Nhật ký thay đổi (chỉ thêm vào cuối) phục vụ Delta / suy diễn semi-naive
+        self._fact_log = []
+        self._object_log = []
+        # Nhật ký thao tác (JournalEntry) kèm luật / vòng gây ra, phục vụ diff() / apply()
+        self._journal = []
+        self.cause_rule = None  # Luật đang chạy (do InferenceEngine gắn vào)
+        self.cause_round = 0    # Số thứ tự vòng suy diễn hiện tại
+        # Phiên bản theo loại Fact (tăng mỗi khi có Fact mới / cập nhật), dùng để bỏ qua luật không có đầu vào mới.
+        # Hai loại giả: "POINT" (điểm mới đăng ký) và "OBJECT" (đối tượng khác mới đăng ký).
+        self._type_versions = {}
+        # Các hàm listener(fact, is_new) được gọi mỗi khi có Fact mới / Fact được cập nhật (VD: mạng Rete)
+        self._listeners = []
+        self.rete = None # ReteNetwork so khớp các PatternRule trên KB này (do InferenceEngine tạo)
+        self.source_count = 0 # Tổng số source (cách chứng minh) của mọi Fact
+        # Ngân sách của lần suy diễn đang chạy (Budget), do InferenceEngine gắn vào
+        self.budget = None
         self.equality_graph = nx.Graph()
+        # Lớp tương đương (Union-Find) song song với equality_graph.
+        # equality_graph chỉ còn dùng để lấy lý do cạnh & dựng lời giải thích bắc cầu.
+        self.equality_classes = DisjointSet()
+
+        # Chỉ mục tra cứu nhanh cho Fact VALUE (tránh quét toàn bộ danh sách)
+        self._angle_values = {}   # {angle canonical_id: Fact}
+        self._length_values = {}  # {frozenset(tên 2 đầu mút): Fact}
+        self._entity_values = {}  # {entity id: Fact} - mọi subtype, chỉ Fact có giá trị
+        self._value_reps = {}     # {value_key(giá trị): Fact VALUE của góc đại diện} - lớp góc theo giá trị
+        # Đoạn thẳng thuộc lớp tương đương theo đầu mút: {điểm O: {điểm X: id đoạn OX}}
+        self._segments_at = {}
+
+        # Đường thẳng & tia (dựng từ các Fact LINE_TYPES)
+        self.lines = {}           # {id đường: frozenset tên điểm} - tập điểm thẳng hàng tối đại
+        self._lines_at = {}       # {tên điểm: {id đường}}
+        self.rays = DisjointSet() # Phần tử (đỉnh, điểm); cùng lớp <=> các điểm nằm trên cùng một tia gốc đỉnh
+        self._ray_angles = {}     # {đỉnh: {frozenset(lớp tia 2 cạnh): Angle đại diện}} - góc theo cặp tia
+        self.line_version = 0     # Tăng mỗi khi đường thẳng / tia thay đổi (điều kiện "tia không trùng" bị đổi)
+
+        # Id nguyên liên tiếp cho điểm: tập điểm được biểu diễn bằng bitmask (bit i = điểm point_names[i])
+        self.point_ids = {}    # {tên điểm: id}
+        self.point_names = []  # [tên điểm] theo id
+        self._fact_masks = {}  # {khóa Fact: bitmask các điểm trong entities} (tính khi cần)
+
+        # Copy-on-write giữa KB cha và các fork (xem fork())
+        self._shared = set()        # Tên các bảng (_COW_COPIERS) đang dùng chung
+        self._shared_types = set()  # Các danh sách properties[type] đang dùng chung
+        self._fork_watermark = 0    # Fact có id <= mốc này có thể đang dùng chung
+        self._owned = set()         # key của các Fact dùng chung đã được chép riêng
+        self._fork_marker = None    # marker() lúc được tạo bằng fork()
+
+    def __getstate__(self):
+        """Pickle (gửi sang tiến trình khác): bỏ các phần gắn với lần chạy hiện tại (listener, mạng Rete, ngân sách)."""
+        state = self.__dict__.copy()
+        state["_fact_ids"] = max((f.id for f in self.facts.values()), default=0) + 1
+        state["_listeners"] = []
+        state["rete"] = None
+        state["budget"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fact_ids = itertools.count(state["_fact_ids"])
+
+    # ==========================================================================
+    # FORK / MERGE (COPY-ON-WRITE)
+    # ==========================================================================
+    def fork(self):
+        """
+        KB con copy-on-write: dùng chung Fact, id_map, cấu trúc bằng nhau... với KB này,
+        bảng nào bị sửa (ở con hoặc ở cha) mới được chép riêng; Fact dùng chung được chép khi bị sửa.
+        Con chỉ ghi nhận phần thêm của nó (delta_since(child._fork_marker)), gộp lại bằng merge().
+        """
+        next_id = next(self._fact_ids)
+        child = object.__new__(KnowledgeGraph)
+        child.__dict__.update(self.__dict__)
+        for kb in (self, child):
+            kb._shared = set(_COW_COPIERS)
+            kb._shared_types = set(self.properties)
+            kb._fork_watermark = next_id - 1
+            kb._owned = set()
+            kb._fact_ids = itertools.count(next_id)
+        child.properties = dict(self.properties)
+        child._listeners = []
+        child.rete = None
+        child.budget = None
+        child._fork_marker = child.marker()
+        return child
+
+    def merge(self, other, marker=None, fact_map=None):
+        """
+        Gộp tri thức other thêm vào kể từ marker (mặc định: lúc other được fork) vào KB này.
+        fact_map: {Fact của other: Fact của KB này} đã biết; trả về fact_map đã bổ sung.
+        """
+        if marker is None: marker = other._fork_marker or (0, 0, 0)
+        fact_map = {} if fact_map is None else fact_map
+        delta = other.delta_since(marker)
+        for oid in delta.objects:
+            self.register_object(other.id_map[oid])
+        for f in delta.facts:
+            self.import_fact(other, f, fact_map)
+        return fact_map
+
+    def _cow(self, name):
+        """Chép riêng bảng name trước khi sửa nếu đang dùng chung với KB khác."""
+        if name in self._shared:
+            self._shared.discard(name)
+            setattr(self, name, _COW_COPIERS[name](getattr(self, name)))
+
+    def _own_list(self, type_name):
+        """Danh sách properties[type_name] riêng của KB này (tạo mới / chép nếu đang dùng chung)."""
+        lst = self.properties.get(type_name)
+        if lst is None:
+            lst = self.properties[type_name] = []
+        elif type_name in self._shared_types:
+            self._shared_types.discard(type_name)
+            lst = self.properties[type_name] = list(lst)
+        return lst
+
+    def _own_fact(self, fact):
+        """Fact riêng của KB này để sửa: Fact có từ trước lần fork được chép và thay vào mọi bảng/chỉ mục."""
+        if fact.id is None or fact.id > self._fork_watermark or fact.key in self._owned: return fact
+        clone = fact.copy()
+        self._owned.add(fact.key)
+        self._cow("facts")
+        self.facts[fact.key] = clone
+        lst = self._own_list(fact.type)
+        for i, f in enumerate(lst):
+            if f is fact:
+                lst[i] = clone; break
+
+        for name in ("_angle_values", "_entity_values"):
+            for eid in fact.entities:
+                if getattr(self, name).get(eid) is fact:
+                    self._cow(name)
+                    getattr(self, name)[eid] = clone
+        if fact.value is not None and self._value_reps.get(value_key(fact.value)) is fact:
+            self._cow("_value_reps")
+            self._value_reps[value_key(fact.value)] = clone
+        key = self._length_key(fact.entities)
+        if key is not None and self._length_values.get(key) is fact:
+            self._cow("_length_values")
+            self._length_values[key] = clone
+        for eid in fact.entities:
+            if self.equality_classes.get(eid, "angle_value") is fact:
+                self._cow("equality_classes")
+                self.equality_classes.data[self.equality_classes.find(eid)]["angle_value"] = clone
+        return clone
 
     def register_object(self, obj):
         """
@@ -71,8 +373,15 @@ class KnowledgeGraph:
         """
         if hasattr(obj, 'canonical_id'):
             # 1. Đăng ký chính đối tượng (ví dụ: Đoạn OA)
-            if obj.canonical_id not in self.id_map:
-                self.id_map[obj.canonical_id] = obj
+            # Đã có thì các điểm thành phần cũng đã được đăng ký từ trước.
+            if obj.canonical_id in self.id_map: return
+            self._cow("id_map"); self._cow("_object_log")
+            self.id_map[obj.canonical_id] = obj
+            self._object_log.append(obj.canonical_id)
+            self._journal_op(OP_REGISTER, (obj,))
+            if isinstance(obj, Point): self.point_id(obj.name)
+            elif isinstance(obj, Angle): self._index_angle(obj)
+            self._bump("POINT" if isinstance(obj, Point) else "OBJECT")
 
             # 2. Đăng ký các điểm thành phần (ví dụ: Điểm O, Điểm A)
             if hasattr(obj, "p1") and obj.p1: self.register_object(obj.p1)
@@ -82,46 +391,366 @@ class KnowledgeGraph:
             if hasattr(obj, "points"): 
                 for p in obj.points: self.register_object(p)
 
+    # ==========================================================================
+    # ID ĐIỂM / BITMASK
+    # ==========================================================================
+    def point_id(self, name):
+        """Id nguyên của điểm (cấp mới nếu chưa có)."""
+        pid = self.point_ids.get(name)
+        if pid is None:
+            self._cow("point_ids"); self._cow("point_names")
+            pid = self.point_ids[name] = len(self.point_names)
+            self.point_names.append(name)
+        return pid
+
+    def point_mask(self, names):
+        """Bitmask của tập điểm: tập con / giao / bằng nhau trở thành phép toán trên số nguyên."""
+        mask = 0
+        ids = self.point_ids
+        for name in names:
+            pid = ids.get(name)
+            mask |= 1 << (pid if pid is not None else self.point_id(name))
+        return mask
+
+    def fact_mask(self, fact):
+        """Bitmask các điểm trong fact.entities (lưu lại theo khóa Fact)."""
+        mask = self._fact_masks.get(fact.key)
+        if mask is None:
+            mask = self.point_mask(fact.entities)
+            self._cow("_fact_masks")
+            self._fact_masks[fact.key] = mask
+        return mask
+
+    def mask_names(self, mask):
+        """Tên các điểm trong bitmask (theo thứ tự id)."""
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.point_names[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    # ==========================================================================
+    # ĐƯỜNG THẲNG / TIA
+    # ==========================================================================
+    def _index_lines(self, fact):
+        """Cập nhật đường thẳng và tia từ Fact LINE_TYPES (gọi lại khi Fact được bổ sung thuộc tính)."""
+        e = fact.entities
+        collinear, spans = [], [] # spans: (A, M, B) với M nằm giữa A và B
+        if fact.type == "MIDPOINT" and len(e) == 3:
+            spans.append((e[1], e[0], e[2]))
+        elif fact.type == "POINT_ON_LINE" and len(e) == 3: # [đầu mút, điểm nằm giữa, đầu mút]
+            spans.append((e[0], e[1], e[2]))
+        elif fact.type == "ALTITUDE" and len(e) == 4: # [đỉnh, chân, đáy 1, đáy 2]: chỉ biết thẳng hàng
+            collinear += [e[:2], e[1:]]
+        elif fact.type == "INTERSECTION" and e:
+            point = getattr(fact, "point", None) or e[0]
+            segments = getattr(fact, "lines", None) or [e[i:i + 2] for i in range(1, len(e) - 1, 2)]
+            for seg in segments:
+                if len(seg) < 2: continue
+                if point in seg: collinear.append(seg)
+                else: spans.append((seg[0], point, seg[-1])) # Giao điểm nằm trên các đoạn đã cho
+
+        for names in collinear + spans:
+            if self._add_line(names): self.line_version += 1
+        for a, m, b in spans:
+            for vertex, other in ((a, b), (b, a)):
+                if self.rays.find((vertex, m)) != self.rays.find((vertex, other)):
+                    self._cow("rays")
+                    self.rays.union((vertex, m), (vertex, other))
+                    self.line_version += 1
+                    self._rekey_angles(vertex, fact)
+
+    def _add_line(self, names):
+        """Thêm tập điểm thẳng hàng; các đường chung >= 2 điểm với nó được gộp thành một. Trả về True nếu có thay đổi."""
+        points = frozenset(names)
+        if len(points) < 2: return False
+        same = set()
+        while True: # Gộp lan truyền: đường vừa gộp có thể chung 2 điểm với đường khác
+            found = {lid for n in points for lid in self._lines_at.get(n, ())
+                     if lid not in same and len(self.lines[lid] & points) >= 2}
+            if not found: break
+            same |= found
+            points = points.union(*(self.lines[lid] for lid in found))
+        if len(same) == 1 and self.lines[min(same)] == points: return False # Đã biết
+
+        self._cow("lines"); self._cow("_lines_at")
+        for lid in same:
+            for n in self.lines.pop(lid): self._lines_at[n].discard(lid)
+        lid = min(same) if same else max(self.lines, default=-1) + 1
+        self.lines[lid] = points
+        for n in points: self._lines_at.setdefault(n, set()).add(lid)
+        return True
+
+    def collinear(self, names):
+        """Các điểm names cùng nằm trên một đường thẳng đã biết."""
+        names = set(names)
+        if len(names) <= 2: return True
+        first = next(iter(names))
+        return any(names <= self.lines[lid] for lid in self._lines_at.get(first, ()))
+
+    def same_ray(self, vertex, p1, p2):
+        """Tia vertex->p1 và vertex->p2 trùng nhau (O(1) qua lớp tia)."""
+        if p1 == p2: return True
+        rays = self.rays
+        return (vertex, p1) in rays and rays.find((vertex, p1)) == rays.find((vertex, p2))
+
+    def _ray_pair(self, angle):
+        v = angle.vertex.name
+        return frozenset((self.rays.find((v, angle.p1.name)), self.rays.find((v, angle.p3.name))))
+
+    def canonical_angle(self, angle):
+        """Góc đại diện của các góc có cùng hai tia (VD: H thuộc tia EC => ∠BEH và ∠BEC là một)."""
+        v = angle.vertex.name
+        rays = self.rays
+        if (v, angle.p1.name) not in rays and (v, angle.p3.name) not in rays: return angle
+        table = self._ray_angles.get(v)
+        if not table: return angle
+        rep = table.get(self._ray_pair(angle))
+        return rep if rep is not None else angle
+
+    def _index_angle(self, angle):
+        """Ghi góc mới đăng ký vào bảng góc theo cặp tia của đỉnh."""
+        v = angle.vertex.name
+        pair = self._ray_pair(angle)
+        if pair in self._ray_angles.get(v, ()): return
+        self._cow("_ray_angles")
+        self._ray_angles.setdefault(v, {})[pair] = angle
+
+    def _rekey_angles(self, vertex, fact):
+        """Hai tia tại vertex vừa gộp: dựng lại bảng góc của đỉnh, góc trở nên trùng nhau được nối bằng nhau."""
+        table = self._ray_angles.get(vertex)
+        if not table: return
+        self._cow("_ray_angles")
+        rekeyed = {}
+        for angle in table.values():
+            pair = self._ray_pair(angle)
+            rep = rekeyed.get(pair)
+            if rep is None:
+                rekeyed[pair] = angle
+            elif not self.equality_graph.has_edge(rep.canonical_id, angle.canonical_id):
+                reason = f"∠{angle.p1.name}{vertex}{angle.p3.name} và ∠{rep.p1.name}{vertex}{rep.p3.name} có chung hai tia"
+                self._add_equality_edge(rep, angle, reason, [fact])
+        self._ray_angles[vertex] = rekeyed
+
     def add_property(self, type_name, entities, reason="Given", value=None, parents=None, **kwargs):
         entity_ids = []
         for e in entities:
+            if type_name == "VALUE" and isinstance(e, Angle): e = self.canonical_angle(e)
             if hasattr(e, 'canonical_id'):
                 self.register_object(e)
                 entity_ids.append(e.canonical_id)
             else:
                 entity_ids.append(str(e))
                 
-        # Tạo ID tạm
-        temp_val = str(value) if value is not None else "None"
-        fact_id = f"{type_name}:{','.join(entity_ids)}:{temp_val}"
+        key = make_fact_key(type_name, entity_ids, value)
         
         # Nếu Fact đã tồn tại -> Thêm source mới
-        if fact_id in self.facts:
-            existing_fact = self.facts[fact_id]
+        existing_fact = self.facts.get(key)
+        if existing_fact is not None:
+            if self._fork_watermark and self._would_change(existing_fact, reason, kwargs):
+                existing_fact = self._own_fact(existing_fact)
+            updated = False
+            filled = {}
             for k, v in kwargs.items():
                 if not hasattr(existing_fact, k) or getattr(existing_fact, k) is None:
                     setattr(existing_fact, k, v)
-            return existing_fact.add_source(reason, parents)
+                    filled[k] = v
+                    updated = updated or v is not None
+            if filled: self._journal_op(OP_UPDATE, (key, filled))
+            if type_name == "VALUE": self._index_value(existing_fact)
+            if filled and type_name in LINE_TYPES: self._index_lines(existing_fact)
+            added = existing_fact.add_source(reason, parents)
+            if added:
+                self.source_count += 1
+                self._journal_op(OP_ADD_SOURCE, (key, reason, _parent_keys(parents)))
+            if added or updated: self._log_fact(existing_fact)
+            return added
             
         # Nếu chưa -> Tạo mới
-        new_fact = Fact(type_name, entity_ids, value, reason, parents, **kwargs)
-        self.facts[fact_id] = new_fact
-        
-        if type_name not in self.properties:
-            self.properties[type_name] = []
-        self.properties[type_name].append(new_fact)
+        new_fact = self._store(Fact(type_name, entity_ids, value, reason, parents,
+                                    fact_id=next(self._fact_ids), key=key, **kwargs))
+        self._journal_op(OP_ADD_PROPERTY, (type_name, key[1], value, reason, _parent_keys(parents), kwargs))
+        if type_name == "VALUE": self._index_value(new_fact)
+        if type_name in LINE_TYPES: self._index_lines(new_fact)
         
         return True
 
-    def _find_value_fact(self, angle_obj):
-        aid = angle_obj.canonical_id
-        if "VALUE" in self.properties:
-            for f in self.properties["VALUE"]:
-                if getattr(f, 'subtype', None) == "angle" and aid in f.entities:
-                    return f
+    @staticmethod
+    def _would_change(fact, reason, fields):
+        """add_property có sửa Fact đã có không (source mới hoặc bổ sung thuộc tính)."""
+        if all(s.reason != reason for s in fact.sources): return True
+        return any(v is not None and getattr(fact, k, None) is None for k, v in fields.items())
+
+    def _store(self, fact):
+        """Lưu Fact mới vào bảng facts và danh sách theo loại."""
+        self._cow("facts")
+        self.facts[fact.key] = fact
+        self._own_list(fact.type).append(fact)
+        self.source_count += len(fact.sources)
+        self._log_fact(fact, is_new=True)
+        return fact
+
+    def update_fact(self, fact, **fields):
+        """
+        Cập nhật thuộc tính của Fact đã có (VD: nâng cấp subtype tứ giác)
+        và ghi nhận thay đổi để các luật semi-naive nhìn thấy.
+        Trả về Fact đã cập nhật (trên KB fork có thể là bản chép riêng của fact).
+        """
+        fact = self._own_fact(fact)
+        for k, v in fields.items():
+            setattr(fact, k, v)
+        if "entities" in fields and fact.key in self._fact_masks:
+            self._cow("_fact_masks")
+            del self._fact_masks[fact.key]
+        self._journal_op(OP_UPDATE, (fact.key, dict(fields)))
+        self._log_fact(fact)
+        if fact.type in LINE_TYPES: self._index_lines(fact)
+        return fact
+
+    def _log_fact(self, fact, is_new=False):
+        self._cow("_fact_log")
+        self._fact_log.append(fact)
+        self._bump(fact.type)
+        for listener in self._listeners:
+            listener(fact, is_new)
+
+    def subscribe(self, listener):
+        """Đăng ký listener(fact, is_new) nhận thông báo mỗi khi có Fact mới (is_new=True) hoặc được cập nhật."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners: self._listeners.remove(listener)
+
+    def _bump(self, type_name):
+        self._cow("_type_versions")
+        self._type_versions[type_name] = self._type_versions.get(type_name, 0) + 1
+
+    def versions(self, type_names):
+        """Bộ phiên bản của các loại Fact: không đổi <=> không có gì mới thuộc các loại này."""
+        return tuple(self._type_versions.get(t, 0) for t in type_names)
+
+    def type_versions(self):
+        """Bản sao phiên bản của mọi loại Fact (so sánh hai bản sao để biết loại nào đã thay đổi)."""
+        return dict(self._type_versions)
+
+    def check_budget(self):
+        """Luật gọi trong các vòng lặp dài: ném BudgetExceeded nếu đã hết ngân sách."""
+        if self.budget is not None: self.budget.check(self)
+
+    def marker(self):
+        """Mốc hiện tại của nhật ký thay đổi."""
+        return (len(self._fact_log), len(self._object_log), len(self._journal))
+
+    def delta_since(self, marker):
+        """Các thay đổi kể từ mốc marker (xem Delta)."""
+        n_facts, n_objects = marker[:2]
+        return Delta(self._fact_log[n_facts:], self._object_log[n_objects:])
+
+    # ==========================================================================
+    # NHẬT KÝ THAO TÁC (DIFF / APPLY)
+    # ==========================================================================
+    def _journal_op(self, op, args):
+        self._cow("_journal")
+        self._journal.append(JournalEntry(op, args, self.cause_rule, self.cause_round))
+
+    def diff(self, since_marker=None):
+        """Các thao tác kể từ mốc since_marker (mặc định: toàn bộ nhật ký)."""
+        start = since_marker[2] if since_marker is not None else 0
+        return JournalDelta(self._journal[start:])
+
+    def apply(self, delta):
+        """
+        Phát lại các thao tác (JournalDelta / danh sách JournalEntry) lên KB này, giữ nguyên luật / vòng gốc.
+        Fact cha được tìm theo khóa; thao tác đã có hiệu lực (Fact / source / cạnh đã tồn tại) tự được bỏ qua.
+        """
+        saved = self.cause_rule, self.cause_round
+        try:
+            for entry in delta:
+                self.cause_rule, self.cause_round = entry.rule, entry.round
+                self._replay(entry.op, entry.args)
+        finally:
+            self.cause_rule, self.cause_round = saved
+
+    def _replay(self, op, args):
+        if op == OP_REGISTER:
+            self.register_object(args[0])
+        elif op == OP_ADD_PROPERTY:
+            type_name, entity_ids, value, reason, parents, fields = args
+            self.add_property(type_name, self._objects(entity_ids), reason, value=value,
+                              parents=self._facts_by_key(parents), **fields)
+        elif op == OP_ADD_SOURCE:
+            key, reason, parents = args
+            fact = self.facts[key]
+            self.add_property(fact.type, self._objects(key[1]), reason, value=key[2], parents=self._facts_by_key(parents))
+        elif op == OP_UPDATE:
+            key, fields = args
+            self.update_fact(self.facts[key], **fields)
+        elif op == OP_ADD_EQUALITY:
+            id1, id2, reason, parents, subtype = args
+            self.add_equality(self.id_map[id1], self.id_map[id2], reason, self._facts_by_key(parents), subtype)
+        else:
+            raise ValueError(f"Thao tác nhật ký không hợp lệ: {op}")
+
+    def _objects(self, entity_ids):
+        return [self.id_map.get(e, e) for e in entity_ids]
+
+    def _facts_by_key(self, keys):
+        return [self.facts[k] for k in keys]
+
+    def _index_value(self, fact):
+        """
+        Cập nhật chỉ mục cho Fact VALUE.
+        Giữ Fact xuất hiện đầu tiên (giống thứ tự duyệt danh sách trước đây).
+        Subtype có thể được bổ sung sau khi tạo Fact nên hàm này được gọi lại mỗi lần cập nhật.
+        """
+        if fact.value is not None:
+            self._cow("_entity_values")
+            for eid in fact.entities:
+                self._entity_values.setdefault(eid, fact)
+            # Góc đầu tiên mang giá trị này làm đại diện cho lớp các góc cùng giá trị
+            vkey = value_key(fact.value)
+            if vkey not in self._value_reps and fact.entities and isinstance(self.id_map.get(fact.entities[0]), Angle):
+                self._cow("_value_reps")
+                self._value_reps[vkey] = fact
+
+        subtype = getattr(fact, 'subtype', None)
+        if subtype == "angle":
+            self._cow("_angle_values"); self._cow("equality_classes")
+            for eid in fact.entities:
+                self._angle_values.setdefault(eid, fact)
+                self.equality_classes.setdefault(eid, "angle_value", fact)
+        elif subtype == "length":
+            key = self._length_key(fact.entities)
+            if key is not None:
+                self._cow("_length_values")
+                self._length_values.setdefault(key, fact)
+
+    def _length_key(self, entity_ids):
+        """Khóa không thứ tự của đoạn thẳng: chấp nhận [P1, P2] hoặc [Seg_P1P2]."""
+        if len(entity_ids) == 2:
+            return frozenset(entity_ids)
+        if len(entity_ids) == 1:
+            seg = self.id_map.get(entity_ids[0])
+            if hasattr(seg, 'p1') and hasattr(seg, 'p2'):
+                return frozenset((seg.p1.canonical_id, seg.p2.canonical_id))
         return None
 
+    def _find_value_fact(self, angle_obj):
+        return self._angle_values.get(self.canonical_angle(angle_obj).canonical_id)
+
+    def value_representative(self, value):
+        """Fact VALUE của góc đại diện cho các góc có giá trị value (sai khác trong sai số làm tròn)."""
+        return self._value_reps.get(value_key(value))
+
+    def find_value_fact(self, obj):
+        """Fact VALUE (đã có giá trị) đầu tiên nhắc tới đối tượng, bất kể subtype."""
+        if isinstance(obj, Angle): obj = self.canonical_angle(obj)
+        return self._entity_values.get(obj.canonical_id)
+
     def add_equality(self, obj1, obj2, reason="Given", parents=None, subtype=None):
+        if isinstance(obj1, Angle): obj1 = self.canonical_angle(obj1)
+        if isinstance(obj2, Angle): obj2 = self.canonical_angle(obj2)
         id1 = obj1.canonical_id
         id2 = obj2.canonical_id
         
@@ -131,58 +760,136 @@ class KnowledgeGraph:
         if id1 == id2: return False
         
         if self.equality_graph.has_edge(id1, id2): return False
+        self._journal_op(OP_ADD_EQUALITY, (id1, id2, reason, _parent_keys(parents), subtype))
+        return self._add_equality_edge(obj1, obj2, reason, parents, subtype)
+
+    def _add_equality_edge(self, obj1, obj2, reason, parents, subtype=None):
+        """Thêm cạnh bằng nhau (đã đăng ký, khác nhau, chưa có cạnh) cùng Fact EQUALITY tương ứng."""
+        id1 = obj1.canonical_id
+        id2 = obj2.canonical_id
+        self._cow("equality_graph"); self._cow("equality_classes")
         self.equality_graph.add_edge(id1, id2, reason=reason, parents=parents if parents else [])
+        self.equality_classes.union(id1, id2)
+        self._index_segment(obj1); self._index_segment(obj2)
 
-        entities = [id1, id2] 
-        fact_id = f"EQUALITY:{id1},{id2}" 
-        
-        new_fact = Fact("EQUALITY", entities, reason=reason, parents=parents, subtype=subtype)
-        
-        if fact_id not in self.facts:
-            self.facts[fact_id] = new_fact
-            if "EQUALITY" not in self.properties:
-                self.properties["EQUALITY"] = []
-            self.properties["EQUALITY"].append(new_fact)
-            return new_fact
+        key = make_fact_key("EQUALITY", (id1, id2))
+        existing_fact = self.facts.get(key)
+        if existing_fact is not None: return existing_fact
         
-        return self.facts[fact_id]
+        return self._store(Fact("EQUALITY", [id1, id2], reason=reason, parents=parents,
+                                fact_id=next(self._fact_ids), key=key, subtype=subtype))
+
+    def import_fact(self, source_kb, fact, fact_map):
+        """
+        Chép Fact (kèm mọi source) từ KB khác, đăng ký các đối tượng nó nhắc tới.
+        fact_map: {Fact nguồn: Fact đích}, dùng để nối lại parents và được cập nhật thêm Fact vừa chép;
+        parent không có trong fact_map được thay bằng Fact cùng khóa của KB này (nếu có).
+        Trả về Fact tương ứng trong KB này.
+        """
+        objs = [source_kb.id_map.get(e, e) for e in fact.entities]
+        extra = {k: getattr(fact, k) for k in Fact.OPTIONAL_FIELDS if hasattr(fact, k)}
+        sources = [(s.reason, [fact_map.get(p) or self.facts.get(p.key, p) for p in s.parents]) for s in fact.sources]
+
+        if fact.type == "EQUALITY" and len(objs) == 2 and all(hasattr(o, "canonical_id") for o in objs) \
+                and not self.equality_graph.has_edge(*fact.entities):
+            # Cạnh bằng nhau (lớp tương đương) đi kèm source đầu tiên
+            reason, parents = sources[0] if sources else ("Given", None)
+            self.add_equality(objs[0], objs[1], reason, parents, subtype=extra.get("subtype"))
+        elif not sources and fact.key not in self.facts:
+            self.add_property(fact.type, objs, None, value=fact.value, **extra)
+
+        for reason, parents in sources: # Source đã có (cùng lý do) tự được bỏ qua
+            self.add_property(fact.type, objs, reason, value=fact.value, parents=parents, **extra)
+        # Fact được mở rộng entities sau khi tạo (VD: điểm trên đường tròn) giữ khóa cũ => tra thêm theo entities hiện tại
+        copied = self.facts.get(fact.key) \
+            or self.facts.get(make_fact_key(fact.type, [getattr(o, "canonical_id", str(o)) for o in objs], fact.value))
+        if copied is not None: fact_map[fact] = copied
+        return copied
+
+    def _index_segment(self, obj):
+        """Ghi đoạn thẳng (vừa vào lớp tương đương) vào chỉ mục theo hai đầu mút."""
+        if not isinstance(obj, Segment): return
+        a, b = obj.p1.name, obj.p2.name
+        if self._segments_at.get(a, {}).get(b) == obj.canonical_id: return
+        self._cow("_segments_at")
+        table = self._segments_at
+        table.setdefault(a, {})[b] = obj.canonical_id
+        table.setdefault(b, {})[a] = obj.canonical_id
+
+    def segment_classes_at(self, center):
+        """Các đoạn center-X theo lớp bằng nhau: {gốc lớp: [X]}."""
+        groups = {}
+        for x, sid in self._segments_at.get(center, {}).items():
+            groups.setdefault(self.equality_classes.find(sid), []).append(x)
+        return groups
+
+    def equidistant_centers(self, names):
+        """
+        Các điểm O (ngoài names) có O-X bằng nhau với mọi X trong names, theo thứ tự đăng ký điểm.
+        Ứng viên là giao các tập đầu mút kề của chỉ mục, sau đó chỉ còn so gốc lớp tương đương.
+        """
+        tables = [self._segments_at.get(n) for n in names]
+        if not tables or not all(tables): return []
+        smallest = min(tables, key=len)
+        find = self.equality_classes.find
+        centers = []
+        for o in smallest:
+            if o in names: continue
+            roots = set()
+            for t in tables:
+                sid = t.get(o)
+                if sid is None: break
+                roots.add(find(sid))
+            else:
+                if len(roots) == 1: centers.append(o)
+        ids = self.point_ids
+        centers.sort(key=lambda o: ids.get(o, len(ids)))
+        return centers
 
     def get_equality_parents(self, obj1, obj2):
+        if isinstance(obj1, Angle): obj1 = self.canonical_angle(obj1)
+        if isinstance(obj2, Angle): obj2 = self.canonical_angle(obj2)
         id1 = obj1.canonical_id
         id2 = obj2.canonical_id
         if self.equality_graph.has_edge(id1, id2):
             return self.equality_graph.get_edge_data(id1, id2).get('parents', [])
         return []
 
-    def check_equality(self, obj1, obj2):
+    def check_equality(self, obj1, obj2, explain=False):
+        """
+        Kiểm tra obj1 = obj2 qua lớp tương đương (gần O(1)).
+        Chuỗi giải thích "Bắc cầu qua" chỉ được dựng khi explain=True.
+        """
+        if isinstance(obj1, Angle): obj1 = self.canonical_angle(obj1)
+        if isinstance(obj2, Angle): obj2 = self.canonical_angle(obj2)
         id1 = obj1.canonical_id; id2 = obj2.canonical_id
         if id1 == id2: return True, "Trùng nhau"
         
-        # Đảm bảo node tồn tại trong graph trước khi check path
-        if self.equality_graph.has_node(id1) and self.equality_graph.has_node(id2):
-            if nx.has_path(self.equality_graph, id1, id2):
-                path = nx.shortest_path(self.equality_graph, id1, id2)
-                return True, f"Bắc cầu qua: {' = '.join(path)}"
+        if id1 in self.equality_classes and id2 in self.equality_classes:
+            if self.equality_classes.find(id1) == self.equality_classes.find(id2):
+                return True, self.explain_equality(obj1, obj2) if explain else ""
         return False, ""
 
+    def explain_equality(self, obj1, obj2):
+        """Dựng lời giải thích bắc cầu (đường đi ngắn nhất trên equality_graph)."""
+        if isinstance(obj1, Angle): obj1 = self.canonical_angle(obj1)
+        if isinstance(obj2, Angle): obj2 = self.canonical_angle(obj2)
+        id1 = obj1.canonical_id; id2 = obj2.canonical_id
+        if id1 == id2: return "Trùng nhau"
+        try:
+            path = nx.shortest_path(self.equality_graph, id1, id2)
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
+            return ""
+        return f"Bắc cầu qua: {' = '.join(path)}"
+
     def get_angle_value(self, angle_obj):
-        aid = angle_obj.canonical_id
-        if "VALUE" in self.properties:
-            for f in self.properties["VALUE"]:
-                if getattr(f, 'subtype', None) == "angle" and aid in f.entities: return f.value
-        if self.equality_graph.has_node(aid):
-            connected = nx.node_connected_component(self.equality_graph, aid)
-            if "VALUE" in self.properties:
-                for f in self.properties["VALUE"]:
-                    if getattr(f, 'subtype', None) == "angle":
-                        for eid in f.entities:
-                            if eid in connected: return f.value
-        return None
+        aid = self.canonical_angle(angle_obj).canonical_id
+        f = self._angle_values.get(aid)
+        if f is None:
+            f = self.equality_classes.get(aid, "angle_value")
+        return f.value if f is not None else None
     
     def get_length_value(self, segment_obj):
-        if "VALUE" in self.properties:
-            for f in self.properties["VALUE"]:
-                if getattr(f, 'subtype', None) == "length":
-                    pts = {segment_obj.p1.canonical_id, segment_obj.p2.canonical_id}
-                    if set(f.entities) == pts: return f.value
-        return None
\ No newline at end of file
+        key = frozenset((segment_obj.p1.canonical_id, segment_obj.p2.canonical_id))
+        f = self._length_values.get(key)
+        return f.value if f is not None else None
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+Tuần tự hóa KnowledgeGraph sang định dạng nhị phân (lưu cache ra đĩa, gửi giữa các tiến trình).
+
+Không pickle đồ thị đối tượng: Fact được tham chiếu bằng số thứ tự (theo id), mọi chuỗi
+(tên điểm, canonical_id, loại Fact, lý do...) nằm trong một bảng chuỗi dùng chung, đối tượng
+hình học được dựng lại từ tên điểm. Bố cục (số nguyên little-endian, u32 = "<I"):
+
+    header   MAGIC, VERSION (u16)
+    strings  n, [độ dài, utf-8]
+    objects  n, [đối tượng]                      - theo thứ tự _object_log
+    facts    n, [id, type, entities, value, key, [(trường, giá trị)]]  - theo thứ tự id
+    sources  với mỗi Fact: n, [(lý do, [Fact cha])]
+    log      n, [Fact]                            - _fact_log
+    journal  n, [(op, args, rule, round)]         - nhật ký thao tác (JournalEntry)
+    edges    n, [(id1, id2, lý do, [Fact cha])]   - equality_graph
+    state    các giá trị còn lại (union-find, chỉ mục VALUE, phiên bản, đường thẳng / tia, id điểm, bộ đếm)
+
+Giá trị tổng quát được ghi kèm thẻ 1 byte (_TAG_*). Định dạng đổi => tăng VERSION.
+"""
+import itertools
+import struct
+import sys
+import networkx as nx
+from core_solver.core.entities import Entity, Point, Segment, Angle, Triangle, Quadrilateral
+from core_solver.core.knowledge_base import KnowledgeGraph, Fact, FactSource, JournalEntry, make_fact_key
+
+MAGIC = b"GKB\x00"
+VERSION = 5
+
+_HEADER = struct.Struct("<4sH")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE, _TAG_INT, _TAG_FLOAT, _TAG_STR, _TAG_LIST, _TAG_TUPLE, \
+    _TAG_DICT, _TAG_FROZENSET, _TAG_FACT, _TAG_ENTITY, _TAG_OBJECT, _TAG_KEY = range(14)
+
+# Lớp đối tượng hình học theo tên (đối tượng được dựng lại bằng __reduce__ của nó)
+_ENTITY_TYPES = {cls.__name__: cls for cls in (Point, Segment, Angle, Triangle, Quadrilateral)}
+
+# Các trường của KnowledgeGraph được ghi ở phần state (theo thứ tự)
+_STATE_FIELDS = ("_angle_values", "_length_values", "_entity_values", "_value_reps", "_type_versions",
+                 "lines", "_ray_angles")
+
+
+class FormatError(ValueError):
+    """Dữ liệu không phải KB đã tuần tự hóa, hoặc khác phiên bản định dạng."""
+
+
+# ==============================================================================
+# GHI
+# ==============================================================================
+class _Writer:
+    def __init__(self, kb):
+        self.kb = kb
+        self.body = bytearray()
+        self.strings = {}  # {chuỗi: chỉ số trong bảng}
+        self.fact_index = {}  # {id(Fact): số thứ tự}
+        self.keys_ready = False  # Đã ghi xong phần facts => khóa Fact ghi được bằng số thứ tự
+
+    def u32(self, n):
+        self.body += _U32.pack(n)
+
+    def u32s(self, items):
+        self.u32(len(items))
+        self.body += struct.pack(f"<{len(items)}I", *items)
+
+    def string_index(self, s):
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        return idx
+
+    def string(self, s):
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        self.u32(idx)
+
+    def fact(self, fact):
+        idx = self.fact_index.get(id(fact))
+        if idx is None:
+            # Fact cha không thuộc KB này (VD: chép từ KB khác) => Fact cùng khóa
+            same = self.kb.facts.get(fact.key)
+            idx = self.fact_index.get(id(same)) if same is not None else None
+            if idx is None: raise ValueError(f"Fact {fact!r} không thuộc KB đang tuần tự hóa")
+        self.u32(idx)
+
+    def _key_index(self, key):
+        fact = self.kb.facts.get(key)
+        return self.fact_index.get(id(fact)) if fact is not None else None
+
+    def facts(self, facts):
+        self.u32(len(facts))
+        for f in facts: self.fact(f)
+
+    def entity(self, obj):
+        ctor, args = obj.__reduce__()
+        self.string(ctor.__name__)
+        self.u32(len(args))
+        for a in args: self.string(a.name if isinstance(a, Point) else a)
+
+    def value(self, v):
+        body = self.body
+        if v is None: body.append(_TAG_NONE)
+        elif v is True: body.append(_TAG_TRUE)
+        elif v is False: body.append(_TAG_FALSE)
+        elif isinstance(v, int):
+            body.append(_TAG_INT); body += _I64.pack(v)
+        elif isinstance(v, float):
+            body.append(_TAG_FLOAT); body += _F64.pack(v)
+        elif isinstance(v, str):
+            body.append(_TAG_STR); self.string(v)
+        elif isinstance(v, Fact):
+            body.append(_TAG_FACT); self.fact(v)
+        elif isinstance(v, Entity):
+            if self.kb.id_map.get(v.canonical_id) is v: # Đối tượng đã đăng ký => chỉ ghi canonical_id
+                body.append(_TAG_OBJECT); self.string(v.canonical_id)
+            else:
+                body.append(_TAG_ENTITY); self.entity(v)
+        elif isinstance(v, dict):
+            body.append(_TAG_DICT); self.u32(len(v))
+            for k, x in v.items():
+                self.value(k); self.value(x)
+        elif self.keys_ready and type(v) is tuple and len(v) == 3 and type(v[0]) is str and type(v[1]) is tuple \
+                and self._key_index(v) is not None: # Khóa của một Fact trong KB => số thứ tự Fact
+            body.append(_TAG_KEY); self.u32(self._key_index(v))
+        elif isinstance(v, (list, tuple, frozenset)):
+            body.append(_TAG_LIST if isinstance(v, list) else _TAG_TUPLE if isinstance(v, tuple) else _TAG_FROZENSET)
+            self.u32(len(v))
+            for x in v: self.value(x)
+        else:
+            raise TypeError(f"Không tuần tự hóa được giá trị kiểu {type(v).__name__}: {v!r}")
+
+    def write(self):
+        kb = self.kb
+        self.u32(len(kb._object_log))
+        for oid in kb._object_log:
+            self.entity(kb.id_map[oid])
+
+        facts = sorted(kb.facts.values(), key=lambda f: f.id)
+        self.fact_index = {id(f): i for i, f in enumerate(facts)}
+        self.u32(len(facts))
+        for f in facts:
+            self.u32(f.id)
+            self.string(f.type)
+            self.u32(len(f.entities))
+            for e in f.entities: self.string(e)
+            self.value(f.value)
+            # Khóa chỉ ghi khi khác khóa tính lại từ type/entities/value (entities có thể được bổ sung sau khi tạo)
+            self.value(None if f.key == make_fact_key(f.type, f.entities, f.value) else f.key)
+            fields = [k for k in Fact.OPTIONAL_FIELDS if hasattr(f, k)]
+            self.u32(len(fields))
+            for k in fields:
+                self.string(k); self.value(getattr(f, k))
+
+        self.keys_ready = True
+        for f in facts:
+            self.u32(len(f.sources))
+            for s in f.sources:
+                self.value(s.reason); self.facts(s.parents)
+
+        self.facts(kb._fact_log)
+
+        self.u32(len(kb._journal))
+        for entry in kb._journal:
+            self.string(entry.op); self.value(entry.args); self.value(entry.rule); self.u32(entry.round)
+
+        edges = list(kb.equality_graph.edges(data=True))
+        self.u32(len(edges))
+        for u, v, data in edges:
+            self.string(u); self.string(v)
+            self.value(data.get("reason")); self.facts(data.get("parents", []))
+
+        # Union-find: các phần tử, gốc trực tiếp, hạng (mảng u32 song song) + dữ liệu cấp lớp
+        classes = kb.equality_classes
+        self.u32s([self.string_index(x) for x in classes.parent])
+        self.u32s([self.string_index(x) for x in classes.parent.values()])
+        self.u32s([classes.rank[x] for x in classes.parent])
+        self.value(classes.data)
+        for name in _STATE_FIELDS:
+            self.value(getattr(kb, name))
+        self.value(kb.rays.parent); self.value(kb.rays.rank)
+        self.u32s([self.string_index(n) for n in kb.point_names])
+        self.value(kb.source_count)
+        self.value(max((f.id for f in facts), default=0) + 1)
+
+        out = bytearray(_HEADER.pack(MAGIC, VERSION))
+        out += _U32.pack(len(self.strings))
+        for s in self.strings: # dict giữ thứ tự chèn = thứ tự chỉ số
+            raw = s.encode("utf-8")
+            out += _U32.pack(len(raw)); out += raw
+        out += self.body
+        return bytes(out)
+
+
+def dumps(kb):
+    """KnowledgeGraph -> bytes. Không giữ listener, mạng Rete, ngân sách và trạng thái fork."""
+    return _Writer(kb).write()
+
+
+def dump(kb, path):
+    with open(path, "wb") as fh:
+        fh.write(dumps(kb))
+
+
+# ==============================================================================
+# ĐỌC
+# ==============================================================================
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.strings = []
+        self.facts = []
+        self.kb = None
+
+    def u32(self):
+        n, = _U32.unpack_from(self.data, self.pos)
+        self.pos += 4
+        return n
+
+    def u32s(self):
+        """Mảng u32 có độ dài đứng trước, đọc một lần."""
+        n = self.u32()
+        items = struct.unpack_from(f"<{n}I", self.data, self.pos)
+        self.pos += 4 * n
+        return items
+
+    def string(self):
+        return self.strings[self.u32()]
+
+    def string_list(self):
+        strings = self.strings
+        return [strings[i] for i in self.u32s()]
+
+    def fact_list(self):
+        facts = self.facts
+        return [facts[i] for i in self.u32s()]
+
+    def entity(self):
+        cls = _ENTITY_TYPES[self.string()]
+        names = self.string_list()
+        return cls(*names) if cls is Point else cls(*map(Point, names))
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _TAG_NONE: return None
+        if tag == _TAG_TRUE: return True
+        if tag == _TAG_FALSE: return False
+        if tag == _TAG_INT:
+            v, = _I64.unpack_from(self.data, self.pos); self.pos += 8
+            return v
+        if tag == _TAG_FLOAT:
+            v, = _F64.unpack_from(self.data, self.pos); self.pos += 8
+            return v
+        if tag == _TAG_STR: return self.string()
+        if tag == _TAG_FACT: return self.facts[self.u32()]
+        if tag == _TAG_KEY: return self.facts[self.u32()].key
+        if tag == _TAG_OBJECT: return self.kb.id_map[self.string()]
+        if tag == _TAG_ENTITY: return self.entity()
+        if tag == _TAG_DICT:
+            n = self.u32()
+            return {self.value(): self.value() for _ in range(n)}
+        if tag in (_TAG_LIST, _TAG_TUPLE, _TAG_FROZENSET):
+            items = [self.value() for _ in range(self.u32())]
+            return items if tag == _TAG_LIST else tuple(items) if tag == _TAG_TUPLE else frozenset(items)
+        raise FormatError(f"Thẻ giá trị không hợp lệ: {tag}")
+
+    def read(self):
+        if len(self.data) < _HEADER.size:
+            raise FormatError("Dữ liệu quá ngắn")
+        magic, version = _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC: raise FormatError("Không phải KB đã tuần tự hóa")
+        if version != VERSION: raise FormatError(f"Phiên bản định dạng {version} không được hỗ trợ (cần {VERSION})")
+        self.pos = _HEADER.size
+
+        data = self.data
+        for _ in range(self.u32()):
+            n = self.u32()
+            self.strings.append(sys.intern(str(data[self.pos:self.pos + n], "utf-8")))
+            self.pos += n
+
+        kb = self.kb = KnowledgeGraph()
+        for _ in range(self.u32()):
+            obj = self.entity()
+            kb.id_map[obj.canonical_id] = obj
+            kb._object_log.append(obj.canonical_id)
+
+        for _ in range(self.u32()):
+            fact_id = self.u32()
+            type_name = self.string()
+            entities = self.string_list()
+            value = self.value()
+            key = self.value()
+            fields = {}
+            for _ in range(self.u32()):
+                k = self.string()
+                fields[k] = self.value()
+            f = Fact(type_name, entities, value, fact_id=fact_id,
+                     key=make_fact_key(key[0], key[1], key[2]) if key else None, **fields)
+            self.facts.append(f)
+            kb.facts[f.key] = f
+            kb.properties.setdefault(type_name, []).append(f)
+
+        for f in self.facts:
+            for _ in range(self.u32()):
+                reason = self.value()
+                f.sources.append(FactSource(reason, self.fact_list()))
+
+        kb._fact_log = self.fact_list()
+
+        journal = kb._journal
+        for _ in range(self.u32()):
+            op, args, rule = self.string(), self.value(), self.value()
+            journal.append(JournalEntry(op, args, rule, self.u32()))
+
+        graph = nx.Graph()
+        for _ in range(self.u32()):
+            u, v = self.string(), self.string()
+            reason = self.value()
+            graph.add_edge(u, v, reason=reason, parents=self.fact_list())
+        kb.equality_graph = graph
+
+        classes = kb.equality_classes
+        members = self.string_list()
+        classes.parent = dict(zip(members, self.string_list()))
+        classes.rank = dict(zip(members, self.u32s()))
+        classes.data = self.value()
+        for member in members: # Chỉ mục đoạn thẳng theo đầu mút được dựng lại từ lớp tương đương
+            kb._index_segment(kb.id_map.get(member))
+        for name in _STATE_FIELDS:
+            setattr(kb, name, self.value())
+        kb.rays.parent = self.value(); kb.rays.rank = self.value()
+        for lid, points in kb.lines.items():
+            for n in points: kb._lines_at.setdefault(n, set()).add(lid)
+        kb.point_names = self.string_list()
+        kb.point_ids = {n: i for i, n in enumerate(kb.point_names)}
+        kb.source_count = self.value()
+        kb._fact_ids = itertools.count(self.value())
+        return kb
+
+
+def loads(data):
+    """bytes -> KnowledgeGraph mới (id Fact, nhật ký thay đổi và marker() giữ nguyên như lúc ghi)."""
+    return _Reader(data).read()
+
+
+def load(path):
+    with open(path, "rb") as fh:
+        return loads(fh.read())
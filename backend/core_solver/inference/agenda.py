@@ -0,0 +1,177 @@
+"""
+Lập lịch best-first (agenda) cho InferenceEngine.
+
+Thay vì chạy các luật theo thứ tự đăng ký trong mỗi vòng, mỗi luật có đầu vào mới được đưa vào
+hàng đợi ưu tiên với điểm "liên quan tới mục tiêu":
+- loại Fact: luật càng ít bước lùi tới mục tiêu (BackwardPlanner) càng được ưu tiên;
+- khoảng cách: Fact mới mà luật sẽ đọc càng gần các điểm của tứ giác mục tiêu (đồ thị điểm - Fact) càng tốt;
+- lịch sử: tỉ lệ số lần chạy luật sinh ra tri thức mới (cộng dồn qua các lần solve).
+Engine luôn chạy luật có điểm cao nhất trước; kết hợp với dừng sớm khi đạt mục tiêu.
+"""
+import heapq
+from collections import deque
+from core_solver.core.entities import Point
+from core_solver.inference.backward import BackwardPlanner
+
+# Trọng số các thành phần của điểm ưu tiên
+WEIGHT_TYPE = 4.0
+WEIGHT_DISTANCE = 2.0
+WEIGHT_HISTORY = 1.0
+
+
+def object_points(obj):
+    """Tên các điểm cấu thành đối tượng (điểm, đoạn thẳng, góc...)."""
+    if isinstance(obj, Point): return {obj.name}
+    names = set()
+    for attr in ("p1", "p2", "p3", "vertex"):
+        p = getattr(obj, attr, None)
+        if isinstance(p, Point): names.add(p.name)
+    for p in getattr(obj, "points", ()):
+        if isinstance(p, Point): names.add(p.name)
+    return names
+
+
+def fact_points(kb, fact):
+    """Tên các điểm mà Fact nhắc tới (kể cả điểm cấu thành đoạn thẳng, góc...)."""
+    names = set()
+    for e in fact.entities:
+        obj = kb.id_map.get(e)
+        if obj is not None: names |= object_points(obj)
+    return names
+
+
+class PointDistances:
+    """
+    Khoảng cách từ tập điểm mục tiêu tới mọi điểm trên siêu đồ thị điểm - Fact
+    (hai điểm kề nhau nếu cùng xuất hiện trong một Fact). Cập nhật tăng dần khi có Fact mới.
+    """
+    def __init__(self, targets):
+        self.dist = {p: 0 for p in targets}
+        self._facts_of = {} # {điểm: [tập điểm của từng Fact chứa nó]}
+
+    def add(self, points):
+        if not points: return
+        for p in points:
+            self._facts_of.setdefault(p, []).append(points)
+        self._relax(points)
+
+    def _relax(self, points):
+        queue = deque([points])
+        while queue:
+            pts = queue.popleft()
+            known = [self.dist[p] for p in pts if p in self.dist]
+            if not known: continue
+            d = min(known) + 1
+            for p in pts:
+                if self.dist.get(p, d + 1) > d:
+                    self.dist[p] = d
+                    queue.extend(self._facts_of.get(p, ()))
+
+    def of(self, points):
+        """Khoảng cách nhỏ nhất từ mục tiêu tới một điểm trong points (None nếu chưa liên thông)."""
+        known = [self.dist[p] for p in points if p in self.dist]
+        return min(known) if known else None
+
+
+class Agenda:
+    """
+    Hàng đợi ưu tiên các lần chạy luật. push(rule) đưa luật vào (hoặc chấm lại điểm nếu đã có),
+    pop() lấy luật có điểm cao nhất (bằng điểm thì theo thứ tự đăng ký).
+    history: {tên lớp luật: [số lần chạy, số lần có tri thức mới]}, do engine giữ giữa các lần solve.
+    """
+    def __init__(self, kb, rules, goal=None, history=None, max_depth=15):
+        self.kb = kb
+        self.rules = list(rules)
+        self._order = {rule: i for i, rule in enumerate(self.rules)}
+        self.history = history if history is not None else {}
+
+        # Độ sâu lùi của từng luật so với loại Fact mục tiêu
+        self._depth = {}
+        if goal is not None:
+            self._depth = BackwardPlanner(self.rules).depth_of([goal.type], max_depth)
+
+        # Đọc theo loại Fact => luật nào cần chạy lại khi loại đó thay đổi
+        self._readers = {}
+        self._wildcards = []
+        for rule in self.rules:
+            if rule.reads is None: self._wildcards.append(rule)
+            else:
+                for t in rule.reads: self._readers.setdefault(t, []).append(rule)
+
+        # Khoảng cách tới mục tiêu của Fact mới gần nhất mà mỗi luật chưa xử lý
+        self._distances = None
+        self._nearest = {}
+        if goal is not None and goal.entities:
+            self._distances = PointDistances(goal.entities)
+            for facts in kb.properties.values():
+                for f in facts: self._distances.add(fact_points(kb, f))
+            for facts in kb.properties.values():
+                for f in facts: self._on_fact(f, False)
+            kb.subscribe(self._on_fact)
+
+        self._heap = []
+        self._queued = {} # {rule: số thế hệ của mục hợp lệ trong heap}
+        self._generation = 0
+        self._versions = kb.type_versions()
+
+    def close(self):
+        if self._distances is not None: self.kb.unsubscribe(self._on_fact)
+
+    def __len__(self):
+        return len(self._queued)
+
+    # ==========================================================================
+    # ĐIỂM ƯU TIÊN
+    # ==========================================================================
+    def _on_fact(self, fact, is_new):
+        pts = fact_points(self.kb, fact)
+        if is_new: self._distances.add(pts)
+        d = self._distances.of(pts)
+        if d is None: return
+        for rule in self._readers.get(fact.type, []) + self._wildcards:
+            if d < self._nearest.get(rule, d + 1): self._nearest[rule] = d
+
+    def score(self, rule):
+        depth = self._depth.get(rule)
+        type_term = 1.0 / (1 + depth) if depth is not None else 0.0
+
+        d = self._nearest.get(rule)
+        distance_term = 1.0 / (1 + d) if d is not None else 0.0
+
+        calls, useful = self.history.get(type(rule).__name__, (0, 0))
+        history_term = (useful + 1) / (calls + 2)
+        return WEIGHT_TYPE * type_term + WEIGHT_DISTANCE * distance_term + WEIGHT_HISTORY * history_term
+
+    # ==========================================================================
+    # HÀNG ĐỢI
+    # ==========================================================================
+    def push(self, rule):
+        self._generation += 1
+        self._queued[rule] = self._generation
+        heapq.heappush(self._heap, (-self.score(rule), self._order[rule], self._generation, rule))
+
+    def pop(self):
+        while self._heap:
+            _, _, generation, rule = heapq.heappop(self._heap)
+            if self._queued.get(rule) == generation:
+                del self._queued[rule]
+                self._nearest.pop(rule, None)
+                return rule
+        raise IndexError("Agenda rỗng")
+
+    def record(self, rule, facts_added):
+        """Ghi nhận kết quả lần chạy vào lịch sử và đưa các luật đọc loại Fact vừa thay đổi vào hàng đợi."""
+        entry = self.history.setdefault(type(rule).__name__, [0, 0])
+        entry[0] += 1
+        if facts_added: entry[1] += 1
+
+        versions = self.kb.type_versions()
+        changed = [t for t, v in versions.items() if self._versions.get(t) != v]
+        self._versions = versions
+        if not changed: return
+
+        affected = set(self._wildcards)
+        for t in changed:
+            affected.update(self._readers.get(t, ()))
+        for r in sorted(affected, key=self._order.get):
+            self.push(r)
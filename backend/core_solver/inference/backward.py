@@ -0,0 +1,82 @@
+"""
+Suy diễn lùi (goal-driven) trên khai báo reads/writes của các luật.
+
+Từ mục tiêu (VD: IS_CYCLIC của một tứ giác) đi ngược: các luật GHI loại Fact mục tiêu là các cách
+chứng minh (RuleCyclicMethod1..4, phương tích, phân loại tứ giác...), các loại Fact chúng ĐỌC là
+mục tiêu con (giá trị góc, đẳng thức...), rồi lại tìm luật ghi các loại đó, v.v. tới độ sâu giới hạn.
+InferenceEngine chỉ chạy các luật nằm trong phạm vi này, mở rộng dần độ sâu khi chưa chứng minh được.
+"""
+
+
+class BackwardPlanner:
+    """
+    Chỉ mục "loại Fact -> các luật ghi loại đó" và phép mở rộng mục tiêu con theo độ sâu (có ghi nhớ).
+    Luật không khai báo writes (None) có thể ghi mọi loại nên luôn được chọn.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._writers = {}      # {loại Fact: [luật]}
+        self._wildcards = []    # Luật không khai báo writes
+        for rule in self.rules:
+            if rule.writes is None:
+                self._wildcards.append(rule)
+                continue
+            for t in rule.writes:
+                self._writers.setdefault(t, []).append(rule)
+        self._levels = {}       # {tập loại mục tiêu: [(luật, mục tiêu con) theo từng độ sâu]}
+
+    def writers(self, type_name):
+        """Các luật có thể sinh ra Fact loại type_name."""
+        return self._writers.get(type_name, []) + self._wildcards
+
+    def _expand(self, goal_types, depth):
+        """
+        Các mức mở rộng 1..depth của goal_types. Mức k gồm tập luật cần để chứng minh
+        mục tiêu qua tối đa k bước lùi và tập loại Fact (mục tiêu con) mà chúng đọc.
+        """
+        goal_types = frozenset(goal_types)
+        levels = self._levels.setdefault(goal_types, [])
+        while len(levels) < depth:
+            if levels:
+                prev_rules, subgoals = levels[-1]
+            else:
+                prev_rules, subgoals = frozenset(), goal_types
+
+            rules = set(prev_rules)
+            for t in subgoals:
+                rules.update(self.writers(t))
+
+            next_subgoals = set(subgoals)
+            for rule in rules:
+                if rule.reads is None:
+                    # Đọc mọi loại => mọi loại mà các luật có thể ghi đều là mục tiêu con
+                    next_subgoals.update(self._writers)
+                else:
+                    next_subgoals.update(rule.reads)
+            levels.append((frozenset(rules), frozenset(next_subgoals)))
+        return levels[:depth]
+
+    def rules_for(self, goal_types, depth):
+        """Các luật có thể góp phần chứng minh goal_types trong tối đa depth bước lùi (giữ thứ tự đăng ký)."""
+        selected = self._expand(goal_types, depth)[-1][0] if depth > 0 else frozenset()
+        return [r for r in self.rules if r in selected]
+
+    def subgoals(self, goal_types, depth):
+        """Các loại Fact cần biết ở độ sâu depth."""
+        return self._expand(goal_types, depth)[-1][1] if depth > 0 else frozenset(goal_types)
+
+    def depth_limit(self, goal_types, max_depth):
+        """Độ sâu nhỏ nhất mà việc mở rộng thêm không chọn thêm luật nào (<= max_depth)."""
+        levels = self._expand(goal_types, max_depth)
+        for k in range(1, len(levels)):
+            if levels[k][0] == levels[k - 1][0] and levels[k][1] == levels[k - 1][1]:
+                return k
+        return len(levels)
+
+    def depth_of(self, goal_types, max_depth):
+        """{luật: độ sâu lùi nhỏ nhất (0 = ghi trực tiếp loại mục tiêu)} cho các luật trong phạm vi max_depth."""
+        depths = {}
+        for k, (rules, _) in enumerate(self._expand(goal_types, max_depth)):
+            for rule in rules:
+                depths.setdefault(rule, k)
+        return depths
@@ -1,7 +1,13 @@
 from abc import ABC, abstractmethod
-from core_solver.core.knowledge_base import KnowledgeGraph
+from core_solver.core.knowledge_base import KnowledgeGraph, Delta
 
 class GeometricRule(ABC):
+    # Khai báo các loại Fact luật đọc / sinh ra (VD: ("QUADRILATERAL", "EQUALITY")).
+    # Ngoài loại Fact còn có loại giả "POINT"/"OBJECT" cho đối tượng mới đăng ký vào id_map.
+    # None = không khai báo: luật luôn được chạy và được coi là phụ thuộc mọi luật khác.
+    reads = None
+    writes = None
+
     @property
     @abstractmethod
     def name(self):
@@ -18,4 +24,19 @@ class GeometricRule(ABC):
         Áp dụng luật lên Knowledge Graph.
         Trả về True nếu có tri thức mới được sinh ra.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def apply_delta(self, kb: KnowledgeGraph, delta: Delta) -> bool:
+        """
+        Áp dụng luật theo kiểu semi-naive: chỉ cần xét các tổ hợp có ít nhất
+        một Fact trong delta (tri thức mới kể từ lần chạy trước của luật này).
+        Mặc định chạy lại toàn bộ apply(); các luật có phép ghép (join) tốn kém nên override.
+        """
+        return self.apply(kb)
+
+    def goal_entities(self, kb: KnowledgeGraph, goal):
+        """
+        Các đối tượng cụ thể (Angle, Segment...) luật cần biết để sinh Fact mục tiêu goal (suy diễn lùi).
+        None = không xác định (luật có thể dùng mọi phần của KB).
+        """
+        return None
@@ -0,0 +1,53 @@
+import time
+
+
+class BudgetExceeded(Exception):
+    """Ném ra khi lần suy diễn vượt ngân sách (thời gian / số Fact / số cạnh bằng nhau / bị hủy)."""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Budget:
+    """
+    Ngân sách cho một lần InferenceEngine.solve().
+    - time_limit: số giây tối đa (tính từ lúc tạo Budget).
+    - max_facts: số Fact tối đa trong KB.
+    - max_equality_edges: số cạnh tối đa của equality_graph.
+    - max_rounds: số lượt chạy luật tối đa (mỗi vòng, hoặc mỗi vòng của một tầng khi chạy phân tầng).
+    Engine kiểm tra giữa các luật; luật có vòng lặp dài gọi kb.check_budget() bên trong vòng lặp.
+    cancel() cho phép luồng khác yêu cầu dừng (hợp tác, không ngắt giữa chừng).
+    Sau khi bị dừng, engine vẫn chạy tiếp được trên cùng KB: luật bị ngắt chưa ghi nhận đầu vào đã xử lý.
+    """
+    TIME = "time"
+    FACTS = "facts"
+    EQUALITY_EDGES = "equality_edges"
+    ROUNDS = "rounds"
+    CANCELLED = "cancelled"
+
+    def __init__(self, time_limit=None, max_facts=None, max_equality_edges=None, max_rounds=None):
+        self.deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        self.max_facts = max_facts
+        self.max_equality_edges = max_equality_edges
+        self.max_rounds = max_rounds
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def remaining_time(self):
+        if self.deadline is None: return None
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def exceeded(self, kb):
+        """Lý do vượt ngân sách (một trong các hằng TIME/FACTS/...) hoặc None."""
+        if self.cancelled: return self.CANCELLED
+        if self.deadline is not None and time.perf_counter() > self.deadline: return self.TIME
+        if self.max_facts is not None and len(kb.facts) > self.max_facts: return self.FACTS
+        if self.max_equality_edges is not None and kb.equality_graph.number_of_edges() > self.max_equality_edges:
+            return self.EQUALITY_EDGES
+        return None
+
+    def check(self, kb):
+        reason = self.exceeded(kb)
+        if reason: raise BudgetExceeded(reason)
@@ -1,38 +1,457 @@
+import time
+import networkx as nx
+from core_solver.inference.goal import SolveResult
+from core_solver.inference.stats import EngineStats
+from core_solver.inference.budget import Budget, BudgetExceeded
+from core_solver.inference.rete import PatternRule, ReteNetwork
+from core_solver.inference.backward import BackwardPlanner
+from core_solver.inference.agenda import Agenda
+from core_solver.inference.slicing import relevant_facts, build_slice, import_derived, goal_points
+from core_solver.utils import tracing
+
+_trace = tracing.get_tracer("engine")
+
+MAX_SLICE_RATIO = 0.9 # Chỉ suy diễn trên lát cắt khi nó bỏ được hơn 10% số Fact
+
 class InferenceEngine:
-    def __init__(self, kb):
+    def __init__(self, kb, semi_naive=False, stratified=False, use_rete=True, goal_directed=False, agenda=False,
+                 sliced=False):
         self.kb = kb
         self.rules = []
         self.max_depth = 15 # Giới hạn số vòng lặp suy diễn
+        # Semi-naive: mỗi luật chỉ nhận phần tri thức mới kể từ lần chạy trước của nó
+        self.semi_naive = semi_naive
+        self._markers = {} # {rule: mốc nhật ký KB ở lần chạy trước}
+        # Phân tầng: chạy các thành phần liên thông mạnh của đồ thị phụ thuộc theo thứ tự topo
+        self.stratified = stratified
+        self._signatures = {} # {rule: phiên bản các loại Fact đầu vào ở lần chạy trước}
+        # Rete: các PatternRule được biên dịch thành một mạng so khớp tăng dần gắn với KB (kb.rete)
+        self.use_rete = use_rete
+        # Suy diễn lùi: khi solve() có goal, chỉ chạy các luật có thể dẫn tới mục tiêu (mở rộng dần độ sâu)
+        self.goal_directed = goal_directed
+        # Agenda: chạy luật theo hàng đợi ưu tiên (liên quan tới mục tiêu) thay vì theo thứ tự cố định
+        self.agenda = agenda
+        self._history = {} # {tên lớp luật: [số lần chạy, số lần có tri thức mới]}, giữ qua các lần solve
+        # Cắt lát: khi goal có entities, suy diễn trước trên phần KB liên quan tới mục tiêu
+        self.sliced = sliced
+        self.slice_radius = None # Số bước tối đa từ các điểm mục tiêu (None = cả thành phần liên thông)
+        # Điều kiện dừng sớm của lần solve() hiện tại
+        self._goal = None
+        self._min_methods = 1
+        self._stop_on_contradiction = False
+        self._goal_version = None
+        self._stop_reason = None
+        self._budget = None
+        self.stats = EngineStats() # Thống kê thời gian / số Fact sinh ra theo luật và theo vòng
 
     def add_rule(self, rule):
         """Đăng ký một luật suy diễn."""
         self.rules.append(rule)
 
-    def solve(self):
+    def clone_for(self, kb):
+        """Engine mới trên kb khác với cùng bộ luật và cấu hình."""
+        engine = InferenceEngine(kb, self.semi_naive, self.stratified, self.use_rete, self.goal_directed, self.agenda)
+        engine.rules = list(self.rules)
+        engine.max_depth = self.max_depth
+        engine.slice_radius = self.slice_radius
+        engine._history = self._history
+        return engine
+
+    # ==========================================================================
+    # ĐỒ THỊ PHỤ THUỘC GIỮA CÁC LUẬT
+    # ==========================================================================
+    @staticmethod
+    def _feeds(producer, consumer):
+        """producer có thể sinh ra Fact mà consumer đọc không? (None = không khai báo => có)"""
+        if producer.writes is None or consumer.reads is None: return True
+        return not set(producer.writes).isdisjoint(consumer.reads)
+
+    def dependency_graph(self):
+        """Đồ thị có hướng: cạnh i -> j nếu luật i ghi loại Fact mà luật j đọc."""
+        graph = nx.DiGraph()
+        graph.add_nodes_from(range(len(self.rules)))
+        for i, producer in enumerate(self.rules):
+            for j, consumer in enumerate(self.rules):
+                if self._feeds(producer, consumer):
+                    graph.add_edge(i, j)
+        return graph
+
+    def build_strata(self):
+        """
+        Gom các luật phụ thuộc vòng vào cùng một tầng (SCC) và sắp các tầng theo thứ tự topo.
+        Các tầng/luật không ràng buộc nhau giữ nguyên thứ tự đăng ký.
+        """
+        condensed = nx.condensation(self.dependency_graph())
+        members = nx.get_node_attributes(condensed, "members")
+        order = nx.lexicographical_topological_sort(condensed, key=lambda c: min(members[c]))
+        return [[self.rules[i] for i in sorted(members[c])] for c in order]
+
+    @property
+    def network(self): return self.kb.rete
+
+    def _compile_patterns(self):
+        """Đưa các PatternRule mới đăng ký vào mạng Rete (tạo mạng ở lần đầu, dùng lại giữa các lần solve)."""
+        if not self.use_rete: return
+        for rule in self.rules:
+            if not isinstance(rule, PatternRule): continue
+            network = self.kb.rete or ReteNetwork(self.kb)
+            if not network.has_rule(rule): network.add_rule(rule)
+
+    # ==========================================================================
+    # CHẠY LUẬT
+    # ==========================================================================
+    def _has_new_input(self, rule):
+        """Bỏ qua luật nếu các loại Fact nó đọc không đổi kể từ lần chạy trước."""
+        if rule.reads is None: return True
+        return self._signatures.get(rule) != self.kb.versions(rule.reads)
+
+    def _apply_rule(self, rule):
+        """
+        Chạy luật. Chữ ký đầu vào và mốc nhật ký (semi-naive) chỉ được ghi khi luật chạy xong bình thường:
+        luật bị ngắt giữa chừng (hết ngân sách, lỗi) sẽ nhận lại toàn bộ phần tri thức đó ở lần chạy sau.
+        """
+        signature = self.kb.versions(rule.reads) if rule.reads is not None else None
+        marker = self.kb.marker()
+        if not self.semi_naive:
+            changed = rule.apply(self.kb)
+        else:
+            previous = self._markers.get(rule)
+            if previous is None:
+                changed = rule.apply(self.kb)
+            else:
+                delta = self.kb.delta_since(previous)
+                # KB không đổi kể từ lần chạy trước => không thể sinh gì mới
+                changed = bool(delta) and rule.apply_delta(self.kb, delta)
+            self._markers[rule] = marker
+        if signature is not None: self._signatures[rule] = signature
+        return changed
+
+    def _check_stop(self):
+        """Trả về lý do dừng sớm (SolveResult.GOAL / CONTRADICTION) hoặc None."""
+        if self._stop_on_contradiction and "CONTRADICTION" in self.kb.properties:
+            return SolveResult.CONTRADICTION
+        if self._goal is not None:
+            # Chỉ kiểm tra lại khi có Fact mới thuộc loại của mục tiêu
+            version = self.kb.versions((self._goal.type,))
+            if version != self._goal_version:
+                self._goal_version = version
+                if self._goal.is_reached(self.kb, self._min_methods):
+                    return SolveResult.GOAL
+        return None
+
+    def _begin_round(self, label=None):
+        budget = self._budget
+        if budget is not None and budget.max_rounds is not None and len(self.stats.rounds) >= budget.max_rounds:
+            raise BudgetExceeded(Budget.ROUNDS)
+        self.stats.start_round(label)
+        self.kb.cause_round = len(self.stats.rounds) # Gắn vào nhật ký thao tác của KB
+
+    def _fire(self, rule):
+        """Chạy một luật (bỏ qua nếu không có đầu vào mới) và ghi thống kê. Trả về True nếu có tri thức mới."""
+        if not self._has_new_input(rule):
+            self.stats.record_skip(rule)
+            return False
+        kb = self.kb
+        if self._budget is not None: self._budget.check(kb)
+
+        new_info_found = False
+        n_facts, n_sources = len(kb.facts), kb.source_count
+        failed = False
+        start = time.perf_counter()
+        kb.cause_rule = type(rule).__name__
+        try:
+            if self._apply_rule(rule):
+                new_info_found = True
+                # print(f"    -> Luật '{rule.name}' đã sinh ra tri thức mới.")
+        except BudgetExceeded:
+            # Luật tự dừng giữa chừng: ghi nhận phần đã chạy rồi dừng cả lần suy diễn
+            self.stats.record_call(rule, time.perf_counter() - start,
+                                   len(kb.facts) - n_facts, kb.source_count - n_sources)
+            raise
+        except Exception as e:
+            failed = True
+            if _trace.is_error:
+                _trace.error("rule_failed", f"Lỗi khi chạy luật {rule.name}: {e}", rule=type(rule).__name__, error=repr(e))
+        finally:
+            kb.cause_rule = None
+        self.stats.record_call(rule, time.perf_counter() - start,
+                               len(kb.facts) - n_facts, kb.source_count - n_sources, failed)
+
+        self._stop_reason = self._check_stop()
+        return new_info_found
+
+    def _run_round(self, rules, label=None):
+        """Chạy lần lượt các luật một lượt. Trả về True nếu có tri thức mới."""
+        new_info_found = False
+        self._begin_round(label)
+        for rule in rules:
+            if self._fire(rule):
+                new_info_found = True
+            if self._stop_reason: return True
+        return new_info_found
+
+    def solve(self, goal=None, min_methods=1, stop_on_contradiction=False, budget=None):
         """
         Chạy suy diễn tiến (Forward Chaining).
-        Lặp lại việc áp dụng các luật cho đến khi không còn tri thức mới được sinh ra.
+        Lặp lại việc áp dụng các luật cho đến khi không còn tri thức mới được sinh ra, hoặc dừng sớm khi:
+        - goal (Goal) đã được chứng minh bằng ít nhất min_methods cách khác nhau;
+        - stop_on_contradiction=True và xuất hiện Fact CONTRADICTION;
+        - budget (Budget) hết thời gian / số Fact / số cạnh bằng nhau / số vòng, hoặc bị hủy:
+          KB giữ nguyên phần đã suy ra và kết quả được đánh dấu truncated.
+        Với goal_directed=True và có goal: suy diễn lùi từ mục tiêu (xem _solve_backward).
+        Với agenda=True: chạy luật theo thứ tự ưu tiên best-first (xem _solve_agenda).
+        Với sliced=True và goal có entities: thử trên lát cắt liên quan trước (xem _solve_sliced).
+        Trả về SolveResult cho biết điều kiện nào đã kết thúc lần chạy.
         """
-        print(f"--- BẮT ĐẦU SUY DIỄN (Có {len(self.rules)} luật) ---")
-        
+        if self.sliced and goal is not None and goal.entities:
+            result = self._solve_sliced(goal, min_methods, stop_on_contradiction, budget)
+            if result is not None: return result
+
+        self._goal = goal
+        self._min_methods = min_methods
+        self._stop_on_contradiction = stop_on_contradiction
+        self._goal_version = None
+        self._stop_reason = self._check_stop() # Giả thiết có thể đã đủ
+        self.stats = EngineStats()
+        self._budget = budget
+        self.kb.budget = budget
+        self._compile_patterns()
+
+        start = time.perf_counter()
+        try:
+            if self.goal_directed and goal is not None:
+                result = self._solve_backward()
+            elif self.agenda:
+                result = self._solve_agenda()
+            elif self.stratified:
+                result = self._solve_stratified()
+            else:
+                result = self._solve_rounds()
+        except BudgetExceeded as e:
+            if _trace.is_warning: _trace.warning("budget_exceeded", f"Hết ngân sách ({e.reason})", budget=e.reason)
+            result = SolveResult(SolveResult.BUDGET, len(self.stats.rounds), truncated=True, detail=e.reason)
+        finally:
+            self._budget = None
+            self.kb.budget = None
+            self.kb.cause_round = 0
+        if result.stop_reason == SolveResult.GOAL and self._stop_on_contradiction:
+            result = self._diagnose(result)
+        self.stats.total_time = time.perf_counter() - start
+        self.stats.stop_reason = result.stop_reason
+
+        if result.stop_reason in (SolveResult.GOAL, SolveResult.CONTRADICTION):
+            if _trace.is_info: _trace.info("early_stop", f"Kết thúc sớm: {result.stop_reason}", reason=result.stop_reason)
+        if goal is not None:
+            result.goal_fact = goal.find(self.kb)
+        return result
+
+    def _diagnose(self, result):
+        """
+        Mục tiêu có thể đạt được trước khi các luật chẩn đoán (ghi CONTRADICTION, đăng ký sau cùng) kịp chạy:
+        cho chúng một lượt trên KB hiện tại (ngoài ngân sách) để đề bài mâu thuẫn không bị báo là chứng minh được.
+        """
+        checks = [r for r in self.rules if r.writes is not None and "CONTRADICTION" in r.writes]
+        if not checks: return result
+        self.stats.start_round("diagnostics")
+        self.kb.cause_round = len(self.stats.rounds)
+        try:
+            for rule in checks:
+                self._fire(rule)
+        finally:
+            self.kb.cause_round = 0
+        if "CONTRADICTION" not in self.kb.properties: return result
+        if _trace.is_info: _trace.info("goal_contradiction", "Đã chứng minh mục tiêu nhưng đề bài mâu thuẫn")
+        return SolveResult(SolveResult.CONTRADICTION, result.rounds)
+
+    def _solve_sliced(self, goal, min_methods, stop_on_contradiction, budget):
+        """
+        Suy diễn trên lát cắt KB liên quan tới goal (slicing.relevant_facts) rồi đưa tri thức mới về KB gốc.
+        Trả về None (để chạy lại trên KB đầy đủ) nếu lát cắt gần bằng KB
+        hoặc không chứng minh được mục tiêu / không phát hiện mâu thuẫn.
+        """
+        facts, points = relevant_facts(self.kb, goal, self.rules, self.max_depth, self.slice_radius)
+        if len(facts) > MAX_SLICE_RATIO * len(self.kb.facts): return None # Lát cắt gần bằng KB, không đáng
+
+        slice_kb, fact_map = build_slice(self.kb, facts, points)
+        marker = slice_kb.marker()
+        engine = self.clone_for(slice_kb)
+        result = engine.solve(goal, min_methods, stop_on_contradiction, budget)
+        if result.stop_reason not in (SolveResult.GOAL, SolveResult.CONTRADICTION, SolveResult.BUDGET):
+            if _trace.is_info:
+                _trace.info("slice_fallback", f"Lát cắt ({len(facts)}/{len(self.kb.facts)} Fact) không đủ, chạy trên toàn bộ KB",
+                            slice_facts=len(facts), facts=len(self.kb.facts), reason=result.stop_reason)
+            return None
+
+        if _trace.is_info:
+            _trace.info("slice_solved", f"Giải trên lát cắt {len(facts)}/{len(self.kb.facts)} Fact",
+                        slice_facts=len(facts), facts=len(self.kb.facts), reason=result.stop_reason)
+        import_derived(slice_kb, self.kb, marker, fact_map)
+        self.stats = engine.stats
+        result.goal_fact = goal.find(self.kb)
+        return result
+
+    def _solve_rounds(self):
+        if _trace.is_info: _trace.info("start", f"Bắt đầu suy diễn (Có {len(self.rules)} luật)", rules=len(self.rules))
+
         steps = 0
         while steps < self.max_depth:
-            print(f"[*] Vòng lặp thứ {steps + 1}...")
-            new_info_found = False
-            
-            for rule in self.rules:
-                try:
-                    if rule.apply(self.kb):
-                        new_info_found = True
-                        # print(f"    -> Luật '{rule.name}' đã sinh ra tri thức mới.")
-                except Exception as e:
-                    print(f"    [!] Lỗi khi chạy luật {rule.name}: {e}")
-            
-            if not new_info_found:
-                print("--- KẾT THÚC SUY DIỄN: Tri thức đã bão hòa ---")
-                break
-                
+            if self._stop_reason: return SolveResult(self._stop_reason, steps)
+            if _trace.is_debug: _trace.debug("round", f"Vòng lặp thứ {steps + 1}", round=steps + 1)
+
+            if not self._run_round(self.rules):
+                if _trace.is_info: _trace.info("saturated", "Kết thúc suy diễn: Tri thức đã bão hòa")
+                return SolveResult(SolveResult.SATURATED, steps)
+
             steps += 1
-            
-        if steps >= self.max_depth:
-            print("--- KẾT THÚC: Đạt giới hạn vòng lặp ---")
\ No newline at end of file
+
+        if self._stop_reason: return SolveResult(self._stop_reason, steps)
+        if _trace.is_warning: _trace.warning("max_depth", "Kết thúc: Đạt giới hạn vòng lặp")
+        return SolveResult(SolveResult.MAX_DEPTH, steps)
+
+    def _solve_stratified(self):
+        """
+        Chạy từng tầng tới điểm bất động (tối đa max_depth vòng mỗi tầng) theo thứ tự topo.
+        Nếu khai báo reads/writes thiếu khiến tầng sau sinh dữ liệu cho tầng trước,
+        lượt kế tiếp sẽ chạy lại (luật không có đầu vào mới bị bỏ qua nên lượt thừa rất rẻ).
+        """
+        strata = self.build_strata()
+        if _trace.is_info:
+            _trace.info("start", f"Bắt đầu suy diễn (Có {len(self.rules)} luật, {len(strata)} tầng)",
+                        rules=len(self.rules), strata=len(strata))
+
+        total_steps = 0
+        for _ in range(self.max_depth):
+            any_change = False
+            for level, stratum in enumerate(strata):
+                steps = 0
+                while steps < self.max_depth:
+                    if self._stop_reason: return SolveResult(self._stop_reason, total_steps + steps)
+                    if not self._run_round(stratum, f"stratum_{level + 1};round_{steps + 1}"): break
+                    any_change = True
+                    steps += 1
+                total_steps += steps
+                if steps:
+                    if _trace.is_debug:
+                        _trace.debug("stratum", f"Tầng {level + 1} ({len(stratum)} luật): {steps} vòng có tri thức mới",
+                                     stratum=level + 1, rounds=steps)
+
+            if self._stop_reason: return SolveResult(self._stop_reason, total_steps)
+            if not any_change:
+                if _trace.is_info: _trace.info("saturated", "Kết thúc suy diễn: Tri thức đã bão hòa")
+                return SolveResult(SolveResult.SATURATED, total_steps)
+
+        if _trace.is_warning: _trace.warning("max_depth", "Kết thúc: Đạt giới hạn vòng lặp")
+        return SolveResult(SolveResult.MAX_DEPTH, total_steps)
+
+    def _solve_backward(self):
+        """
+        Suy diễn hướng mục tiêu: độ sâu k chỉ chạy các luật cách mục tiêu tối đa k bước lùi
+        (BackwardPlanner), tới điểm bất động, rồi mới mở rộng sang độ sâu k + 1.
+        Độ sâu bị chặn bởi max_depth; các luật ngoài phạm vi mục tiêu không bao giờ được chạy.
+        Từ độ sâu 2, luật trước hết chỉ được chạy trên lát cắt quanh mục tiêu con cụ thể (xem _solve_gated).
+        """
+        goal_types = [self._goal.type]
+        if self._stop_on_contradiction: goal_types.append("CONTRADICTION")
+        planner = BackwardPlanner(self.rules)
+        limit = planner.depth_limit(goal_types, self.max_depth)
+        if _trace.is_info:
+            _trace.info("start", f"Bắt đầu suy diễn lùi từ {self._goal} (tối đa {limit} mức)",
+                        goal=repr(self._goal), depth_limit=limit)
+
+        total_steps = 0
+        capped = False
+        for depth in range(1, limit + 1):
+            rules = planner.rules_for(goal_types, depth)
+            if depth > 1 and self._goal.entities:
+                total_steps += self._solve_gated(rules, depth)
+            steps = 0
+            while True:
+                if self._stop_reason: return SolveResult(self._stop_reason, total_steps + steps)
+                if steps >= self.max_depth:
+                    capped = True
+                    break
+                if not self._run_round(rules, f"depth_{depth};round_{steps + 1}"): break
+                steps += 1
+            total_steps += steps
+            if _trace.is_debug:
+                _trace.debug("depth", f"Độ sâu {depth} ({len(rules)} luật): {steps} vòng có tri thức mới",
+                             depth=depth, rules=len(rules), rounds=steps)
+
+        if self._stop_reason: return SolveResult(self._stop_reason, total_steps)
+        if capped:
+            if _trace.is_warning: _trace.warning("max_depth", "Kết thúc: Đạt giới hạn vòng lặp")
+            return SolveResult(SolveResult.MAX_DEPTH, total_steps)
+        if _trace.is_info: _trace.info("saturated", "Kết thúc suy diễn: Không còn tri thức mới liên quan tới mục tiêu")
+        return SolveResult(SolveResult.SATURATED, total_steps)
+
+    def _solve_gated(self, rules, depth):
+        """
+        Chạy rules trên lát cắt quanh mục tiêu con cụ thể của độ sâu 1: các góc / đoạn thẳng mà các cách chứng minh
+        cần (rule.goal_entities), mở rộng bán kính 1, 2... tới khi chứng minh được hoặc lát cắt gần bằng KB.
+        Tri thức suy ra trên lát cắt được đưa về KB; phần còn lại do vòng trên KB đầy đủ đảm nhận.
+        Trả về tổng số vòng đã chạy trên các lát cắt.
+        """
+        steps = 0
+        previous = None
+        seeds = goal_points(self.kb, self._goal, self.rules)
+        for radius in range(1, self.max_depth + 1):
+            facts, points = relevant_facts(self.kb, self._goal, self.rules, self.max_depth, radius, seeds)
+            if len(facts) > MAX_SLICE_RATIO * len(self.kb.facts) \
+                    and len(points) > MAX_SLICE_RATIO * len(self.kb.point_names): break # Lát cắt gần bằng KB
+            if (len(facts), len(points)) == previous: continue # Bán kính lớn hơn chưa thêm gì
+
+            previous = (len(facts), len(points))
+            slice_kb, fact_map = build_slice(self.kb, facts, points)
+            marker = slice_kb.marker()
+            engine = self.clone_for(slice_kb)
+            engine.rules = list(rules)
+            engine.goal_directed = False
+            result = engine.solve(self._goal, self._min_methods, self._stop_on_contradiction, self._budget)
+            import_derived(slice_kb, self.kb, marker, fact_map)
+            steps += result.rounds
+            if _trace.is_debug:
+                _trace.debug("gated", f"Độ sâu {depth}, bán kính {radius}: lát cắt {len(facts)}/{len(self.kb.facts)} Fact",
+                             depth=depth, radius=radius, slice_facts=len(facts), reason=result.stop_reason)
+
+            self._stop_reason = self._check_stop()
+            if self._stop_reason or result.stop_reason == SolveResult.BUDGET: break
+        return steps
+
+    def _solve_agenda(self):
+        """
+        Best-first: luôn chạy luật có điểm ưu tiên cao nhất trong Agenda; sau mỗi lần chạy,
+        các luật đọc loại Fact vừa thay đổi được chấm điểm lại và đưa vào hàng đợi.
+        Mỗi len(rules) lần chạy được tính là một vòng (thống kê, ngân sách số vòng);
+        tối đa max_depth vòng. Hàng đợi rỗng nghĩa là tri thức đã bão hòa.
+        """
+        agenda = Agenda(self.kb, self.rules, self._goal, self._history, self.max_depth)
+        if _trace.is_info:
+            _trace.info("start", f"Bắt đầu suy diễn theo agenda (Có {len(self.rules)} luật)", rules=len(self.rules))
+        try:
+            for rule in self.rules:
+                agenda.push(rule)
+
+            per_round = max(len(self.rules), 1)
+            fired = 0
+            while agenda:
+                if self._stop_reason: return SolveResult(self._stop_reason, len(self.stats.rounds))
+                if fired >= self.max_depth * per_round:
+                    if _trace.is_warning: _trace.warning("max_depth", "Kết thúc: Đạt giới hạn vòng lặp")
+                    return SolveResult(SolveResult.MAX_DEPTH, len(self.stats.rounds))
+                if fired % per_round == 0:
+                    self._begin_round(f"agenda_{fired // per_round + 1}")
+
+                rule = agenda.pop()
+                n_facts = len(self.kb.facts)
+                self._fire(rule)
+                fired += 1
+                agenda.record(rule, len(self.kb.facts) - n_facts)
+                if _trace.is_debug:
+                    _trace.debug("agenda_fire", f"Chạy luật {rule.name} ({len(agenda)} luật đang chờ)",
+                                 rule=type(rule).__name__, queued=len(agenda))
+        finally:
+            agenda.close()
+
+        if self._stop_reason: return SolveResult(self._stop_reason, len(self.stats.rounds))
+        if _trace.is_info: _trace.info("saturated", "Kết thúc suy diễn: Tri thức đã bão hòa")
+        return SolveResult(SolveResult.SATURATED, len(self.stats.rounds))
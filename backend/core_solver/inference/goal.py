@@ -0,0 +1,49 @@
+from core_solver.proof.methods import count_methods
+
+class Goal:
+    """
+    Mục tiêu của một lần suy diễn, VD: Goal("IS_CYCLIC", ["A", "B", "C", "D"]).
+    So khớp theo loại Fact và TẬP entity (không phụ thuộc thứ tự đỉnh);
+    entities=None nghĩa là Fact bất kỳ thuộc loại này.
+    """
+    def __init__(self, type_name, entities=None):
+        self.type = type_name
+        self.entities = frozenset(entities) if entities is not None else None
+
+    def find(self, kb):
+        """Fact đầu tiên khớp mục tiêu (hoặc None)."""
+        for f in kb.properties.get(self.type, []):
+            if self.entities is None or frozenset(f.entities) == self.entities:
+                return f
+        return None
+
+    def is_reached(self, kb, min_methods=1):
+        """Đã chứng minh được mục tiêu bằng ít nhất min_methods cách khác nhau chưa."""
+        f = self.find(kb)
+        return f is not None and count_methods(f) >= min_methods
+
+    def __repr__(self):
+        pts = "".join(sorted(self.entities)) if self.entities is not None else "*"
+        return f"Goal({self.type}, {pts})"
+
+
+class SolveResult:
+    """
+    Kết quả của InferenceEngine.solve(): vì sao dừng, sau bao nhiêu vòng, Fact mục tiêu (nếu có).
+    truncated=True nghĩa là KB chỉ là kết quả dở dang (hết ngân sách); detail cho biết ngân sách nào.
+    """
+    GOAL = "goal"                   # Fact mục tiêu đã có đủ số cách chứng minh
+    CONTRADICTION = "contradiction" # Phát hiện Fact CONTRADICTION
+    SATURATED = "saturated"         # Không còn tri thức mới
+    MAX_DEPTH = "max_depth"         # Đạt giới hạn vòng lặp
+    BUDGET = "budget"               # Hết ngân sách (Budget)
+
+    def __init__(self, stop_reason, rounds, goal_fact=None, truncated=False, detail=None):
+        self.stop_reason = stop_reason
+        self.rounds = rounds
+        self.goal_fact = goal_fact
+        self.truncated = truncated
+        self.detail = detail
+
+    def __repr__(self):
+        return f"SolveResult({self.stop_reason}, rounds={self.rounds})"
@@ -0,0 +1,181 @@
+"""
+Chứng minh song song theo từng cách (RuleCyclicMethod1..4) trên các tiến trình riêng.
+
+Mỗi job nhận một bản sao KB (đã phân tích đề), chạy bộ luật mặc định nhưng chỉ giữ MỘT
+luật tứ giác nội tiếp, và dừng ngay khi chứng minh được mục tiêu (hoặc gặp mâu thuẫn).
+Lời giải đầu tiên được trả về ngay (ProofRace.first), các job còn lại được thu tiếp tới hạn chót
+(ProofRace.collect) rồi gộp vào KB của lời giải đầu tiên (merge_outcomes).
+KB được gửi đi / nhận về dưới dạng nhị phân (core.serialization) thay vì pickle đồ thị đối tượng.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from core_solver.core import serialization
+from core_solver.inference.engine import InferenceEngine
+from core_solver.inference.goal import SolveResult
+from core_solver.inference.budget import Budget
+from core_solver.theorems.cyclic import RuleCyclicMethod1, RuleCyclicMethod2, RuleCyclicMethod3, RuleCyclicMethod4
+from core_solver.test_runner import default_rules
+from core_solver.utils import tracing
+
+_trace = tracing.get_tracer("engine")
+
+CYCLIC_METHODS = (RuleCyclicMethod1, RuleCyclicMethod2, RuleCyclicMethod3, RuleCyclicMethod4)
+DECISIVE = (SolveResult.GOAL, SolveResult.CONTRADICTION)
+
+
+class MethodOutcome:
+    """
+    Kết quả của một job: cách chứng minh, lý do dừng, thời gian, thống kê engine (EngineStats)
+    và (nếu quyết định được) KB + Fact mục tiêu.
+    """
+    def __init__(self, method, stop_reason, elapsed, kb=None, goal_fact=None, truncated=False, stats=None):
+        self.method = method
+        self.stop_reason = stop_reason
+        self.elapsed = elapsed
+        self.kb = kb
+        self.goal_fact = goal_fact
+        self.truncated = truncated
+        self.stats = stats
+
+    @property
+    def decisive(self): return self.stop_reason in DECISIVE
+
+    def __getstate__(self):
+        """Gửi về tiến trình chính: KB tuần tự hóa nhị phân, Fact mục tiêu theo khóa."""
+        state = self.__dict__.copy()
+        if self.kb is not None:
+            state["kb"] = serialization.dumps(self.kb)
+            state["goal_fact"] = self.goal_fact.key if self.goal_fact is not None else None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.kb is not None:
+            self.kb = serialization.loads(self.kb)
+            if self.goal_fact is not None: self.goal_fact = self.kb.facts[self.goal_fact]
+
+    def __repr__(self):
+        return f"MethodOutcome({self.method}, {self.stop_reason}, {self.elapsed * 1000:.1f} ms)"
+
+
+def method_rules(method):
+    """Bộ luật mặc định chỉ giữ lại một luật tứ giác nội tiếp (method)."""
+    return [r for r in default_rules() if not isinstance(r, CYCLIC_METHODS) or isinstance(r, method)]
+
+
+def _prove_with_method(payload, method_index, goal, min_methods, options, limits):
+    """Chạy trong tiến trình con: suy diễn trên bản sao KB với một cách chứng minh."""
+    method = CYCLIC_METHODS[method_index]
+    kb = serialization.loads(payload)
+    engine = InferenceEngine(kb, **options)
+    for rule in method_rules(method):
+        engine.add_rule(rule)
+
+    start = time.perf_counter()
+    result = engine.solve(goal, min_methods, stop_on_contradiction=True, budget=Budget(**limits))
+    elapsed = time.perf_counter() - start
+    if result.stop_reason not in DECISIVE:
+        return MethodOutcome(method.__name__, result.stop_reason, elapsed, truncated=result.truncated, stats=engine.stats)
+
+    if kb.rete is not None: kb.rete.close()
+    return MethodOutcome(method.__name__, result.stop_reason, elapsed, kb, result.goal_fact, result.truncated, engine.stats)
+
+
+class ProofRace:
+    """Các job đang chạy của một đề bài. Hạn chót (deadline) tính theo time.perf_counter()."""
+    def __init__(self, futures, deadline):
+        self._pending = dict(futures) # {future: tên cách chứng minh}
+        self.deadline = deadline
+        self.outcomes = []            # Theo thứ tự hoàn thành
+
+    def _wait(self, timeout):
+        done, _ = wait(list(self._pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            method = self._pending.pop(future)
+            try:
+                self.outcomes.append(future.result())
+            except Exception as e:
+                if _trace.is_error:
+                    _trace.error("job_failed", f"Job {method} lỗi: {e}", method=method, error=repr(e))
+                self.outcomes.append(MethodOutcome(method, "error", 0.0))
+        return done
+
+    def _remaining(self, timeout=None):
+        remaining = max(0.0, self.deadline - time.perf_counter())
+        return remaining if timeout is None else min(remaining, timeout)
+
+    def first(self, timeout=None):
+        """Chờ tới khi có job quyết định được (chứng minh xong / mâu thuẫn); None nếu hết giờ hoặc mọi job đều thất bại."""
+        while True:
+            decisive = [o for o in self.outcomes if o.decisive]
+            if decisive: return decisive[0]
+            if not self._pending: return None
+            remaining = self._remaining(timeout)
+            if remaining <= 0 or not self._wait(remaining): return None
+
+    def collect(self, timeout=None):
+        """Thu kết quả các job còn lại tới hạn chót (hoặc timeout); job chưa xong bị bỏ."""
+        while self._pending:
+            remaining = self._remaining(timeout)
+            if remaining <= 0 or not self._wait(remaining): break
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        return list(self.outcomes)
+
+
+class ParallelProver:
+    """
+    Pool tiến trình dùng chung giữa các request. Mỗi submit() tạo một ProofRace gồm
+    len(CYCLIC_METHODS) job; mỗi job tự dừng khi hết time_limit (Budget trong tiến trình con).
+    """
+    def __init__(self, max_workers=None, **engine_options):
+        self.max_workers = max_workers or len(CYCLIC_METHODS)
+        self.engine_options = engine_options or {"semi_naive": True, "stratified": True}
+        self._pool = None
+
+    def submit(self, kb, goal, min_methods=1, time_limit=3.0, **limits):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        payload = serialization.dumps(kb)
+        limits = dict(limits, time_limit=time_limit)
+        futures = {
+            self._pool.submit(_prove_with_method, payload, i, goal, min_methods, self.engine_options, limits): method.__name__
+            for i, method in enumerate(CYCLIC_METHODS)
+        }
+        return ProofRace(futures, time.perf_counter() + time_limit)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def import_derivation(kb, source_kb, fact, fact_map=None):
+    """Chép Fact cùng toàn bộ chuỗi suy diễn (tổ tiên qua parents) từ source_kb vào kb."""
+    fact_map = {} if fact_map is None else fact_map
+    ancestors = {}
+    stack = [fact]
+    while stack:
+        f = stack.pop()
+        if id(f) in ancestors: continue
+        ancestors[id(f)] = f
+        for src in f.sources:
+            stack.extend(src.parents)
+    for f in sorted(ancestors.values(), key=lambda f: f.id):
+        kb.import_fact(source_kb, f, fact_map)
+    return fact_map.get(fact)
+
+
+def merge_outcomes(first, outcomes):
+    """
+    Gộp các cách chứng minh của những job khác vào KB của lời giải đầu tiên.
+    Trả về Fact mục tiêu (trong first.kb) đã có thêm source của các cách khác.
+    """
+    target = first.goal_fact
+    for outcome in outcomes:
+        if outcome is first or outcome.stop_reason != SolveResult.GOAL or outcome.goal_fact is None: continue
+        merged = import_derivation(first.kb, outcome.kb, outcome.goal_fact)
+        if target is None: target = merged
+    return target
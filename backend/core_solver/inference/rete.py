@@ -0,0 +1,250 @@
+"""
+Mạng so khớp mẫu kiểu Rete cho các luật khai báo mẫu (PatternRule).
+
+Luật mô tả các Fact nó cần (theo loại) và điều kiện ghép giữa chúng (số điểm chung tối thiểu
++ điều kiện bổ sung). ReteNetwork lắng nghe KnowledgeGraph (add_property / add_equality) và cập nhật
+bộ nhớ alpha (Fact theo từng mẫu) / beta (các bộ ghép dở dang) tăng dần, nên chi phí tỉ lệ với số
+match MỚI thay vì bình phương kích thước KB. Khi không gắn vào mạng, luật tự liệt kê match (naive).
+Tập điểm của Fact / bộ ghép là bitmask theo id điểm của KB (kb.point_mask), chỉ mục theo từng bit.
+"""
+from abc import abstractmethod
+from core_solver.inference.base_rule import GeometricRule
+
+
+class Pattern:
+    """
+    Một mẫu trong luật: Fact loại type_name, gắn vào biến var.
+    - test(fact): lọc từng Fact (alpha), None = nhận mọi Fact.
+    - points(fact): các điểm của Fact dùng để ghép (mặc định: entities).
+    - min_shared / max_shared: số điểm chung tối thiểu / tối đa (None = không giới hạn) với các Fact
+      đã khớp ở các mẫu trước (min_shared > 0 dùng chỉ mục theo điểm).
+    - where(bindings, fact): điều kiện ghép bổ sung, bindings = {var: Fact} của các mẫu trước.
+    """
+    def __init__(self, type_name, var, test=None, points=None, min_shared=0, max_shared=None, where=None):
+        self.type_name = type_name
+        self.var = var
+        self.test = test
+        self.points = points
+        self.min_shared = min_shared
+        self.max_shared = max_shared
+        self.where = where
+
+    def point_mask(self, kb, fact):
+        return kb.point_mask(self.points(fact)) if self.points else kb.fact_mask(fact)
+
+    def accepts(self, fact):
+        return fact.type == self.type_name and (self.test is None or self.test(fact))
+
+
+class PatternRule(GeometricRule):
+    """
+    Luật khai báo mẫu. Lớp con định nghĩa:
+    - patterns: danh sách Pattern (ghép trái sang phải);
+    - symmetric: hai mẫu đầu cùng loại => mỗi cặp không thứ tự chỉ khớp một lần (Fact có id nhỏ đứng trước);
+    - refire_on: các loại Fact mà khi có Fact mới / được cập nhật thì các match hiện có được xét lại
+      (dùng khi fire() còn tra cứu thêm dữ liệu ngoài mẫu, VD: độ dài cạnh);
+    - refire_keys / match_key: chỉ xét lại các match có khóa bị Fact đó ảnh hưởng (mặc định: mọi match);
+    - fire(kb, match): xử lý một match ({var: Fact}), trả về True nếu sinh tri thức mới.
+    """
+    patterns = ()
+    symmetric = False
+    refire_on = ()
+
+    @abstractmethod
+    def fire(self, kb, match) -> bool:
+        pass
+
+    def refire_keys(self, kb, fact):
+        """Khóa của các match cần xét lại khi fact (loại refire_on) mới / được cập nhật. None = mọi match."""
+        return None
+
+    def match_key(self, kb, match):
+        """Khóa của match để so với refire_keys (None = match chỉ được xét lại cùng mọi match)."""
+        return None
+
+    def apply(self, kb) -> bool:
+        network = kb.rete # ReteNetwork gắn với KB này (nếu có)
+        if network is not None and network.has_rule(self):
+            tokens = network.take(self)
+        else:
+            tokens = self.naive_matches(kb)
+
+        changed = False
+        for i, token in enumerate(tokens):
+            try:
+                if self.fire(kb, self.bind(token)):
+                    changed = True
+            except Exception:
+                # Bị ngắt giữa chừng (hết ngân sách, lỗi): trả các match chưa xử lý xong về hàng chờ
+                if network is not None and network.has_rule(self): network.requeue(self, tokens[i:])
+                raise
+        return changed
+
+    def apply_delta(self, kb, delta) -> bool:
+        # Mạng Rete đã tự theo dõi phần thay đổi
+        return self.apply(kb)
+
+    def bind(self, token):
+        return {p.var: f for p, f in zip(self.patterns, token)}
+
+    def naive_matches(self, kb):
+        """Liệt kê toàn bộ match bằng cách nạp mọi Fact hiện có vào một mạng tạm."""
+        net = _RuleNet(self, kb)
+        for f in sorted(_facts_of(kb, net.types), key=lambda f: f.id):
+            net.feed(f)
+        net.refire()
+        return net.take()
+
+
+def _facts_of(kb, types):
+    for t in types:
+        yield from kb.properties.get(t, [])
+
+
+def _bits(mask):
+    """Các id điểm (vị trí bit 1) trong mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _candidates(index, items, mask, min_shared):
+    """Các phần tử (obj, mask) có chung ít nhất một điểm với mask (hoặc tất cả nếu không cần điểm chung)."""
+    if min_shared <= 0: return items
+    found = {}
+    for p in _bits(mask):
+        for item in index.get(p, ()):
+            found[id(item[0])] = item
+    return found.values()
+
+
+def _index(index, item, mask):
+    for p in _bits(mask):
+        index.setdefault(p, []).append(item)
+
+
+class _RuleNet:
+    """Bộ nhớ alpha/beta của một PatternRule (ghép trái sâu: mức k = k+1 mẫu đầu đã khớp)."""
+    def __init__(self, rule, kb):
+        self.rule = rule
+        self.kb = kb
+        self.patterns = list(rule.patterns)
+        n = len(self.patterns)
+        self.types = {p.type_name for p in self.patterns}
+        self.alpha = [[] for _ in range(n)]        # [(fact, mask)] theo từng mẫu
+        self.alpha_index = [{} for _ in range(n)]  # {id điểm: [(fact, mask)]}
+        self.tokens = [[] for _ in range(n)]       # [(token, mask)] đã khớp k+1 mẫu đầu
+        self.token_index = [{} for _ in range(n)]
+        self.matches = []                          # Mọi match hoàn chỉnh
+        self.keyed = {}                            # {khóa (rule.match_key): [match]}
+        self.pending = {}                          # Match chờ fire (giữ thứ tự, không trùng)
+
+    def feed(self, fact):
+        for k, p in enumerate(self.patterns):
+            if p.accepts(fact):
+                self._right_activate(k, fact)
+
+    def _right_activate(self, k, fact):
+        pattern = self.patterns[k]
+        mask = pattern.point_mask(self.kb, fact)
+        item = (fact, mask)
+        self.alpha[k].append(item)
+        _index(self.alpha_index[k], item, mask)
+
+        if k == 0:
+            self._add_token(0, (fact,), mask)
+            return
+        for token, tmask in list(_candidates(self.token_index[k - 1], self.tokens[k - 1], mask, pattern.min_shared)):
+            if self._joinable(k, token, tmask, fact, mask):
+                self._add_token(k, token + (fact,), tmask | mask)
+
+    def _add_token(self, k, token, mask):
+        if k == len(self.patterns) - 1:
+            self.matches.append(token)
+            self.pending[token] = None
+            key = self.rule.match_key(self.kb, self.rule.bind(token))
+            if key is not None: self.keyed.setdefault(key, []).append(token)
+            return
+
+        item = (token, mask)
+        self.tokens[k].append(item)
+        _index(self.token_index[k], item, mask)
+
+        nxt = self.patterns[k + 1]
+        for fact, fmask in list(_candidates(self.alpha_index[k + 1], self.alpha[k + 1], mask, nxt.min_shared)):
+            if self._joinable(k + 1, token, mask, fact, fmask):
+                self._add_token(k + 1, token + (fact,), mask | fmask)
+
+    def _joinable(self, k, token, tmask, fact, fmask):
+        if any(f is fact for f in token): return False
+        pattern = self.patterns[k]
+        shared = (tmask & fmask).bit_count()
+        if shared < pattern.min_shared: return False
+        if pattern.max_shared is not None and shared > pattern.max_shared: return False
+        if k == 1 and self.rule.symmetric and fact.id < token[0].id: return False
+        if pattern.where is not None and not pattern.where(self.rule.bind(token), fact): return False
+        return True
+
+    def refire(self, keys=None):
+        """Xếp lại các match có khóa trong keys (None = mọi match)."""
+        if keys is None:
+            self.pending.update(dict.fromkeys(self.matches))
+            return
+        for key in keys:
+            self.pending.update(dict.fromkeys(self.keyed.get(key, ())))
+
+    def take(self):
+        """Lấy các match đang chờ theo thứ tự id Fact (giống thứ tự của vòng lặp lồng nhau)."""
+        tokens = sorted(self.pending, key=lambda t: tuple(f.id for f in t))
+        self.pending = {}
+        return tokens
+
+
+class ReteNetwork:
+    """
+    Biên dịch các PatternRule của một KnowledgeGraph và cập nhật tăng dần qua kb.subscribe().
+    Mỗi KB có tối đa một mạng (kb.rete), dùng chung cho mọi engine chạy trên KB đó.
+    - Fact mới: đi qua bộ nhớ alpha của các mẫu cùng loại rồi ghép với bộ nhớ beta.
+    - Fact mới hoặc được cập nhật thuộc loại refire_on: xếp lại các match của luật đó (theo rule.refire_keys).
+    """
+    def __init__(self, kb):
+        self.kb = kb
+        self._nets = {}     # {rule: _RuleNet}
+        self._by_type = {}  # {loại Fact: [_RuleNet]}
+        self._refire = {}   # {loại Fact: [_RuleNet]}
+        kb.subscribe(self._on_fact)
+        kb.rete = self
+
+    def add_rule(self, rule):
+        net = _RuleNet(rule, self.kb)
+        self._nets[rule] = net
+        for t in net.types:
+            self._by_type.setdefault(t, []).append(net)
+        for t in rule.refire_on:
+            self._refire.setdefault(t, []).append(net)
+
+        # Nạp các Fact đã có
+        for f in sorted(_facts_of(self.kb, net.types), key=lambda f: f.id):
+            net.feed(f)
+
+    def _on_fact(self, fact, is_new):
+        if is_new:
+            for net in self._by_type.get(fact.type, ()):
+                net.feed(fact)
+        for net in self._refire.get(fact.type, ()):
+            net.refire(net.rule.refire_keys(self.kb, fact))
+
+    def has_rule(self, rule):
+        return rule in self._nets
+
+    def take(self, rule):
+        return self._nets[rule].take()
+
+    def requeue(self, rule, tokens):
+        """Đưa lại các match đã lấy ra (take) nhưng chưa fire xong vào hàng chờ của luật."""
+        self._nets[rule].pending.update(dict.fromkeys(tokens))
+
+    def close(self):
+        self.kb.unsubscribe(self._on_fact)
+        if self.kb.rete is self: self.kb.rete = None
@@ -0,0 +1,103 @@
+"""
+Phiên giải (session): giữ KB đã suy diễn cùng engine trong bộ nhớ để thêm giả thiết rồi giải tiếp.
+
+Engine giữ nguyên trạng thái giữa các lần solve(): mốc semi-naive của từng luật, chữ ký đầu vào
+(_has_new_input), mạng Rete gắn với KB, lịch sử agenda. Vì vậy sau khi thêm Fact, solve() chỉ xử lý
+phần mới thay vì bão hòa lại từ đầu; parser cũng được giữ để không phải phân tích lại đề cũ.
+Ngoại lệ: vài luật dùng giả định thế giới đóng "hai tia không trùng nhau" (VD: RuleCyclicMethod3), Fact suy ra
+theo giả định đó không bị rút lại. Vì vậy giả thiết mới làm đổi đường thẳng / tia (kb.line_version) thì phiên được
+dựng lại: KB + engine mới, nạp lại mọi dữ kiện của parser rồi suy diễn lại từ đầu. Tương tự khi giả thiết mới
+khai báo đa giác: parser dựa vào đa giác đã có để hiểu góc một điểm / góc ngoài của các dữ kiện trước đó.
+SessionStore giới hạn số phiên (bỏ phiên ít dùng nhất - LRU) và thời gian sống của phiên.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Dữ kiện làm thay đổi cách parser hiểu các dữ kiện khác (xem LLMParser._normalize_single_angles / góc ngoài)
+CONTEXT_TYPES = ("QUADRILATERAL", "TRIANGLE", "RENDER_ORDER")
+
+
+class Session:
+    """
+    Một phiên: KB + engine + parser. lock tuần tự hóa các lần cập nhật / suy diễn trên cùng phiên.
+    factory() trả về cặp (kb, engine) mới đã cấu hình như phiên, dùng khi phải dựng lại phiên.
+    """
+    def __init__(self, session_id, kb, engine, parser=None, factory=None):
+        self.id = session_id
+        self.kb = kb
+        self.engine = engine
+        self.parser = parser
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.created = self.last_used = time.monotonic()
+        self.solves = 0   # Số lần suy diễn trên phiên
+        self.rebuilds = 0 # Số lần phải dựng lại KB
+
+    def add_hypotheses(self, items=None, text=None):
+        """
+        Thêm giả thiết (JSON và / hoặc văn bản) qua parser. Chỉ thêm đơn điệu thì KB + engine được giữ để
+        suy diễn tiếp; nếu đường thẳng / tia thay đổi hoặc có đa giác mới thì phiên được dựng lại.
+        Trả về True nếu đã dựng lại.
+        """
+        version, seen = self.kb.line_version, len(self.parser.items)
+        if items: self.parser.add_items(items)
+        if text: self.parser.parse(text)
+        new_context = any(item.get("type") in CONTEXT_TYPES for item in self.parser.items[seen:])
+        if self.kb.line_version == version and not new_context: return False
+        self.rebuild()
+        return True
+
+    def rebuild(self):
+        """KB + engine mới (factory) với toàn bộ giả thiết đã có, chưa suy diễn."""
+        kb, engine = self.factory()
+        self.parser = self.parser.replay(kb)
+        self.kb, self.engine = kb, engine
+        self.rebuilds += 1
+
+    def __repr__(self):
+        return f"Session({self.id}, {len(self.kb.facts)} facts, {self.solves} solves)"
+
+
+class SessionStore:
+    """
+    Các phiên đang mở, sắp theo lần dùng gần nhất. Tối đa max_sessions phiên (thêm mới => bỏ phiên cũ nhất),
+    phiên không được dùng quá ttl giây (None = không hết hạn) bị bỏ khi truy cập. An toàn đa luồng.
+    """
+    def __init__(self, max_sessions=64, ttl=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict() # {id: Session}, cũ nhất đứng đầu
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def create(self, kb, engine, parser=None, factory=None):
+        session = Session(uuid.uuid4().hex, kb, engine, parser, factory)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        """Phiên theo id (đánh dấu vừa dùng), None nếu không có / đã bị bỏ / hết hạn."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None: return None
+            if self.ttl is not None and now - session.last_used > self.ttl:
+                del self._sessions[session_id]
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
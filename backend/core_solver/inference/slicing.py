@@ -0,0 +1,125 @@
+"""
+Cắt lát KB theo mức liên quan tới mục tiêu trước khi suy diễn.
+
+Đề bài thường khai báo thêm tam giác, đường tròn, đường cao, điểm đối xứng... không dính tới
+tứ giác cần chứng minh. Lát cắt chỉ giữ các Fact:
+- thuộc loại mà các luật trong phạm vi suy diễn lùi của mục tiêu có đọc (BackwardPlanner);
+- liên thông với các điểm của mục tiêu trên đồ thị điểm - Fact (tối đa radius bước nếu có).
+Fact thẳng hàng (LINE_TYPES) chạm tới lát cắt luôn được giữ: thiếu chúng, các luật dùng giả định
+"hai tia không trùng nhau" sẽ suy ra sai trên lát cắt.
+Khi giới hạn bán kính, đường tròn (PROJECTED_TYPES) không nối mọi điểm trên nó với nhau: lát cắt chỉ giữ
+tâm và các điểm đã thuộc lát cắt (vẫn đúng vì là tập con các điểm cùng thuộc đường tròn).
+InferenceEngine chạy trên lát cắt trước, nếu không chứng minh được thì chạy lại trên KB đầy đủ.
+"""
+from collections import deque
+from core_solver.core.entities import Point
+from core_solver.core.knowledge_base import KnowledgeGraph, LINE_TYPES, make_fact_key
+from core_solver.inference.agenda import fact_points, object_points
+from core_solver.inference.backward import BackwardPlanner
+
+PROJECTED_TYPES = ("CIRCLE",) # Fact = [tâm, các điểm trên đường tròn], có thể cắt bớt điểm
+
+
+def relevant_types(rules, goal_types, max_depth=15):
+    """Các loại Fact có thể ảnh hưởng tới goal_types (mục tiêu + mọi mục tiêu con)."""
+    planner = BackwardPlanner(rules)
+    return planner.subgoals(goal_types, planner.depth_limit(goal_types, max_depth)) | frozenset(goal_types)
+
+
+def goal_points(kb, goal, rules):
+    """
+    Điểm của goal cùng các điểm thuộc mục tiêu con cụ thể (góc, đoạn thẳng) mà các luật ghi trực tiếp
+    loại mục tiêu cần biết (rule.goal_entities). Luật không xác định được mục tiêu con thì bỏ qua.
+    """
+    points = set(goal.entities or ())
+    for rule in BackwardPlanner(rules).writers(goal.type):
+        for obj in rule.goal_entities(kb, goal) or ():
+            points |= object_points(obj)
+    return points
+
+
+def relevant_facts(kb, goal, rules, max_depth=15, radius=None, seeds=None):
+    """
+    Trả về (danh sách Fact theo thứ tự id, tập tên điểm) của lát cắt quanh seeds (mặc định goal.entities).
+    Fact không nhắc tới điểm nào được giữ nếu thuộc loại liên quan (không đủ thông tin để loại).
+    """
+    types = relevant_types(rules, [goal.type], max_depth)
+    candidates = [f for t in types for f in kb.properties.get(t, [])]
+
+    points_of = {}
+    facts_at = {} # {điểm: [Fact]}
+    for f in candidates:
+        pts = fact_points(kb, f)
+        points_of[f] = pts
+        for p in pts:
+            facts_at.setdefault(p, []).append(f)
+
+    # BFS trên siêu đồ thị điểm - Fact, xuất phát từ các điểm của mục tiêu
+    seeds = goal.entities if seeds is None else seeds
+    dist = {p: 0 for p in seeds}
+    queue = deque(seeds)
+    while queue:
+        p = queue.popleft()
+        if radius is not None and dist[p] >= radius: continue
+        for f in facts_at.get(p, ()):
+            if radius is not None and f.type in PROJECTED_TYPES: continue
+            for q in points_of[f]:
+                if q not in dist:
+                    dist[q] = dist[p] + 1
+                    queue.append(q)
+
+    # Giữ trọn các Fact thẳng hàng chạm tới lát cắt (kéo theo điểm của chúng)
+    lines = [f for f in candidates if f.type in LINE_TYPES]
+    grown = radius is not None
+    while grown:
+        grown = False
+        for f in lines:
+            if points_of[f] & dist.keys() and not points_of[f] <= dist.keys():
+                for q in points_of[f]: dist.setdefault(q, radius + 1)
+                grown = True
+
+    # Đường tròn qua ít nhất 2 điểm của lát cắt: giữ lại (kèm tâm), build_slice cắt bớt các điểm còn lại
+    for f in candidates:
+        if f.type in PROJECTED_TYPES and radius is not None and len(points_of[f] & dist.keys()) >= 2:
+            dist.setdefault(f.entities[0], radius + 1)
+
+    selected = [f for f in candidates
+                if not points_of[f] or points_of[f] <= dist.keys()
+                or (f.type in PROJECTED_TYPES and f.entities[0] in dist and len(points_of[f] & dist.keys()) >= 3)]
+    selected.sort(key=lambda f: f.id)
+    return selected, set(dist)
+
+
+def build_slice(kb, facts, points):
+    """KB mới chỉ gồm các Fact (và điểm) đã chọn. Trả về (slice_kb, {Fact gốc: Fact trong lát cắt})."""
+    slice_kb = KnowledgeGraph()
+    for name in sorted(points):
+        obj = kb.id_map.get(name)
+        if isinstance(obj, Point): slice_kb.register_object(obj)
+    fact_map = {}
+    for f in facts:
+        if f.type in PROJECTED_TYPES and not fact_points(kb, f) <= points:
+            _import_projected(slice_kb, kb, f, points, fact_map)
+        else:
+            slice_kb.import_fact(kb, f, fact_map)
+    return slice_kb, fact_map
+
+
+def _import_projected(slice_kb, kb, fact, points, fact_map):
+    """Chép Fact đường tròn chỉ với tâm và các điểm thuộc points; Fact chép được ánh xạ về Fact gốc."""
+    kept = [e for i, e in enumerate(fact.entities) if i == 0 or e in points]
+    objs = [kb.id_map.get(e, e) for e in kept]
+    extra = {k: getattr(fact, k) for k in fact.OPTIONAL_FIELDS if hasattr(fact, k)}
+    for s in fact.sources:
+        parents = [fact_map.get(p) or slice_kb.facts.get(p.key, p) for p in s.parents]
+        slice_kb.add_property(fact.type, objs, s.reason, value=fact.value, parents=parents, **extra)
+    copied = slice_kb.facts.get(make_fact_key(fact.type, kept, fact.value))
+    if copied is not None: fact_map[fact] = copied
+
+
+def import_derived(slice_kb, kb, marker, fact_map):
+    """
+    Đưa tri thức suy ra trên lát cắt (kể từ marker) về KB gốc.
+    fact_map: {Fact gốc: Fact trong lát cắt} lúc dựng lát cắt.
+    """
+    kb.merge(slice_kb, marker, {v: k for k, v in fact_map.items()})
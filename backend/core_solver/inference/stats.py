@@ -0,0 +1,120 @@
+import json
+
+class RuleStats:
+    """Số liệu cộng dồn của một luật (hoặc của một luật trong một vòng)."""
+    FIELDS = ("calls", "skipped", "time", "facts_added", "sources_added", "exceptions")
+
+    def __init__(self, rule, module):
+        self.rule = rule       # Tên lớp luật, VD: RuleCyclicMethod4
+        self.module = module   # Module định lý, VD: core_solver.theorems.cyclic
+        self.calls = 0         # Số lần luật thực sự được chạy
+        self.skipped = 0       # Số lần bị bỏ qua vì đầu vào không đổi
+        self.time = 0.0        # Tổng thời gian chạy (giây)
+        self.facts_added = 0   # Số Fact mới
+        self.sources_added = 0 # Số source mới (kể cả source đầu tiên của Fact mới)
+        self.exceptions = 0
+
+    def add(self, other):
+        for k in self.FIELDS:
+            setattr(self, k, getattr(self, k) + getattr(other, k))
+
+    def to_dict(self):
+        d = {"rule": self.rule, "module": self.module}
+        d.update({k: getattr(self, k) for k in self.FIELDS})
+        return d
+
+
+class EngineStats:
+    """
+    Thống kê hiệu năng của InferenceEngine theo từng luật và từng vòng.
+    - rounds[i]: {tên luật: RuleStats} của vòng thứ i + 1, labels[i]: nhãn của vòng đó
+      (VD: "round_3", hoặc "stratum_2;round_1" khi chạy phân tầng).
+    - Xuất ra dict/JSON (API, CLI), bảng văn bản, hoặc dạng "folded" cho flame graph.
+    """
+    def __init__(self):
+        self.rounds = []
+        self.labels = []
+        self.total_time = 0.0
+        self.stop_reason = None
+
+    def start_round(self, label=None):
+        self.rounds.append({})
+        self.labels.append(label or f"round_{len(self.rounds)}")
+
+    def _entry(self, rule):
+        if not self.rounds: self.start_round()
+        cls = type(rule)
+        current = self.rounds[-1]
+        if cls.__name__ not in current:
+            current[cls.__name__] = RuleStats(cls.__name__, cls.__module__)
+        return current[cls.__name__]
+
+    def record_skip(self, rule):
+        self._entry(rule).skipped += 1
+
+    def record_call(self, rule, elapsed, facts_added, sources_added, failed=False):
+        s = self._entry(rule)
+        s.calls += 1
+        s.time += elapsed
+        s.facts_added += facts_added
+        s.sources_added += sources_added
+        if failed: s.exceptions += 1
+
+    # ==========================================================================
+    # TỔNG HỢP
+    # ==========================================================================
+    def per_rule(self):
+        """Cộng dồn qua mọi vòng, sắp theo thời gian giảm dần."""
+        totals = {}
+        for rnd in self.rounds:
+            for name, s in rnd.items():
+                if name not in totals: totals[name] = RuleStats(s.rule, s.module)
+                totals[name].add(s)
+        return sorted(totals.values(), key=lambda s: s.time, reverse=True)
+
+    def per_module(self):
+        """Thời gian theo module định lý: {module: giây}."""
+        modules = {}
+        for s in self.per_rule():
+            modules[s.module] = modules.get(s.module, 0.0) + s.time
+        return dict(sorted(modules.items(), key=lambda kv: kv[1], reverse=True))
+
+    def to_dict(self):
+        return {
+            "total_time": self.total_time,
+            "stop_reason": self.stop_reason,
+            "round_count": len(self.rounds),
+            "rules": [s.to_dict() for s in self.per_rule()],
+            "modules": self.per_module(),
+            "rounds": [
+                [dict(s.to_dict(), round=i + 1, label=label) for s in rnd.values()]
+                for i, (label, rnd) in enumerate(zip(self.labels, self.rounds))
+            ],
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def format_table(self):
+        """Bảng văn bản theo luật, luật tốn thời gian nhất ở trên."""
+        header = f"{'Rule':<36}{'Calls':>7}{'Skip':>6}{'Time (ms)':>11}{'Facts':>7}{'Srcs':>6}{'Err':>5}"
+        lines = [header, "-" * len(header)]
+        for s in self.per_rule():
+            lines.append(f"{s.rule:<36}{s.calls:>7}{s.skipped:>6}{s.time * 1000:>11.2f}"
+                         f"{s.facts_added:>7}{s.sources_added:>6}{s.exceptions:>5}")
+        lines.append("-" * len(header))
+        lines.append(f"Tổng: {self.total_time * 1000:.2f} ms, {len(self.rounds)} vòng, dừng do: {self.stop_reason}")
+        return "\n".join(lines)
+
+    def to_folded(self):
+        """
+        Định dạng "folded stacks" (mỗi dòng: khung;khung;... giá_trị) dùng cho flamegraph.pl / speedscope.
+        Giá trị là micro giây.
+        """
+        lines = []
+        for label, rnd in zip(self.labels, self.rounds):
+            for s in rnd.values():
+                us = int(round(s.time * 1e6))
+                if us > 0:
+                    lines.append(f"solve;{label};{s.module};{s.rule} {us}")
+        return "\n".join(lines)
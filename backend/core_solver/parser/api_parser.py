@@ -1,3 +1,4 @@
+import copy
 import json
 import re
 import os
@@ -5,18 +6,23 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from core_solver.core.entities import Point, Angle, Segment
 from core_solver.core.knowledge_base import KnowledgeGraph
+from core_solver.utils import tracing
+
+_trace = tracing.get_tracer("parser")
 
 load_dotenv()
 
 class LLMParser:
     def __init__(self, kb: KnowledgeGraph):
         self.kb = kb
+        self.items = []           # Mọi dữ kiện JSON đã đưa vào KB (để dựng lại KB khác - xem replay)
+        self.fallback_goal = None # Tên 4 điểm tứ giác lấy bằng regex khi đề không có RENDER_ORDER
         
         # 1. CẤU HÌNH API KEY
         api_key = os.getenv("GOOGLE_API_KEY")
         modelName = os.getenv("GEMINI_MODEL_v2")
         if not api_key:
-            print("CẢNH BÁO: Chưa có GOOGLE_API_KEY_v2 trong file .env")
+            if _trace.is_warning: _trace.warning("missing_api_key", "Chưa có GOOGLE_API_KEY_v2 trong file .env")
         
         if api_key:
             genai.configure(api_key=api_key)
@@ -75,17 +81,19 @@ class LLMParser:
                             
                             # Cập nhật lại item thành 3 điểm chuẩn
                             item["points"] = [prev_pt, vertex, next_pt]
-                            print(f"   [Auto-Fix] Chuẩn hóa góc đơn: {vertex} -> {prev_pt}{vertex}{next_pt}")
+                            if _trace.is_info:
+                                _trace.info("auto_fix", f"Chuẩn hóa góc đơn: {vertex} -> {prev_pt}{vertex}{next_pt}")
                         except:
                             pass
                             
         return items
 
     def parse(self, text: str):
-        print(f"--- GỬI ĐỀ BÀI VÀO GEMINI API ({self.model_name}) ---\n'{text}'")
+        if _trace.is_info:
+            _trace.info("request", f"Gửi đề bài vào Gemini API ({getattr(self, 'model_name', None)})", text=text)
         
         if not self.model:
-            print("Lỗi: Model chưa được khởi tạo do thiếu API Key.")
+            if _trace.is_error: _trace.error("no_model", "Model chưa được khởi tạo do thiếu API Key.")
             return
 
         system_msg = self._get_system_prompt()
@@ -95,12 +103,12 @@ class LLMParser:
             response = self.model.generate_content(full_prompt)
             
             raw_content = response.text
-            print(f"--- RAW OUTPUT ---\n{raw_content}") 
+            if _trace.is_debug: _trace.debug("raw_output", raw_content)
 
             json_data = self._extract_json(raw_content)
             
             if json_data:
-                print("--- NHẬN ĐƯỢC JSON HỢP LỆ ---")
+                if _trace.is_debug: _trace.debug("json_ok", "Nhận được JSON hợp lệ", items=len(json_data))
                 
                 fixed_data = self._validate_and_fix_hallucinations(json_data, text)
                 fixed_data = self._normalize_single_angles(fixed_data)
@@ -110,16 +118,45 @@ class LLMParser:
                 if "RENDER_ORDER" not in self.kb.properties:
                     match_quad = re.search(r'tứ giác\s+([A-Za-z]{4})', text, re.IGNORECASE)
                     if match_quad:
-                        pts = [Point(c) for c in match_quad.group(1).upper()]
-                        self.kb.add_property("RENDER_ORDER", pts, "Regex Fallback")
-                        self.kb.add_property("QUADRILATERAL", pts, "Regex Fallback")
-                        print(f"   [Auto-Fix] Tìm thấy mục tiêu chứng minh: {match_quad.group(1).upper()}")
+                        self.fallback_goal = match_quad.group(1).upper()
+                        self._add_fallback_goal()
+                        if _trace.is_info:
+                            _trace.info("auto_fix", f"Tìm thấy mục tiêu chứng minh: {self.fallback_goal}")
 
             else:
-                print("Không tìm thấy JSON hợp lệ.")
+                if _trace.is_warning: _trace.warning("json_missing", "Không tìm thấy JSON hợp lệ.")
 
         except Exception as e:
-            print(f"Lỗi khi gọi Gemini API: {e}")
+            if _trace.is_error: _trace.error("api_error", f"Lỗi khi gọi Gemini API: {e}", error=repr(e))
+
+    def add_items(self, items):
+        """
+        Thêm dữ kiện đã ở dạng JSON (cùng định dạng đầu ra của Gemini) vào KB, không gọi API.
+        Góc một điểm được chuẩn hóa theo tứ giác đã có trong KB nếu items không khai báo đa giác.
+        """
+        items = list(items) if isinstance(items, list) else [items]
+        context = [{"type": "QUADRILATERAL", "points": list(f.entities)}
+                   for f in self.kb.properties.get("QUADRILATERAL", [])[:1]]
+        self._normalize_single_angles(items + context) # Sửa trực tiếp trên các item
+        self._map_json_to_kb(items)
+
+    def replay(self, kb):
+        """
+        Parser mới trên KB kb (thường là KB trống) nạp lại toàn bộ dữ kiện parser này đã đưa vào, không gọi API.
+        Các lô dữ kiện được gộp thành một lần nạp - giống như khi cả đề bài được gửi một lần.
+        """
+        parser = copy.copy(self)
+        parser.kb = kb
+        parser.items = []
+        parser._map_json_to_kb(list(self.items))
+        if self.fallback_goal and "RENDER_ORDER" not in kb.properties:
+            parser._add_fallback_goal()
+        return parser
+
+    def _add_fallback_goal(self):
+        pts = [Point(c) for c in self.fallback_goal]
+        self.kb.add_property("RENDER_ORDER", pts, "Regex Fallback")
+        self.kb.add_property("QUADRILATERAL", pts, "Regex Fallback")
 
     def _get_system_prompt(self):
         return """Bạn là chuyên gia dữ liệu hình học phẳng (Geometry Entity Extractor). 
@@ -327,7 +364,8 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                         break
                 
                 if not is_valid:
-                    print(f"⚠️ Cảnh báo ảo giác: LLM sinh ra 'Tam giác {tri_name}' nhưng đề không có.")
+                    if _trace.is_warning:
+                        _trace.warning("hallucination", f"LLM sinh ra 'Tam giác {tri_name}' nhưng đề không có.", triangle=tri_name)
                     validated_items.append(item) 
                 else:
                     validated_items.append(item)
@@ -340,6 +378,7 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
         if not isinstance(items, list): items = [items]
 
         items.sort(key=lambda x: 0 if x.get("type") in ["QUADRILATERAL", "TRIANGLE"] else 1)
+        self.items.extend(items)
 
         for item in items:
             try:
@@ -351,8 +390,7 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                         self.kb.add_property("TRIANGLE", points, "LLM: Tam giác")
                         if "TRIANGLE" in self.kb.properties:
                             fact = self.kb.properties["TRIANGLE"][-1]
-                            fact.vertex = item.get("vertex")
-                            fact.properties = item.get("properties", [])
+                            self.kb.update_fact(fact, vertex=item.get("vertex"), properties=item.get("properties", []))
                             
                             props = item.get("properties", [])
                             vertex = item.get("vertex")
@@ -369,9 +407,8 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                         result = self.kb.add_property("QUADRILATERAL", points, "LLM Extracted")
                         fact = result if isinstance(result, object) and result is not True else (self.kb.properties["QUADRILATERAL"][-1] if "QUADRILATERAL" in self.kb.properties else None)
                         if fact:
-                            fact.subtype = item.get("subtype")
-                            fact.vertex = item.get("vertex")
-                        print(f"   [+] Tứ giác: {item.get('points')} ({item.get('subtype')})")
+                            self.kb.update_fact(fact, subtype=item.get("subtype"), vertex=item.get("vertex"))
+                        if _trace.is_debug: _trace.debug("map_item", f"Tứ giác: {item.get('points')} ({item.get('subtype')})")
 
                     elif kind == "RENDER_ORDER":
                         self.kb.add_property("RENDER_ORDER", points, "LLM Extracted")
@@ -406,9 +443,11 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                                 # VD: Góc(B, A, Ext_A) = 60
                                 ang = Angle(neighbor, v_obj, ext_p)
                                 self.kb.add_property("VALUE", [ang], f"Góc ngoài tại {vertex_name}", value=float(val), subtype="exterior_angle", vertex=vertex_name)
-                                print(f"   [+] Góc ngoài: Góc {neighbor.name}{vertex_name}{ext_p.name} = {val}")
+                                if _trace.is_debug:
+                                    _trace.debug("map_item", f"Góc ngoài: Góc {neighbor.name}{vertex_name}{ext_p.name} = {val}")
                             else:
-                                print(f"   [!] Không tìm thấy hàng xóm cho góc ngoài tại {vertex_name}")
+                                if _trace.is_warning:
+                                    _trace.warning("map_item", f"Không tìm thấy hàng xóm cho góc ngoài tại {vertex_name}")
 
                     elif subtype == "angle":
                         pts = item.get("points", [])
@@ -419,7 +458,7 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                                 p1, v, p3 = [Point(p) for p in pts]
                                 ang = Angle(p1, v, p3)
                                 self.kb.add_property("VALUE", [ang], f"Góc {v.name}={val}", value=float(val))
-                                print(f"   [+] Giá trị góc: Góc {v.name} = {val}")
+                                if _trace.is_debug: _trace.debug("map_item", f"Giá trị góc: Góc {v.name} = {val}")
 
                     elif subtype == "length":
                         pts = item.get("points", [])
@@ -490,8 +529,7 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                         self.kb.add_property("INTERSECTION", entities, f"Giao điểm {p_name}")
                         if "INTERSECTION" in self.kb.properties:
                             fact = self.kb.properties["INTERSECTION"][-1]
-                            fact.lines = lines
-                            fact.point = p_name
+                            self.kb.update_fact(fact, lines=lines, point=p_name)
 
                 elif kind == "MIDPOINT":
                     pt = item.get("point")
@@ -505,7 +543,7 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                     self.kb.add_property("CIRCLE", [Point(center)], f"Đường tròn tâm {center}")
                     if "CIRCLE" in self.kb.properties:
                         fact = self.kb.properties["CIRCLE"][-1]
-                        fact.center = center
+                        self.kb.update_fact(fact, center=center)
                     diameter = item.get("diameter")
                     if diameter and len(diameter) == 2:
                         pA, pB = diameter
@@ -532,7 +570,7 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                         if "CIRCLE" in self.kb.properties:
                             for c_fact in self.kb.properties["CIRCLE"]:
                                 if getattr(c_fact, 'center', None) == circle:
-                                    if pt not in c_fact.entities: c_fact.entities.append(pt) 
+                                    if pt not in c_fact.entities: self.kb.update_fact(c_fact, entities=c_fact.entities + [pt])
 
                 # Xử lý PHÂN GIÁC
                 elif kind == "BISECTOR":
@@ -585,4 +623,4 @@ Nhiệm vụ: Phân tích văn bản đề bài và trích xuất dữ liệu d
                         else: self.kb.register_object(Segment(p1, p2))
 
             except Exception as e:
-                print(f"   [!] Lỗi map item: {item} -> {e}")
\ No newline at end of file
+                if _trace.is_error: _trace.error("map_item_failed", f"Lỗi map item: {item} -> {e}", error=repr(e))
\ No newline at end of file
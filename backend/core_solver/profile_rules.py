@@ -0,0 +1,57 @@
+"""
+Đo thời gian chạy từng luật của InferenceEngine.
+
+Ví dụ (chạy từ thư mục backend):
+    python -m core_solver.profile_rules "Cho tam giác ABC nhọn, ..."      # Phân tích đề qua Gemini
+    python -m core_solver.profile_rules --json de_bai.json --format folded > solve.folded
+File --json chứa danh sách item đã trích xuất (cùng định dạng JSON mà LLMParser nhận từ Gemini),
+giúp đo lại nhiều lần mà không cần gọi API.
+"""
+import argparse
+import json
+
+from core_solver.parser.api_parser import LLMParser
+from core_solver.test_runner import setup_system
+from core_solver.utils import tracing
+
+
+def profile(text=None, items=None):
+    """
+    Giải một đề bài và trả về (kb, engine, SolveResult); số liệu nằm ở engine.stats.
+    items đi qua cùng bước tiền xử lý với đề bài gửi Gemini (chuẩn hóa góc một điểm) để đo đúng KB của /solve.
+    """
+    kb, engine = setup_system()
+    parser = LLMParser(kb)
+    if items is not None:
+        parser.add_items(items)
+    else:
+        parser.parse(text)
+    result = engine.solve()
+    return kb, engine, result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Thống kê thời gian / số Fact sinh ra theo từng luật.")
+    ap.add_argument("text", nargs="?", help="Đề bài (phân tích qua Gemini)")
+    ap.add_argument("--json", dest="json_path", help="File JSON các item đã trích xuất")
+    ap.add_argument("--format", choices=["table", "json", "folded"], default="table")
+    ap.add_argument("--verbose", action="store_true", help="In trace của parser/engine (mức info) ra stdout")
+    args = ap.parse_args(argv)
+    if args.verbose: tracing.configure("*=info", "stdout")
+
+    if args.json_path:
+        with open(args.json_path, encoding="utf-8") as f:
+            items = json.load(f)
+        _, engine, _ = profile(items=items)
+    elif args.text:
+        _, engine, _ = profile(text=args.text)
+    else:
+        ap.error("Cần đề bài hoặc --json")
+
+    if args.format == "json": print(engine.stats.to_json())
+    elif args.format == "folded": print(engine.stats.to_folded())
+    else: print(engine.stats.format_table())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# ==============================================================================
+# PHÂN LOẠI CÁCH CHỨNG MINH TỨ GIÁC NỘI TIẾP (theo lý do của từng source)
+# ==============================================================================
+
+# Thứ tự ưu tiên khi trình bày lời giải (số nhỏ trình bày trước)
+METHOD_PRIORITY = {
+    "METHOD_DEFINITION": 0,
+    "METHOD_EXTERIOR": 1,
+    "METHOD_TWO_RIGHT_ANGLES": 2,
+    "METHOD_SAME_ARC": 3,
+    "METHOD_SUM_180": 4,
+    "unknown": 99
+}
+
+def classify_method(reason):
+    """Trả về loại phương pháp của một lý do; lý do không nhận diện được thì là chính nó."""
+    if "luôn nội tiếp" in reason or "tính chất" in reason.lower() or "Hình chữ nhật" in reason:
+        return "METHOD_DEFINITION"
+    elif "Tổng hai góc đối" in reason: return "METHOD_SUM_180"
+    elif "cùng nhìn cạnh" in reason: return "METHOD_SAME_ARC"
+    elif "Góc ngoài" in reason: return "METHOD_EXTERIOR"
+    elif "cách đều" in reason: return "METHOD_EQUIDISTANT"
+    elif "góc đối vuông" in reason: return "METHOD_TWO_RIGHT_ANGLES"
+    return reason
+
+def count_methods(fact):
+    """Số cách chứng minh khác nhau (theo loại phương pháp) của một Fact."""
+    return len({classify_method(s.reason) for s in fact.sources})
@@ -1,4 +1,5 @@
 import re
+from core_solver.proof.methods import METHOD_PRIORITY, classify_method
 
 class ProofGenerator:
     def __init__(self, kb):
@@ -17,29 +18,9 @@ class ProofGenerator:
         unique_method_sources = []
         seen_methods = set()
 
-        METHOD_PRIORITY = {
-            "METHOD_DEFINITION": 0,
-            "METHOD_EXTERIOR": 1,
-            "METHOD_TWO_RIGHT_ANGLES": 2,
-            "METHOD_SAME_ARC": 3,
-            "METHOD_SUM_180": 4,
-            "unknown": 99
-        }
-
         candidates = []
         for source in target_fact.sources:
-            reason = source['reason']
-            method_type = "unknown"
-
-            if "luôn nội tiếp" in reason or "tính chất" in reason.lower() or "Hình chữ nhật" in reason:
-                method_type = "METHOD_DEFINITION"
-            elif "Tổng hai góc đối" in reason: method_type = "METHOD_SUM_180"
-            elif "cùng nhìn cạnh" in reason: method_type = "METHOD_SAME_ARC"
-            elif "Góc ngoài" in reason: method_type = "METHOD_EXTERIOR"
-            elif "cách đều" in reason: method_type = "METHOD_EQUIDISTANT"
-            elif "góc đối vuông" in reason: method_type = "METHOD_TWO_RIGHT_ANGLES"
-            else: method_type = reason
-
+            method_type = classify_method(source.reason)
             priority = METHOD_PRIORITY.get(method_type, 99)
             candidates.append((priority, method_type, source))
 
@@ -57,14 +38,14 @@ class ProofGenerator:
             
             lines = []
             
-            if len(unique_method_sources) > 1: header = f"🔷 CÁCH {i+1}: {source['reason']}"
+            if len(unique_method_sources) > 1: header = f"🔷 CÁCH {i+1}: {source.reason}"
             else: header = f"Cần chứng minh: {self._format_statement(target_fact)}"
             lines.append(header); lines.append("-" * 30) 
             
             prep_steps = []; other_steps = []
             for fact, src in self.steps:
                 if fact == target_fact: continue 
-                if not src['parents']: continue 
+                if not src.parents: continue 
                 text = self._verbalize_fact(fact, src, raw=True)
                 if text:
                     if fact.type == "VALUE": prep_steps.append(text)
@@ -79,7 +60,7 @@ class ProofGenerator:
             if conclusion: lines.append(conclusion)
             else:
                 stmt = self._format_statement(target_fact)
-                lines.append(f"➨ {stmt} ({source['reason']})")
+                lines.append(f"➨ {stmt} ({source.reason})")
             
             all_proofs_list.append("\n".join(lines))
 
@@ -87,8 +68,8 @@ class ProofGenerator:
 
     def _verbalize_fact(self, fact, source, raw=False):
         stmt = self._format_statement(fact)
-        parents = source['parents']
-        reason = source['reason']
+        parents = source.parents
+        reason = source.reason
 
         if fact.type == "VALUE":
             if fact.value == 90: return f"{reason} ➜ {stmt}"
@@ -108,7 +89,7 @@ class ProofGenerator:
                 
                 is_given = True
                 if hasattr(p, 'sources') and p.sources:
-                     if p.sources[0]['parents']: is_given = False
+                     if p.sources[0].parents: is_given = False
                 
                 note = "(giả thiết)" if is_given else "(chứng minh trên)"
                 
@@ -158,7 +139,7 @@ class ProofGenerator:
     def _collect_steps_from_source(self, source, fact):
         if fact.id in self.visited_facts: return
         self.visited_facts.add(fact.id)
-        for p in source['parents']:
+        for p in source.parents:
             if hasattr(p, 'sources') and p.sources:
                 self._collect_steps_from_source(p.sources[0], p)
         self.steps.append((fact, source))
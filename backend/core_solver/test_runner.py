@@ -18,52 +18,56 @@ from core_solver.theorems.cyclic import (
 )
 from core_solver.theorems.diagnostics import RuleCheckCyclicContradiction, RuleCheckCoincidentVertices
 
-def setup_system():
-    kb = KnowledgeGraph()
-    engine = InferenceEngine(kb)
-    
-    # Đăng ký luật (Cơ bản -> Phức tạp -> Chẩn đoán)
-    # Basic
-    engine.add_rule(RuleDefinePolygonEdges())
-    engine.add_rule(RuleTriangleAngleSum())
-    engine.add_rule(RulePerpendicularToValue())
-    engine.add_rule(RuleEqualityByValue())
-    engine.add_rule(RuleAngleBisector())
-    engine.add_rule(RuleSymmetry())
+def default_rules():
+    """Bộ luật mặc định, theo thứ tự đăng ký (Cơ bản -> Phức tạp -> Chẩn đoán)."""
+    return [
+        # Basic
+        RuleDefinePolygonEdges(),
+        RuleTriangleAngleSum(),
+        RulePerpendicularToValue(),
+        RuleEqualityByValue(),
+        RuleAngleBisector(),
+        RuleSymmetry(),
+
+        # Shapes
+        RuleEquilateralTriangle(),
+        RuleAltitudeProperty(),
+        RuleRightTriangle(),
+        RuleIsoscelesLineCoincidence(),
+        RuleClassifyQuadrilaterals(),
+        RuleMedianInRightTriangle(),
+        RuleExpandSpecialQuadProperties(),
 
-    # Shapes
-    engine.add_rule(RuleEquilateralTriangle())
-    engine.add_rule(RuleAltitudeProperty())
-    engine.add_rule(RuleRightTriangle())
-    engine.add_rule(RuleIsoscelesLineCoincidence())
-    engine.add_rule(RuleClassifyQuadrilaterals())
-    engine.add_rule(RuleMedianInRightTriangle())
-    engine.add_rule(RuleExpandSpecialQuadProperties())
-    
-    # Circles
-    engine.add_rule(RuleTangentProperty())
-    engine.add_rule(RuleDiameterThales())
-    engine.add_rule(RuleCircleRadii())
-    engine.add_rule(RuleCircleAnglesRelations())
-    engine.add_rule(RuleTangentChordTheorem())
-    engine.add_rule(RuleChordMidpoint())
+        # Circles
+        RuleTangentProperty(),
+        RuleDiameterThales(),
+        RuleCircleRadii(),
+        RuleCircleAnglesRelations(),
+        RuleTangentChordTheorem(),
+        RuleChordMidpoint(),
 
-    # Parallel
-    engine.add_rule(RuleConsecutiveInteriorAngles())
+        # Parallel
+        RuleConsecutiveInteriorAngles(),
 
-    # Advanced
-    engine.add_rule(RulePowerOfPoint())
-    engine.add_rule(RuleMidlineTheorem())
-    engine.add_rule(RuleTriangleSimilarity())
+        # Advanced
+        RulePowerOfPoint(),
+        RuleMidlineTheorem(),
+        RuleTriangleSimilarity(),
 
-    # Cyclic Proofs
-    engine.add_rule(RuleCyclicMethod1())
-    engine.add_rule(RuleCyclicMethod2())
-    engine.add_rule(RuleCyclicMethod3())
-    engine.add_rule(RuleCyclicMethod4())
+        # Cyclic Proofs
+        RuleCyclicMethod1(),
+        RuleCyclicMethod2(),
+        RuleCyclicMethod3(),
+        RuleCyclicMethod4(),
 
-    # Diagnostics
-    engine.add_rule(RuleCheckCyclicContradiction()) 
-    engine.add_rule(RuleCheckCoincidentVertices()) 
-    
+        # Diagnostics
+        RuleCheckCyclicContradiction(),
+        RuleCheckCoincidentVertices(),
+    ]
+
+def setup_system():
+    kb = KnowledgeGraph()
+    engine = InferenceEngine(kb, semi_naive=True, stratified=True)
+    for rule in default_rules():
+        engine.add_rule(rule)
     return kb, engine
\ No newline at end of file
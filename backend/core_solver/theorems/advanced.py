@@ -1,4 +1,6 @@
+import math
 from core_solver.inference.base_rule import GeometricRule
+from core_solver.inference.rete import Pattern, PatternRule
 from core_solver.core.entities import Segment, Angle, Quadrilateral
 from core_solver.utils.geometry_utils import is_close
 
@@ -6,6 +8,9 @@ from core_solver.utils.geometry_utils import is_close
 # 1. PHƯƠNG TÍCH ĐƯỜNG TRÒN
 # ==============================================================================
 class RulePowerOfPoint(GeometricRule):
+    reads = ("INTERSECTION", "QUADRILATERAL", "VALUE")
+    writes = ("IS_CYCLIC",)
+
     @property
     def name(self): return "Phương tích đường tròn"
     @property
@@ -27,13 +32,12 @@ class RulePowerOfPoint(GeometricRule):
                 if None not in [val_MA, val_MB, val_MC, val_MD]:
                     if is_close(val_MA * val_MB, val_MC * val_MD):
                         
-                        target_points = {pA, pB, pC, pD}
+                        target_mask = kb.point_mask(fact.entities[1:5])
                         found_quad_fact = None
                         
                         if "QUADRILATERAL" in kb.properties:
                             for q_fact in kb.properties["QUADRILATERAL"]:
-                                q_pts = {kb.id_map[n] for n in q_fact.entities}
-                                if q_pts == target_points:
+                                if kb.fact_mask(q_fact) == target_mask:
                                     found_quad_fact = q_fact
                                     break
                         
@@ -49,58 +53,92 @@ class RulePowerOfPoint(GeometricRule):
 # ==============================================================================
 # 2. ĐƯỜNG TRUNG BÌNH
 # ==============================================================================
-class RuleMidlineTheorem(GeometricRule):
+def _segment_ends(midpoint_fact):
+    """Hai đầu mút của đoạn thẳng trong Fact MIDPOINT [M, A, B]."""
+    return midpoint_fact.entities[1:3]
+
+class RuleMidlineTheorem(PatternRule):
+    reads = ("MIDPOINT", "VALUE")
+    writes = ("PARALLEL", "VALUE")
+
+    # Hai trung điểm M (của AB), N (của AC) có đúng một đầu mút chung A
+    patterns = (
+        Pattern("MIDPOINT", "m1", points=_segment_ends),
+        Pattern("MIDPOINT", "m2", points=_segment_ends, min_shared=1, max_shared=1),
+    )
+    symmetric = True
+    refire_on = ("VALUE",) # Độ dài cạnh đáy có thể vừa được biết => xét lại các match có cạnh đáy đó
+
     @property
     def name(self): return "Đường trung bình tam giác"
     @property
     def description(self): return "Nối 2 trung điểm => Song song và bằng 1/2 cạnh đáy."
 
-    def apply(self, kb) -> bool:
+    def refire_keys(self, kb, fact):
+        if getattr(fact, 'subtype', None) != "length": return () # Góc... không ảnh hưởng
+        key = kb._length_key(fact.entities)
+        return (key,) if key is not None else ()
+
+    def match_key(self, kb, match):
+        # Cạnh đáy BC: hai đầu mút không chung của hai đoạn AB, AC
+        return frozenset(_segment_ends(match["m1"])).symmetric_difference(_segment_ends(match["m2"]))
+
+    def fire(self, kb, match) -> bool:
+        return self._apply_pair(kb, match["m1"], match["m2"])
+
+    def _apply_pair(self, kb, m1, m2):
         changed = False
-        if "MIDPOINT" not in kb.properties: return False
+        pM = kb.id_map[m1.entities[0]] 
+        pN = kb.id_map[m2.entities[0]] 
         
-        midpoints = kb.properties["MIDPOINT"]
-        for i in range(len(midpoints)):
-            for j in range(i + 1, len(midpoints)):
-                m1 = midpoints[i]
-                m2 = midpoints[j] 
-                
-                pM = kb.id_map[m1.entities[0]] 
-                pN = kb.id_map[m2.entities[0]] 
-                
-                line1_pts = {m1.entities[1], m1.entities[2]}
-                line2_pts = {m2.entities[1], m2.entities[2]}
-                
-                common = line1_pts.intersection(line2_pts)
-                
-                if len(common) == 1:
-                    pA_name = list(common)[0]
-                    pB_name = list(line1_pts - common)[0]
-                    pC_name = list(line2_pts - common)[0]
-                    
-                    pB = kb.id_map[pB_name]
-                    pC = kb.id_map[pC_name]
-                    
-                    reason = f"Đường trung bình {pM.name}{pN.name} của tam giác {pA_name}{pB_name}{pC_name}"
-                    if kb.add_property("PARALLEL", [pM, pN, pB, pC], reason, parents=[m1, m2]):
-                        changed = True
-                    
-                    seg_base = Segment(pB, pC)
-                    val_base = kb.get_length_value(seg_base)
-                    
-                    if val_base is not None:
-                        seg_mid = Segment(pM, pN)
-                        new_val = val_base / 2.0
-                        reason_len = f"Đường trung bình bằng 1/2 cạnh đáy {pB.name}{pC.name}"
-                        if kb.add_property("VALUE", [seg_mid], reason_len, value=new_val, parents=[m1, m2]):
-                            changed = True
+        line1 = kb.point_mask(_segment_ends(m1))
+        line2 = kb.point_mask(_segment_ends(m2))
+        
+        common = line1 & line2
+        
+        if common and not common & (common - 1): # Đúng một đầu mút chung
+            pA_name = kb.mask_names(common)[0]
+            pB_name = kb.mask_names(line1 ^ common)[0]
+            pC_name = kb.mask_names(line2 ^ common)[0]
+            
+            pB = kb.id_map[pB_name]
+            pC = kb.id_map[pC_name]
+            
+            reason = f"Đường trung bình {pM.name}{pN.name} của tam giác {pA_name}{pB_name}{pC_name}"
+            if kb.add_property("PARALLEL", [pM, pN, pB, pC], reason, parents=[m1, m2]):
+                changed = True
+            
+            seg_base = Segment(pB, pC)
+            val_base = kb.get_length_value(seg_base)
+            
+            if val_base is not None:
+                seg_mid = Segment(pM, pN)
+                new_val = val_base / 2.0
+                reason_len = f"Đường trung bình bằng 1/2 cạnh đáy {pB.name}{pC.name}"
+                if kb.add_property("VALUE", [seg_mid], reason_len, value=new_val, parents=[m1, m2]):
+                    changed = True
 
         return changed
 
 # ==============================================================================
 # 3. TAM GIÁC ĐỒNG DẠNG
 # ==============================================================================
+_VALUE_STEP = 100   # Ô giá trị góc rộng 0.01 (lớn hơn sai số is_close với góc <= 360°)
+_SHAPE_STEP = 1000  # Ô tỉ số cạnh (cạnh nhỏ / cạnh lớn nhất) rộng 0.001
+
+def _near_keys(key):
+    """Khóa ghép và các khóa kề: hai giá trị gần bằng nhau có thể rơi vào hai ô cạnh nhau."""
+    kind, cell = key
+    if kind == "class": return [key]
+    return [(kind, cell + d) for d in (-1, 0, 1)]
+
+def _near_shapes(shape):
+    return [(shape[0] + d0, shape[1] + d1) for d0 in (-1, 0, 1) for d1 in (-1, 0, 1)]
+
 class RuleTriangleSimilarity(GeometricRule):
+    reads = ("TRIANGLE", "VALUE", "EQUALITY")
+    writes = ("SIMILAR", "EQUALITY")
+
     @property
     def name(self): return "Tam giác đồng dạng (G.G, C.C.C)"
     @property
@@ -111,88 +149,155 @@ class RuleTriangleSimilarity(GeometricRule):
         if "TRIANGLE" not in kb.properties: return False
         
         tris = kb.properties["TRIANGLE"]
-        n = len(tris)
         
-        for i in range(n):
-            for j in range(i + 1, n):
-                t1_fact = tris[i]
-                t2_fact = tris[j]
+        for i, j in self._candidate_pairs(kb, tris, range(len(tris))):
+            kb.check_budget()
+            if self._compare(kb, tris[i], tris[j]):
+                changed = True
+
+        return changed
+
+    def apply_delta(self, kb, delta) -> bool:
+        # Góc/cạnh vừa thay đổi có thể làm một cặp cũ trở nên đồng dạng => xét lại toàn bộ
+        if delta.has("VALUE", "EQUALITY"): return self.apply(kb)
+        new_ids = {f.id for f in delta.of_type("TRIANGLE")}
+        if not new_ids: return False
+
+        tris = kb.properties["TRIANGLE"]
+        new_idx = [i for i, f in enumerate(tris) if f.id in new_ids]
+
+        changed = False
+        for i, j in self._candidate_pairs(kb, tris, new_idx):
+            kb.check_budget()
+            if self._compare(kb, tris[i], tris[j]):
+                changed = True
+        return changed
+
+    def _signature(self, kb, t_fact):
+        """
+        Chữ ký tam giác: với mỗi góc (theo thứ tự của _compare) các khóa ghép - lớp tương đương và ô giá trị
+        (nếu đã biết) - cùng ô hình dạng (tỉ số cạnh đã sắp xếp, None nếu chưa biết đủ 3 cạnh).
+        """
+        p = [kb.id_map[x] for x in t_fact.entities]
+        angs = [Angle(p[1], p[0], p[2]), Angle(p[0], p[1], p[2]), Angle(p[0], p[2], p[1])]
+        angle_keys = []
+        for ang in angs:
+            keys = [("class", kb.equality_classes.find(kb.canonical_angle(ang).canonical_id))]
+            val = kb.get_angle_value(ang)
+            if val: keys.append(("value", math.floor(val * _VALUE_STEP)))
+            angle_keys.append(keys)
+
+        sides = [kb.get_length_value(s) for s in (Segment(p[0], p[1]), Segment(p[1], p[2]), Segment(p[2], p[0]))]
+        shape = None
+        if None not in sides and min(sides) > 0:
+            s0, s1, s2 = sorted(sides)
+            shape = (math.floor(s0 / s2 * _SHAPE_STEP), math.floor(s1 / s2 * _SHAPE_STEP))
+        return angle_keys, shape
+
+    def _candidate_pairs(self, kb, tris, queries):
+        """
+        Các cặp (i, j), i < j, có thể đồng dạng, với ít nhất một tam giác thuộc queries: có >= 2 cặp góc
+        chung khóa (g.g) hoặc cùng ô hình dạng (c.c.c). Tra theo chỉ mục khóa thay vì xét mọi cặp.
+        """
+        sigs = [self._signature(kb, f) for f in tris]
+        angle_index = {} # {khóa: [(tam giác, góc)]}
+        shape_index = {} # {ô hình dạng: [tam giác]}
+        for t, (angle_keys, shape) in enumerate(sigs):
+            for a, keys in enumerate(angle_keys):
+                for key in keys: angle_index.setdefault(key, []).append((t, a))
+            if shape is not None: shape_index.setdefault(shape, []).append(t)
+
+        pairs = set()
+        for t in queries:
+            angle_keys, shape = sigs[t]
+            matched = {} # {tam giác khác: {(góc của t, góc của nó)}}
+            for a, keys in enumerate(angle_keys):
+                for key in keys:
+                    for near in _near_keys(key):
+                        for u, b in angle_index.get(near, ()):
+                            if u != t: matched.setdefault(u, set()).add((a, b))
+            pairs.update((min(t, u), max(t, u)) for u, m in matched.items() if len(m) >= 2)
+            if shape is not None:
+                for cell in _near_shapes(shape):
+                    pairs.update((min(t, u), max(t, u)) for u in shape_index.get(cell, ()) if u != t)
+        return sorted(pairs)
+
+    def _compare(self, kb, t1_fact, t2_fact):
+        changed = False
+        p1 = [kb.id_map[x] for x in t1_fact.entities] # [A, B, C]
+        p2 = [kb.id_map[x] for x in t2_fact.entities] # [D, E, F]
+                    
+        angs1 = [Angle(p1[1], p1[0], p1[2]), Angle(p1[0], p1[1], p1[2]), Angle(p1[0], p1[2], p1[1])]
+        angs2 = [Angle(p2[1], p2[0], p2[2]), Angle(p2[0], p2[1], p2[2]), Angle(p2[0], p2[2], p2[1])]
+        
+        matched_indices = [] 
+        
+        for idx1, a1 in enumerate(angs1):
+            for idx2, a2 in enumerate(angs2):
+                is_eq, _ = kb.check_equality(a1, a2)
+                val1 = kb.get_angle_value(a1)
+                val2 = kb.get_angle_value(a2)
                 
+                if is_eq or (val1 and val2 and is_close(val1, val2)):
+                    matched_indices.append((idx1, idx2))
 
-                p1 = [kb.id_map[x] for x in t1_fact.entities] # [A, B, C]
-                p2 = [kb.id_map[x] for x in t2_fact.entities] # [D, E, F]
-                            
-                angs1 = [Angle(p1[1], p1[0], p1[2]), Angle(p1[0], p1[1], p1[2]), Angle(p1[0], p1[2], p1[1])]
-                angs2 = [Angle(p2[1], p2[0], p2[2]), Angle(p2[0], p2[1], p2[2]), Angle(p2[0], p2[2], p2[1])]
+        if len(matched_indices) >= 2:
+            # [HÀNH ĐỘNG THAY THẾ TODO]
+            combined_entities = t1_fact.entities + t2_fact.entities
+            reason = f"Tam giác {''.join(t1_fact.entities)} đồng dạng {''.join(t2_fact.entities)} (g.g)"
+            
+            if kb.add_property("SIMILAR", combined_entities, reason, parents=[t1_fact, t2_fact]):
+                changed = True
                 
-                matched_indices = [] 
+                idx1_set = {0, 1, 2}
+                idx2_set = {0, 1, 2}
+                for m in matched_indices:
+                    if m[0] in idx1_set: idx1_set.remove(m[0])
+                    if m[1] in idx2_set: idx2_set.remove(m[1])
                 
-                for idx1, a1 in enumerate(angs1):
-                    for idx2, a2 in enumerate(angs2):
-                        is_eq, _ = kb.check_equality(a1, a2)
-                        val1 = kb.get_angle_value(a1)
-                        val2 = kb.get_angle_value(a2)
-                        
-                        if is_eq or (val1 and val2 and is_close(val1, val2)):
-                            matched_indices.append((idx1, idx2))
-
-                if len(matched_indices) >= 2:
-                    # [HÀNH ĐỘNG THAY THẾ TODO]
-                    combined_entities = t1_fact.entities + t2_fact.entities
-                    reason = f"Tam giác {''.join(t1_fact.entities)} đồng dạng {''.join(t2_fact.entities)} (g.g)"
+                if len(idx1_set) == 1 and len(idx2_set) == 1:
+                    rem_idx1 = list(idx1_set)[0]
+                    rem_idx2 = list(idx2_set)[0]
+                    rem_ang1 = angs1[rem_idx1]
+                    rem_ang2 = angs2[rem_idx2]
                     
-                    if kb.add_property("SIMILAR", combined_entities, reason, parents=[t1_fact, t2_fact]):
+                    reason_eq = f"Góc tương ứng của 2 tam giác đồng dạng"
+                    if kb.add_equality(rem_ang1, rem_ang2, reason_eq):
                         changed = True
-                        
-                        idx1_set = {0, 1, 2}
-                        idx2_set = {0, 1, 2}
-                        for m in matched_indices:
-                            if m[0] in idx1_set: idx1_set.remove(m[0])
-                            if m[1] in idx2_set: idx2_set.remove(m[1])
-                        
-                        if len(idx1_set) == 1 and len(idx2_set) == 1:
-                            rem_idx1 = list(idx1_set)[0]
-                            rem_idx2 = list(idx2_set)[0]
-                            rem_ang1 = angs1[rem_idx1]
-                            rem_ang2 = angs2[rem_idx2]
-                            
-                            reason_eq = f"Góc tương ứng của 2 tam giác đồng dạng"
-                            if kb.add_equality(rem_ang1, rem_ang2, reason_eq):
-                                changed = True
-                    continue 
+            return changed
 
-                s1 = [Segment(p1[0], p1[1]), Segment(p1[1], p1[2]), Segment(p1[2], p1[0])]
-                s2 = [Segment(p2[0], p2[1]), Segment(p2[1], p2[2]), Segment(p2[2], p2[0])]
-                
-                vals1 = [kb.get_length_value(s) for s in s1]
-                vals2 = [kb.get_length_value(s) for s in s2]
+        s1 = [Segment(p1[0], p1[1]), Segment(p1[1], p1[2]), Segment(p1[2], p1[0])]
+        s2 = [Segment(p2[0], p2[1]), Segment(p2[1], p2[2]), Segment(p2[2], p2[0])]
+        
+        vals1 = [kb.get_length_value(s) for s in s1]
+        vals2 = [kb.get_length_value(s) for s in s2]
+        
+        if None not in vals1 and None not in vals2:
+            v1_sorted = sorted([(v, i) for i, v in enumerate(vals1)])
+            v2_sorted = sorted([(v, i) for i, v in enumerate(vals2)])
+            
+            ratios = [v1_sorted[k][0] / v2_sorted[k][0] for k in range(3)]
+            
+            if is_close(ratios[0], ratios[1]) and is_close(ratios[1], ratios[2]):
+                reason = f"Tam giác {''.join(t1_fact.entities)} ~ {''.join(t2_fact.entities)} (c.c.c)"
+                combined_entities = t1_fact.entities + t2_fact.entities
                 
-                if None not in vals1 and None not in vals2:
-                    v1_sorted = sorted([(v, i) for i, v in enumerate(vals1)])
-                    v2_sorted = sorted([(v, i) for i, v in enumerate(vals2)])
-                    
-                    ratios = [v1_sorted[k][0] / v2_sorted[k][0] for k in range(3)]
+                if kb.add_property("SIMILAR", combined_entities, reason, parents=[t1_fact, t2_fact]):
+                    changed = True
+
+                    angle_map_idx = {0: 2, 1: 0, 2: 1} 
                     
-                    if is_close(ratios[0], ratios[1]) and is_close(ratios[1], ratios[2]):
-                        reason = f"Tam giác {''.join(t1_fact.entities)} ~ {''.join(t2_fact.entities)} (c.c.c)"
-                        combined_entities = t1_fact.entities + t2_fact.entities
+                    for k in range(3):
+                        original_idx1 = v1_sorted[k][1] 
+                        original_idx2 = v2_sorted[k][1]
                         
-                        if kb.add_property("SIMILAR", combined_entities, reason, parents=[t1_fact, t2_fact]):
-                            changed = True
-
-                            angle_map_idx = {0: 2, 1: 0, 2: 1} 
-                            
-                            for k in range(3):
-                                original_idx1 = v1_sorted[k][1] 
-                                original_idx2 = v2_sorted[k][1]
-                                
-                                ang_idx1 = angle_map_idx[original_idx1]
-                                ang_idx2 = angle_map_idx[original_idx2]
-                                
-                                target_ang1 = angs1[ang_idx1]
-                                target_ang2 = angs2[ang_idx2]
-                                
-                                kb.add_equality(target_ang1, target_ang2, "Góc tương ứng (đồng dạng c.c.c)")
-                                changed = True
+                        ang_idx1 = angle_map_idx[original_idx1]
+                        ang_idx2 = angle_map_idx[original_idx2]
+                        
+                        target_ang1 = angs1[ang_idx1]
+                        target_ang2 = angs2[ang_idx2]
+                        
+                        kb.add_equality(target_ang1, target_ang2, "Góc tương ứng (đồng dạng c.c.c)")
+                        changed = True
 
         return changed
\ No newline at end of file
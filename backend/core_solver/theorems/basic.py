@@ -2,37 +2,47 @@ from core_solver.inference.base_rule import GeometricRule
 from core_solver.core.entities import Point, Segment, Angle
 
 class RuleDefinePolygonEdges(GeometricRule):
+    reads = ("TRIANGLE", "QUADRILATERAL")
+    writes = ("OBJECT",)
+
     @property
     def name(self): return "Định nghĩa Cạnh Đa giác"
     @property
     def description(self): return "Khai báo sự tồn tại của các cạnh."
 
     def apply(self, kb) -> bool:
+        return self._define_edges(kb, kb.properties.get("TRIANGLE", []), kb.properties.get("QUADRILATERAL", []))
+
+    def apply_delta(self, kb, delta) -> bool:
+        return self._define_edges(kb, delta.of_type("TRIANGLE"), delta.of_type("QUADRILATERAL"))
+
+    def _define_edges(self, kb, triangles, quads):
         changed = False
         # Tam giác
-        if "TRIANGLE" in kb.properties:
-            for fact in kb.properties["TRIANGLE"]:
-                pts = [Point(n) for n in fact.entities]
-                segments = [Segment(pts[0], pts[1]), Segment(pts[1], pts[2]), Segment(pts[2], pts[0])]
-                for seg in segments:
-                    if seg.canonical_id not in kb.id_map:
-                        kb.register_object(seg) 
-                        changed = True
+        for fact in triangles:
+            pts = [Point(n) for n in fact.entities]
+            segments = [Segment(pts[0], pts[1]), Segment(pts[1], pts[2]), Segment(pts[2], pts[0])]
+            for seg in segments:
+                if seg.canonical_id not in kb.id_map:
+                    kb.register_object(seg) 
+                    changed = True
         # Tứ giác
-        if "QUADRILATERAL" in kb.properties:
-            for fact in kb.properties["QUADRILATERAL"]:
-                pts = [Point(n) for n in fact.entities]
-                segments = [Segment(pts[0], pts[1]), Segment(pts[1], pts[2]), Segment(pts[2], pts[3]), Segment(pts[3], pts[0])]
-                for seg in segments:
-                    if seg.canonical_id not in kb.id_map:
-                        kb.register_object(seg)
-                        changed = True
+        for fact in quads:
+            pts = [Point(n) for n in fact.entities]
+            segments = [Segment(pts[0], pts[1]), Segment(pts[1], pts[2]), Segment(pts[2], pts[3]), Segment(pts[3], pts[0])]
+            for seg in segments:
+                if seg.canonical_id not in kb.id_map:
+                    kb.register_object(seg)
+                    changed = True
         return changed
 
 class RuleAngleBisector(GeometricRule):
     """
     Luật: Đường phân giác chia góc thành 2 góc nhỏ bằng nhau.
     """
+    reads = ("BISECTOR", "VALUE", "EQUALITY")
+    writes = ("EQUALITY", "VALUE")
+
     @property
     def name(self): return "Tính chất Phân giác"
     @property
@@ -68,6 +78,9 @@ class RuleSymmetry(GeometricRule):
     """
     Luật: Xử lý đối xứng tâm và đối xứng trục.
     """
+    reads = ("SYMMETRY", "INTERSECTION")
+    writes = ("MIDPOINT", "PERPENDICULAR")
+
     @property
     def name(self): return "Tính chất Đối xứng"
     @property
@@ -107,6 +120,9 @@ class RuleSymmetry(GeometricRule):
         return changed
 
 class RuleTriangleAngleSum(GeometricRule):
+    reads = ("TRIANGLE", "VALUE")
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Tổng 3 góc tam giác"
     @property
@@ -131,15 +147,11 @@ class RuleTriangleAngleSum(GeometricRule):
             unknown_angle = None
             
             for ang, _ in angles:
-                found = False
-                if "VALUE" in kb.properties:
-                    for f in kb.properties["VALUE"]:
-                        if ang.canonical_id in f.entities and f.value is not None:
-                            known_facts.append(f)
-                            known_sum += f.value
-                            found = True
-                            break
-                if not found:
+                f = kb.find_value_fact(ang)
+                if f is not None:
+                    known_facts.append(f)
+                    known_sum += f.value
+                else:
                     unknown_angle = ang
             
             if len(known_facts) == 2 and unknown_angle:
@@ -152,16 +164,23 @@ class RuleTriangleAngleSum(GeometricRule):
         return changed
     
 class RulePerpendicularToValue(GeometricRule):
+    reads = ("PERPENDICULAR",)
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Tính chất Vuông góc"
     @property
     def description(self): return "Hai đường thẳng vuông góc tạo ra góc 90 độ."
 
     def apply(self, kb) -> bool:
-        changed = False
-        if "PERPENDICULAR" not in kb.properties: return False
+        return self._apply_to(kb, kb.properties.get("PERPENDICULAR", []))
+
+    def apply_delta(self, kb, delta) -> bool:
+        return self._apply_to(kb, delta.of_type("PERPENDICULAR"))
 
-        for fact in kb.properties["PERPENDICULAR"]:
+    def _apply_to(self, kb, perpendicular_facts):
+        changed = False
+        for fact in perpendicular_facts:
             p_names = fact.entities
             try: entities = [kb.id_map[n] for n in p_names]
             except KeyError: continue
@@ -190,38 +209,47 @@ class RulePerpendicularToValue(GeometricRule):
 
 
 class RuleEqualityByValue(GeometricRule):
+    reads = ("VALUE",)
+    writes = ("EQUALITY",)
+
     @property
     def name(self): return "Bằng nhau qua giá trị"
     @property
     def description(self): return "Hai đối tượng có cùng giá trị số thì bằng nhau."
 
     def apply(self, kb) -> bool:
+        return self._attach(kb, kb.properties.get("VALUE", []))
+
+    def apply_delta(self, kb, delta) -> bool:
+        """Chỉ nối các Fact VALUE mới vào lớp cùng giá trị."""
+        return self._attach(kb, delta.of_type("VALUE"))
+
+    def _attach(self, kb, value_facts):
+        """
+        Nối mỗi góc có giá trị với góc đại diện của lớp cùng giá trị (kb.value_representative):
+        k góc cùng giá trị cần tối đa k-1 cạnh bằng nhau thay vì mọi cặp.
+        """
         changed = False
-        
-        value_facts = kb.properties.get("VALUE", [])
-        values_map = {}
         for f in value_facts:
-            if f.value is not None:
-                values_map.setdefault(f.value, []).append(f)
+            if f.value is None: continue
+            rep = kb.value_representative(f.value)
+            if rep is None or rep is f: continue
+            kb.check_budget()
+            if self._equate(kb, rep, f):
+                changed = True
+        return changed
 
-        for value, facts in values_map.items():
-            if len(facts) < 2: continue
+    def _equate(self, kb, f1, f2):
+        if f1.entities[0] == f2.entities[0]: return False
+        
+        obj1 = kb.id_map.get(f1.entities[0])
+        obj2 = kb.id_map.get(f2.entities[0])
+        
+        if obj1 and obj2 and isinstance(obj1, Angle) and isinstance(obj2, Angle):
+            if kb.check_equality(obj1, obj2)[0]: return False # Đã cùng lớp => không cần thêm cạnh
+            reason = f"Cả hai góc đều bằng {int(f1.value)}°"
+            parents = [f1, f2] 
             
-            for i in range(len(facts)):
-                for j in range(i + 1, len(facts)):
-                    f1 = facts[i]
-                    f2 = facts[j]
-                    
-                    if f1.entities[0] == f2.entities[0]: continue
-                    
-                    obj1 = kb.id_map.get(f1.entities[0])
-                    obj2 = kb.id_map.get(f2.entities[0])
-                    
-                    if obj1 and obj2 and isinstance(obj1, Angle) and isinstance(obj2, Angle):
-                        reason = f"Cả hai góc đều bằng {int(value)}°"
-                        parents = [f1, f2] 
-                        
-                        if kb.add_equality(obj1, obj2, reason, parents=parents):
-                            changed = True
-                            
-        return changed
\ No newline at end of file
+            if kb.add_equality(obj1, obj2, reason, parents=parents):
+                return True
+        return False
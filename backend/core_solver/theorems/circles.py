@@ -1,3 +1,4 @@
+import weakref
 from core_solver.inference.base_rule import GeometricRule
 from core_solver.core.entities import Point, Angle, Segment
 from core_solver.utils.geometry_utils import is_close
@@ -7,6 +8,9 @@ from core_solver.utils.geometry_utils import is_close
 # ==============================================================================
 
 class RuleCircleRadii(GeometricRule):
+    reads = ("CIRCLE",)
+    writes = ("POINT", "EQUALITY")
+
     @property
     def name(self): return "Bán kính đường tròn"
     @property
@@ -47,6 +51,9 @@ class RuleChordMidpoint(GeometricRule):
     """
     [MỚI] Luật: Đường kính đi qua trung điểm của một dây cung thì vuông góc với dây ấy.
     """
+    reads = ("MIDPOINT", "CIRCLE")
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Quan hệ Đường kính và Dây cung"
     @property
@@ -86,6 +93,9 @@ class RuleChordMidpoint(GeometricRule):
         return changed
 
 class RuleTangentProperty(GeometricRule):
+    reads = ("TANGENT",)
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Tính chất Tiếp tuyến"
     @property
@@ -108,7 +118,35 @@ class RuleTangentProperty(GeometricRule):
 # 2. CÁC ĐỊNH LÝ VỀ GÓC (Góc ở tâm, Góc nội tiếp, Góc tiếp tuyến)
 # ==============================================================================
 
+class _ArcTable:
+    """
+    Bảng cung của một đường tròn: mỗi dây AB ứng với góc ở tâm AOB và các góc nội tiếp AMB chắn nó.
+    Các góc nội tiếp của một dây được nối thành chuỗi bằng nhau nên cùng một lớp tương đương:
+    giá trị của dây chỉ cần tra 2 lớp (ở tâm, nội tiếp). pending: [(chỉ số dây, đã nối chuỗi)] các dây
+    còn có thể sinh quan hệ mới (chưa biết đủ giá trị cả hai lớp).
+    """
+    __slots__ = ("signature", "chords", "pending")
+
+    def __init__(self, p_center, points):
+        self.signature = (p_center.name, tuple(p.name for p in points))
+        self.chords = [] # [(A, B, góc ở tâm, [góc nội tiếp])] theo thứ tự (i, j)
+        n = len(points)
+        for i in range(n):
+            for j in range(i + 1, n):
+                pA, pB = points[i], points[j]
+                inscribed = [Angle(pA, points[k], pB) for k in range(n) if k != i and k != j]
+                self.chords.append((pA, pB, Angle(pA, p_center, pB), inscribed))
+        self.pending = [(idx, False) for idx in range(len(self.chords))]
+
+
 class RuleCircleAnglesRelations(GeometricRule):
+    reads = ("CIRCLE", "POINT", "VALUE", "EQUALITY")
+    writes = ("VALUE", "EQUALITY")
+
+    def __init__(self):
+        # Bảng cung theo từng KB (luật dùng chung giữa các engine / lát cắt): {kb: {khóa Fact CIRCLE: _ArcTable}}
+        self._tables = weakref.WeakKeyDictionary()
+
     @property
     def name(self): return "Quan hệ Góc trong đường tròn"
     @property
@@ -117,6 +155,7 @@ class RuleCircleAnglesRelations(GeometricRule):
     def apply(self, kb) -> bool:
         changed = False
         if "CIRCLE" not in kb.properties: return False
+        tables = self._tables.setdefault(kb, {})
 
         for c_fact in kb.properties["CIRCLE"]:
             center_name = getattr(c_fact, 'center', None)
@@ -130,51 +169,63 @@ class RuleCircleAnglesRelations(GeometricRule):
                 if isinstance(p, Point):
                     points.append(p)
 
-            n = len(points)
-            if n < 3: continue
-            
-            for i in range(n):
-                for j in range(i + 1, n):
-                    pA = points[i]
-                    pB = points[j]
-                    
-                    central_angle = Angle(pA, p_center, pB)
-                    
-                    inscribed_angles = []
-                    for k in range(n):
-                        if k == i or k == j: continue
-                        pM = points[k]
-                        inscribed_angles.append(Angle(pA, pM, pB))
+            if len(points) < 3: continue
 
-                    val_central = kb.get_angle_value(central_angle)
-                    
-                    for ang_inscr in inscribed_angles:
-                        val_inscr = kb.get_angle_value(ang_inscr)
-                        
-                        if val_central is not None and val_inscr is None:
-                            new_val = val_central / 2.0
-                            reason = f"Góc nội tiếp bằng 1/2 góc ở tâm {central_angle.vertex.name}"
-                            if kb.add_property("VALUE", [ang_inscr], reason, value=new_val, parents=[c_fact]):
-                                changed = True
-                        
-                        elif val_inscr is not None and val_central is None:
-                            new_val = val_inscr * 2.0
-                            reason = f"Góc ở tâm gấp đôi góc nội tiếp {ang_inscr.vertex.name}"
-                            if kb.add_property("VALUE", [central_angle], reason, value=new_val, parents=[c_fact]):
-                                changed = True
+            # Có điểm mới trên đường tròn (hoặc đổi tâm) => dựng lại bảng, mọi dây cần xét lại
+            table = tables.get(c_fact.key)
+            if table is None or table.signature != (center_name, tuple(p.name for p in points)):
+                table = tables[c_fact.key] = _ArcTable(p_center, points)
 
-                    if len(inscribed_angles) >= 2:
-                        for idx in range(len(inscribed_angles) - 1):
-                            a1 = inscribed_angles[idx]
-                            a2 = inscribed_angles[idx+1]
-                            reason = f"Hai góc nội tiếp cùng chắn cung {pA.name}{pB.name}"
-                            if kb.add_equality(a1, a2, reason):
-                                changed = True
+            kb.check_budget()
+            pending = []
+            for idx, chained in table.pending:
+                pA, pB, central_angle, inscribed_angles = table.chords[idx]
+                val_central = kb.get_angle_value(central_angle)
+                # Chưa biết giá trị nào và chuỗi bằng nhau đã có => không có gì mới
+                if chained and val_central is None and kb.get_angle_value(inscribed_angles[0]) is None:
+                    pending.append((idx, True))
+                    continue
+
+                if self._relate_chord(kb, c_fact, pA, pB, central_angle, inscribed_angles, val_central):
+                    changed = True
+                # Đã biết cả hai lớp => dây không sinh thêm quan hệ nào nữa
+                if kb.get_angle_value(central_angle) is None or kb.get_angle_value(inscribed_angles[0]) is None:
+                    pending.append((idx, True))
+            table.pending = pending
                                 
         return changed
 
+    def _relate_chord(self, kb, c_fact, pA, pB, central_angle, inscribed_angles, val_central):
+        changed = False
+        for ang_inscr in inscribed_angles:
+            val_inscr = kb.get_angle_value(ang_inscr)
+            
+            if val_central is not None and val_inscr is None:
+                new_val = val_central / 2.0
+                reason = f"Góc nội tiếp bằng 1/2 góc ở tâm {central_angle.vertex.name}"
+                if kb.add_property("VALUE", [ang_inscr], reason, value=new_val, parents=[c_fact]):
+                    changed = True
+            
+            elif val_inscr is not None and val_central is None:
+                new_val = val_inscr * 2.0
+                reason = f"Góc ở tâm gấp đôi góc nội tiếp {ang_inscr.vertex.name}"
+                if kb.add_property("VALUE", [central_angle], reason, value=new_val, parents=[c_fact]):
+                    changed = True
+
+        if len(inscribed_angles) >= 2:
+            for idx in range(len(inscribed_angles) - 1):
+                a1 = inscribed_angles[idx]
+                a2 = inscribed_angles[idx+1]
+                reason = f"Hai góc nội tiếp cùng chắn cung {pA.name}{pB.name}"
+                if kb.add_equality(a1, a2, reason):
+                    changed = True
+        return changed
+
 
 class RuleTangentChordTheorem(GeometricRule):
+    reads = ("TANGENT", "TRIANGLE")
+    writes = ("EQUALITY",)
+
     @property
     def name(self): return "Góc tạo bởi tiếp tuyến và dây cung"
     @property
@@ -212,6 +263,9 @@ class RuleTangentChordTheorem(GeometricRule):
 # 3. THALES (GÓC CHẮN ĐƯỜNG KÍNH)
 # ==============================================================================
 class RuleDiameterThales(GeometricRule):
+    reads = ("DIAMETER", "TRIANGLE")
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Góc nội tiếp chắn nửa đường tròn"
     @property
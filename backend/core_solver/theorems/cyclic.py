@@ -8,41 +8,9 @@ from core_solver.utils.geometry_utils import is_close
 def check_ray_overlap(kb, vertex, p1, p2):
     """
     Kiểm tra xem tia Vertex->p1 và tia Vertex->p2 có trùng nhau không.
-    (Hỗ trợ kiểm tra đường cao, giao điểm, điểm thuộc đoạn thẳng)
+    (Tra lớp tia của KB, dựng từ đường cao, giao điểm, trung điểm, điểm thuộc đoạn thẳng)
     """
-    if p1 == p2: return True
-    
-    if "ALTITUDE" in kb.properties:
-        for f in kb.properties["ALTITUDE"]:
-            top, foot, b1, b2 = f.entities
-            if foot == vertex:
-                ray_points = {top}
-                if "INTERSECTION" in kb.properties:
-                    for int_f in kb.properties["INTERSECTION"]:
-                            lines = getattr(int_f, 'lines', [])
-                            flatten = [p for l in lines for p in l]
-                            if top in flatten and foot in flatten:
-                                ray_points.add(int_f.point)
-                if p1 in ray_points and p2 in ray_points: return True
-    
-    if "INTERSECTION" in kb.properties:
-        for f in kb.properties["INTERSECTION"]:
-            mid = f.point
-            for line in f.lines: 
-                if vertex in line and mid == p1:
-                        other = line[1] if line[0] == vertex else line[0]
-                        if p2 == other: return True
-    
-    if "POINT_ON_LINE" in kb.properties:
-        for f in kb.properties["POINT_ON_LINE"]:
-            try:
-                mid, start, end = f.entities
-                if vertex == start:
-                    if {p1, p2}.issubset({mid, end}): return True
-                elif vertex == end:
-                    if {p1, p2}.issubset({mid, start}): return True
-            except: continue
-    return False
+    return kb.same_ray(vertex, p1, p2)
 
 # ==============================================================================
 # TÌM GIÁ TRỊ GÓC VÀ PARSE THÔNG TIN
@@ -86,10 +54,46 @@ def get_angle_name_from_info(kb, info):
         return f"∠{sorted(legs)[0]}{v}{sorted(legs)[1]}"
     except: return "góc"
 
+# ==============================================================================
+# MỤC TIÊU CON CỤ THỂ (SUY DIỄN LÙI)
+# ==============================================================================
+def goal_quads(kb, goal):
+    """Các tứ giác (danh sách 4 Point) khớp mục tiêu IS_CYCLIC; None nếu mục tiêu không chỉ rõ tứ giác."""
+    if goal.type != "IS_CYCLIC" or not goal.entities: return None
+    quads = []
+    for f in kb.properties.get("QUADRILATERAL", []):
+        if frozenset(f.entities) == goal.entities and all(n in kb.id_map for n in f.entities):
+            quads.append([kb.id_map[n] for n in f.entities])
+    return quads
+
+def interior_angles(pts):
+    return [Angle(pts[i - 1], pts[i], pts[(i + 1) % 4]) for i in range(4)]
+
+def exterior_angles(kb, pts):
+    """Góc ngoài tại mỗi đỉnh: một cạnh tứ giác và tia đối của cạnh kia (điểm đã biết nằm trên tia đối)."""
+    angles = []
+    for i in range(4):
+        v, prev, nxt = pts[i], pts[i - 1], pts[(i + 1) % 4]
+        for side, other in ((prev, nxt), (nxt, prev)):
+            for name in kb.point_names:
+                if name in (v.name, side.name) or not kb.collinear((v.name, side.name, name)): continue
+                if not kb.same_ray(v.name, name, side.name):
+                    angles.append(Angle(other, v, kb.id_map[name]))
+    return angles
+
+def quad_angles(kb, goal):
+    """Góc trong và góc ngoài của các tứ giác mục tiêu (tổng góc đối, góc ngoài bằng góc đối trong)."""
+    quads = goal_quads(kb, goal)
+    if quads is None: return None
+    return [a for pts in quads for a in interior_angles(pts) + exterior_angles(kb, pts)]
+
 # ==============================================================================
 # CÁCH 1: TỔNG HAI GÓC ĐỐI BẰNG 180 ĐỘ
 # ==============================================================================
 class RuleCyclicMethod1(GeometricRule):
+    reads = ("QUADRILATERAL", "VALUE", "ALTITUDE", "INTERSECTION", "POINT_ON_LINE", "MIDPOINT")
+    writes = ("IS_CYCLIC",)
+
     @property
     def name(self): return "Tứ Giác Nội Tiếp (Tổng góc đối)"
     @property
@@ -121,6 +125,9 @@ class RuleCyclicMethod1(GeometricRule):
                     
         return None, None, None
 
+    def goal_entities(self, kb, goal):
+        return quad_angles(kb, goal)
+
     def apply(self, kb) -> bool:
         changed = False
         if "QUADRILATERAL" not in kb.properties: return False
@@ -160,6 +167,9 @@ class RuleCyclicMethod1(GeometricRule):
 # CÁCH 2: HAI ĐỈNH KỀ CÙNG NHÌN CẠNH
 # ==============================================================================
 class RuleCyclicMethod2(GeometricRule):
+    reads = ("QUADRILATERAL", "VALUE", "EQUALITY")
+    writes = ("IS_CYCLIC",)
+
     @property
     def name(self): return "Tứ Giác Nội Tiếp (Đỉnh kề nhìn cạnh)"
     @property
@@ -170,13 +180,22 @@ class RuleCyclicMethod2(GeometricRule):
         # Kiểm tra đệ quy 1 cấp
         sources = getattr(fact, 'sources', [])
         for src in sources:
-            r = src.get('reason', '').lower()
+            r = src.reason.lower()
             if any(k in r for k in ["nội tiếp", "chắn cung", "thuộc đường tròn", "circle"]): return True
             # Check parents của source này
-            for p in src.get('parents', []):
+            for p in src.parents:
                  if hasattr(p, 'type') and p.type == "POINT_LOCATION": return True
         return False
 
+    def goal_entities(self, kb, goal):
+        quads = goal_quads(kb, goal)
+        if quads is None: return None
+        angles = []
+        for pA, pB, pC, pD in quads:
+            for v1, v2, base1, base2 in [(pA, pB, pD, pC), (pB, pC, pA, pD), (pC, pD, pB, pA), (pD, pA, pC, pB)]:
+                angles += [Angle(base1, v1, base2), Angle(base1, v2, base2)]
+        return angles
+
     def apply(self, kb) -> bool:
         changed = False
         if "QUADRILATERAL" not in kb.properties: return False
@@ -228,11 +247,17 @@ class RuleCyclicMethod2(GeometricRule):
 # ==============================================================================
 
 class RuleCyclicMethod3(GeometricRule):
+    reads = ("QUADRILATERAL", "VALUE", "EQUALITY", "ALTITUDE", "INTERSECTION", "POINT_ON_LINE", "MIDPOINT")
+    writes = ("IS_CYCLIC",)
+
     @property
     def name(self): return "Tứ Giác Nội Tiếp (Góc ngoài)"
     @property
     def description(self): return "Góc ngoài = Góc đối trong (Dùng cả Giá trị và Đẳng thức)."
 
+    def goal_entities(self, kb, goal):
+        return quad_angles(kb, goal)
+
     def apply(self, kb) -> bool:
         changed = False
         if "QUADRILATERAL" not in kb.properties: return False
@@ -308,11 +333,29 @@ class RuleCyclicMethod3(GeometricRule):
 # ==============================================================================
 #
 class RuleCyclicMethod4(GeometricRule):
+    reads = ("QUADRILATERAL", "EQUALITY", "CIRCLE", "POINT")
+    writes = ("IS_CYCLIC", "CIRCLE")
+
     @property
     def name(self): return "Tứ Giác Nội Tiếp (Tâm cách đều)"
     @property
     def description(self): return "Bốn đỉnh cách đều một điểm."
 
+    def goal_entities(self, kb, goal):
+        quads = goal_quads(kb, goal)
+        if quads is None: return None
+        segments = []
+        for qs in quads:
+            names = {p.name for p in qs}
+            # Ứng viên tâm: tâm đường tròn qua ít nhất hai đỉnh, hoặc điểm đã cách đều ít nhất hai đỉnh
+            centers = {getattr(f, 'center', None) for f in kb.properties.get("CIRCLE", [])
+                       if len(names.intersection(f.entities)) >= 2}
+            centers |= {o for o in kb.point_names
+                        if any(len(names.intersection(xs)) >= 2 for xs in kb.segment_classes_at(o).values())}
+            for o in sorted(c for c in centers if c and c not in names and isinstance(kb.id_map.get(c), Point)):
+                segments += [Segment(kb.id_map[o], p) for p in qs]
+        return segments
+
     def _get_evidence_for_equality(self, kb, s1, s2):
         """Tìm Fact EQUALITY tương ứng với s1 = s2."""
         parents = kb.get_equality_parents(s1, s2)
@@ -343,34 +386,30 @@ class RuleCyclicMethod4(GeometricRule):
     def apply(self, kb) -> bool:
         changed = False
         if "QUADRILATERAL" not in kb.properties: return False
-        all_points = [obj for obj in kb.id_map.values() if isinstance(obj, Point)]
 
         for q_fact in kb.properties["QUADRILATERAL"]:
             try: qs = [kb.id_map[n] for n in q_fact.entities]
             except KeyError: continue
             quad_entity_ids = q_fact.entities 
 
-            for center in all_points:
-                if center in qs: continue 
+            # Tâm O: OA = OB = OC = OD cùng một lớp tương đương (tra chỉ mục đoạn thẳng theo đầu mút)
+            for center_name in kb.equidistant_centers(quad_entity_ids):
+                center = kb.id_map.get(center_name)
+                if not isinstance(center, Point): continue
+                kb.check_budget()
                 sOA, sOB = Segment(center, qs[0]), Segment(center, qs[1])
                 sOC, sOD = Segment(center, qs[2]), Segment(center, qs[3])
-                
-                # Check 3 cặp: OA=OB, OB=OC, OC=OD
-                eq1, _ = kb.check_equality(sOA, sOB)
-                eq2, _ = kb.check_equality(sOB, sOC)
-                eq3, _ = kb.check_equality(sOC, sOD)
 
-                if eq1 and eq2 and eq3:
-                    reason = f"Bốn đỉnh cách đều điểm {center.name}"
-                    
-                    ps1 = self._get_evidence_for_equality(kb, sOA, sOB)
-                    ps2 = self._get_evidence_for_equality(kb, sOB, sOC)
-                    ps3 = self._get_evidence_for_equality(kb, sOC, sOD)
-                    
-                    all_parents = [q_fact] + ps1 + ps2 + ps3
-                    
-                    if kb.add_property("IS_CYCLIC", quad_entity_ids, reason, parents=all_parents):
-                        changed = True
-                        if "CIRCLE" not in kb.properties:
-                            kb.add_property("CIRCLE", [center.name, qs[0].name], "Tâm cách đều", center=center.name)
+                reason = f"Bốn đỉnh cách đều điểm {center.name}"
+                
+                ps1 = self._get_evidence_for_equality(kb, sOA, sOB)
+                ps2 = self._get_evidence_for_equality(kb, sOB, sOC)
+                ps3 = self._get_evidence_for_equality(kb, sOC, sOD)
+                
+                all_parents = [q_fact] + ps1 + ps2 + ps3
+                
+                if kb.add_property("IS_CYCLIC", quad_entity_ids, reason, parents=all_parents):
+                    changed = True
+                    if "CIRCLE" not in kb.properties:
+                        kb.add_property("CIRCLE", [center.name, qs[0].name], "Tâm cách đều", center=center.name)
         return changed
\ No newline at end of file
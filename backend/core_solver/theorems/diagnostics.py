@@ -1,4 +1,5 @@
 from core_solver.inference.base_rule import GeometricRule
+from core_solver.inference.rete import Pattern, PatternRule
 from core_solver.core.entities import Point, Angle
 
 class RuleCheckCyclicContradiction(GeometricRule):
@@ -6,6 +7,9 @@ class RuleCheckCyclicContradiction(GeometricRule):
     Kiểm tra mâu thuẫn cơ bản của tứ giác nội tiếp:
     Tổng 2 góc đối đã biết giá trị nhưng khác 180 độ.
     """
+    reads = ("QUADRILATERAL", "VALUE", "EQUALITY")
+    writes = ("CONTRADICTION",)
+
     @property
     def name(self): return "Kiểm tra Mâu thuẫn Nội tiếp"
     @property
@@ -24,8 +28,8 @@ class RuleCheckCyclicContradiction(GeometricRule):
             ]
             
             for ang1, ang2, n1, n2 in pairs:
-                v1 = kb.get_angle_value(ang1)
-                v2 = kb.get_angle_value(ang2)
+                v1, f1 = self._angle_value(kb, ang1)
+                v2, f2 = self._angle_value(kb, ang2)
                 
                 if v1 is not None and v2 is not None:
                     total = v1 + v2
@@ -34,8 +38,6 @@ class RuleCheckCyclicContradiction(GeometricRule):
                         reason = f"Tổng góc đối {n1}({int(v1)}°) + {n2}({int(v2)}°) = {int(total)}° (Khác 180°)"
                         # Tìm parents để truy vết
                         parents = [q_fact]
-                        f1 = kb._find_value_fact(ang1)
-                        f2 = kb._find_value_fact(ang2)
                         if f1: parents.append(f1)
                         if f2: parents.append(f2)
                         
@@ -43,56 +45,48 @@ class RuleCheckCyclicContradiction(GeometricRule):
                             changed = True
         return changed
 
+    @staticmethod
+    def _angle_value(kb, angle):
+        """(giá trị, Fact VALUE) của góc: Fact gán trực tiếp (mọi subtype, VD: góc đề bài cho) hoặc của lớp góc bằng nhau."""
+        f = kb.find_value_fact(angle)
+        if f is not None: return f.value, f
+        return kb.get_angle_value(angle), kb._find_value_fact(angle)
+
 
-class RuleCheckCoincidentVertices(GeometricRule):
+class RuleCheckCoincidentVertices(PatternRule):
     """
     [MỚI] Kiểm tra các trường hợp suy biến khi các tam giác định hình trùng nhau.
     Ví dụ: Tam giác ABC đều VÀ Tam giác DBC đều => A trùng D (hoặc đối xứng).
     """
+    reads = ("IS_EQUILATERAL", "QUADRILATERAL")
+    writes = ("CONTRADICTION",)
+
+    # Hai tam giác đều chung một cạnh và một tứ giác chứa hai đỉnh còn lại
+    patterns = (
+        Pattern("IS_EQUILATERAL", "t1"),
+        Pattern("IS_EQUILATERAL", "t2", min_shared=2, max_shared=2),
+        Pattern("QUADRILATERAL", "q", min_shared=2),
+    )
+    symmetric = True
+
     @property
     def name(self): return "Kiểm tra Đỉnh Trùng Nhau"
     @property
     def description(self): return "Phát hiện hai đỉnh trùng nhau dựa trên cấu trúc tam giác."
 
-    def apply(self, kb) -> bool:
-        changed = False
-        
-        # 1. Thu thập danh sách các tam giác đều
-        equilateral_tris = []
-        if "IS_EQUILATERAL" in kb.properties:
-            for fact in kb.properties["IS_EQUILATERAL"]:
-                # entities: ['A', 'B', 'C']
-                points = set(fact.entities) # Dùng set để so sánh không quan tâm thứ tự
-                equilateral_tris.append((points, fact))
+    def fire(self, kb, match) -> bool:
+        pts1, pts2 = kb.fact_mask(match["t1"]), kb.fact_mask(match["t2"])
+        q_fact = match["q"]
+        if (pts1 ^ pts2) & ~kb.fact_mask(q_fact): return False # Tứ giác không chứa cả hai đỉnh còn lại
 
-        # 2. So sánh từng cặp tam giác đều
-        n = len(equilateral_tris)
-        for i in range(n):
-            for j in range(i + 1, n):
-                pts1, fact1 = equilateral_tris[i]
-                pts2, fact2 = equilateral_tris[j]
-                
-                # Tìm các điểm chung (giao của 2 tập hợp)
-                common_points = pts1.intersection(pts2)
-                
-                # Nếu chung nhau 2 điểm (chung 1 cạnh)
-                if len(common_points) == 2:
-                    # Tìm 2 điểm riêng biệt còn lại
-                    diff1 = list(pts1 - common_points)[0] 
-                    diff2 = list(pts2 - common_points)[0] 
-   
-                    if "QUADRILATERAL" in kb.properties:
-                        for q_fact in kb.properties["QUADRILATERAL"]:
-                            q_entities = q_fact.entities
-                            if diff1 in q_entities and diff2 in q_entities:
-                                reason = (
-                                    f"Mâu thuẫn cấu trúc: Hai điểm {diff1} và {diff2} "
-                                    f"cùng tạo tam giác đều với cạnh {''.join(common_points)}. "
-                                    f"Dẫn đến hai điểm này trùng nhau hoặc hình bị suy biến."
-                                )
-                                
-                                parents = [q_fact, fact1, fact2]
-                                if kb.add_property("CONTRADICTION", q_entities, reason, parents=parents):
-                                    changed = True
-                                    
-        return changed
\ No newline at end of file
+        common_points = kb.mask_names(pts1 & pts2)
+        diff1 = kb.mask_names(pts1 & ~pts2)[0]
+        diff2 = kb.mask_names(pts2 & ~pts1)[0]
+
+        reason = (
+            f"Mâu thuẫn cấu trúc: Hai điểm {diff1} và {diff2} "
+            f"cùng tạo tam giác đều với cạnh {''.join(common_points)}. "
+            f"Dẫn đến hai điểm này trùng nhau hoặc hình bị suy biến."
+        )
+        parents = [q_fact, match["t1"], match["t2"]]
+        return kb.add_property("CONTRADICTION", q_fact.entities, reason, parents=parents)
@@ -3,6 +3,9 @@ from core_solver.core.entities import Point, Angle
 
 class RuleConsecutiveInteriorAngles(GeometricRule):
     """Góc trong cùng phía bù nhau."""
+    reads = ("PARALLEL", "VALUE")
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Góc Trong Cùng Phía"
     @property
@@ -24,14 +27,11 @@ class RuleConsecutiveInteriorAngles(GeometricRule):
             ]
             
             for ang1, ang2 in pairs:
-                f1, v1 = None, None
-                f2, v2 = None, None
-                
                 # Tìm giá trị đã biết
-                if "VALUE" in kb.properties:
-                    for f in kb.properties["VALUE"]:
-                        if ang1.canonical_id in f.entities: f1, v1 = f, f.value
-                        if ang2.canonical_id in f.entities: f2, v2 = f, f.value
+                f1 = kb.find_value_fact(ang1)
+                f2 = kb.find_value_fact(ang2)
+                v1 = f1.value if f1 else None
+                v2 = f2.value if f2 else None
                 
                 # Nếu biết 1 tính 1
                 if v1 is not None and v2 is None:
@@ -6,6 +6,9 @@ from core_solver.utils.geometry_utils import is_close
 # RULE 1: PHÂN LOẠI TỨ GIÁC (Bottom-Up: Từ tính chất -> Tên gọi)
 # ==============================================================================
 class RuleClassifyQuadrilaterals(GeometricRule):
+    reads = ("QUADRILATERAL", "PARALLEL", "MIDPOINT", "VALUE", "EQUALITY", "PERPENDICULAR")
+    writes = ("QUADRILATERAL", "IS_CYCLIC")
+
     @property
     def name(self): return "Phân loại Tứ giác"
     @property
@@ -102,7 +105,7 @@ class RuleClassifyQuadrilaterals(GeometricRule):
                 new_rank = RANK.get(new_type, -1)
 
                 if new_rank >= current_rank:
-                    q_fact.subtype = new_type 
+                    kb.update_fact(q_fact, subtype=new_type)
                     
                     if new_type in ["RECTANGLE", "SQUARE", "ISOSCELES_TRAPEZOID"]:
                         vn_map = {"ISOSCELES_TRAPEZOID": "Hình thang cân", "RECTANGLE": "Hình chữ nhật", "SQUARE": "Hình vuông"}
@@ -113,18 +116,19 @@ class RuleClassifyQuadrilaterals(GeometricRule):
 
     def _check_parallel(self, kb, p1, p2, p3, p4):
         if "PARALLEL" in kb.properties:
+            need = kb.point_mask((p1.name, p2.name, p3.name, p4.name))
             for f in kb.properties["PARALLEL"]:
-                s = set(f.entities)
-                if {p1.name, p2.name}.issubset(s) and {p3.name, p4.name}.issubset(s): return True
+                if kb.fact_mask(f) & need == need: return True
         return False
     
     def _check_mutual_midpoints(self, kb, pA, pC, pB, pD):
         mid_AC, mid_BD = None, None
         if "MIDPOINT" in kb.properties:
+            ac, bd = kb.point_mask((pA.name, pC.name)), kb.point_mask((pB.name, pD.name))
             for f in kb.properties["MIDPOINT"]:
-                seg = f.entities[1:]
-                if set(seg) == {pA.name, pC.name}: mid_AC = f.entities[0]
-                if set(seg) == {pB.name, pD.name}: mid_BD = f.entities[0]
+                seg = kb.point_mask(f.entities[1:])
+                if seg == ac: mid_AC = f.entities[0]
+                if seg == bd: mid_BD = f.entities[0]
         return mid_AC and mid_BD and mid_AC == mid_BD
 
     def _check_any_right_angle(self, kb, pts):
@@ -155,15 +159,18 @@ class RuleClassifyQuadrilaterals(GeometricRule):
     
     def _check_diagonals_perpendicular(self, kb, pA, pC, pB, pD):
         if "PERPENDICULAR" in kb.properties:
+            need = kb.point_mask((pA.name, pC.name, pB.name, pD.name))
             for f in kb.properties["PERPENDICULAR"]:
-                s = set(f.entities)
-                if {pA.name, pC.name}.issubset(s) and {pB.name, pD.name}.issubset(s): return True, f
+                if kb.fact_mask(f) & need == need: return True, f
         return False, None
 
 # ==============================================================================
 # RULE 2: ĐỊNH NGHĨA TÍNH CHẤT (Top-Down: Từ Tên gọi -> Tính chất)
 # ==============================================================================
 class RuleExpandSpecialQuadProperties(GeometricRule):
+    reads = ("QUADRILATERAL",)
+    writes = ("PARALLEL", "VALUE", "IS_CYCLIC")
+
     @property
     def name(self): return "Triển khai Tính chất Tứ giác"
     @property
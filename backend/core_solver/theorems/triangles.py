@@ -5,33 +5,44 @@ from core_solver.core.entities import Angle, Segment
 # LUẬT 1: TAM GIÁC ĐỀU
 # ==============================================================================
 class RuleEquilateralTriangle(GeometricRule):
+    reads = ("IS_EQUILATERAL",)
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Tam giác đều"
     @property
     def description(self): return "Tam giác đều có 3 góc bằng 60 độ."
     
     def apply(self, kb) -> bool:
+        return self._apply_to(kb, kb.properties.get("IS_EQUILATERAL", []))
+
+    def apply_delta(self, kb, delta) -> bool:
+        return self._apply_to(kb, delta.of_type("IS_EQUILATERAL"))
+
+    def _apply_to(self, kb, facts):
         changed = False
-        if "IS_EQUILATERAL" in kb.properties:
-            for fact in kb.properties["IS_EQUILATERAL"]:
-                try:
-                    pts = [kb.id_map[n] for n in fact.entities]
-                except KeyError: continue
-                
-                angles = [
-                    Angle(pts[1], pts[0], pts[2]), # A
-                    Angle(pts[0], pts[1], pts[2]), # B
-                    Angle(pts[0], pts[2], pts[1])  # C
-                ]
-                for ang in angles:
-                    if kb.add_property("VALUE", [ang], "Tính chất tam giác đều", value=60, parents=[fact]):
-                        changed = True
+        for fact in facts:
+            try:
+                pts = [kb.id_map[n] for n in fact.entities]
+            except KeyError: continue
+            
+            angles = [
+                Angle(pts[1], pts[0], pts[2]), # A
+                Angle(pts[0], pts[1], pts[2]), # B
+                Angle(pts[0], pts[2], pts[1])  # C
+            ]
+            for ang in angles:
+                if kb.add_property("VALUE", [ang], "Tính chất tam giác đều", value=60, parents=[fact]):
+                    changed = True
         return changed
 
 # ==============================================================================
 # LUẬT 2: TAM GIÁC VUÔNG & VUÔNG CÂN
 # ==============================================================================
 class RuleRightTriangle(GeometricRule):
+    reads = ("TRIANGLE",)
+    writes = ("VALUE", "EQUALITY")
+
     @property
     def name(self): return "Tam giác Vuông/Vuông Cân"
     @property
@@ -82,6 +93,9 @@ class RuleRightTriangle(GeometricRule):
 # LUẬT 3: ĐƯỜNG CAO
 # ==============================================================================
 class RuleAltitudeProperty(GeometricRule):
+    reads = ("ALTITUDE", "INTERSECTION")
+    writes = ("VALUE",)
+
     @property
     def name(self): return "Tính chất Đường cao"
     @property
@@ -125,6 +139,9 @@ class RuleIsoscelesLineCoincidence(GeometricRule):
     Luật: Trong tam giác cân, đường trung tuyến đồng thời là đường cao, phân giác.
     Ngược lại: Đường cao đồng thời là trung tuyến...
     """
+    reads = ("TRIANGLE", "MIDPOINT", "ALTITUDE")
+    writes = ("VALUE", "EQUALITY", "MIDPOINT")
+
     @property
     def name(self): return "Đường đặc biệt trong Tam giác cân"
     @property
@@ -185,6 +202,9 @@ class RuleMedianInRightTriangle(GeometricRule):
     Luật: Trong tam giác vuông, đường trung tuyến ứng với cạnh huyền bằng nửa cạnh huyền.
     Hệ quả: Tâm đường tròn ngoại tiếp là trung điểm cạnh huyền.
     """
+    reads = ("TRIANGLE", "MIDPOINT")
+    writes = ("EQUALITY", "CIRCLE")
+
     @property
     def name(self): return "Trung tuyến tam giác vuông"
     @property
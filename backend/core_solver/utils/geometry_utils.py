@@ -2,6 +2,7 @@ import math
 from typing import List, Any, Optional
 
 TOLERANCE = 1e-5  # Độ sai số cho phép khi so sánh số thực
+VALUE_DECIMALS = 4  # Số chữ số thập phân giữ lại khi dùng giá trị làm khóa tra cứu
 
 def is_close(val1: float, val2: float) -> bool:
     """
@@ -12,6 +13,10 @@ def is_close(val1: float, val2: float) -> bool:
         return False
     return math.isclose(val1, val2, rel_tol=TOLERANCE)
 
+def value_key(value: float) -> float:
+    """Khóa tra cứu của giá trị số: các giá trị chỉ lệch nhau do sai số làm tròn cho cùng một khóa."""
+    return round(value, VALUE_DECIMALS) + 0.0
+
 def calculate_supplementary(angle_value: float) -> Optional[float]:
     """Trả về góc bù (180 - alpha)."""
     if angle_value is None: return None
@@ -0,0 +1,183 @@
+"""
+Tracing nhẹ thay cho print() ở các đường nóng.
+
+- Mỗi phân hệ (kb, engine, parser, plotter, api...) có một Tracer với ngưỡng mức riêng.
+- Điểm trace bị tắt gần như không tốn gì: nơi gọi kiểm tra cờ trước khi dựng chuỗi
+      if _trace.is_debug: _trace.debug("add_source", f"...", fact=fid)
+- Bản ghi bật được đẩy vào sink có cấu trúc (ring buffer trong bộ nhớ hoặc file JSONL), không ra stdout.
+
+Cấu hình qua biến môi trường (đọc khi import) hoặc configure():
+    GEOMETRY_TRACE="kb=debug,engine=info,*=warning"
+    GEOMETRY_TRACE_SINK="ring" | "ring:5000" | "jsonl:/tmp/trace.jsonl" | "stdout"
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR", OFF: "OFF"}
+_LEVELS_BY_NAME = {name.lower(): level for level, name in LEVEL_NAMES.items()}
+
+DEFAULT_SPEC = "*=warning"
+DEFAULT_SINK = "ring"
+
+# ==============================================================================
+# SINKS
+# ==============================================================================
+class RingBufferSink:
+    """Giữ N bản ghi gần nhất trong bộ nhớ (deque.append an toàn giữa các luồng)."""
+    def __init__(self, capacity=10000):
+        self.buffer = collections.deque(maxlen=capacity)
+
+    def write(self, record):
+        self.buffer.append(record)
+
+    def records(self):
+        return list(self.buffer)
+
+    def clear(self):
+        self.buffer.clear()
+
+
+class JsonlSink:
+    """Ghi mỗi bản ghi thành một dòng JSON."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def records(self):
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def close(self):
+        self._file.close()
+
+
+class StdoutSink:
+    """Chỉ dùng khi phát triển: in bản ghi ra màn hình như các print() cũ."""
+    def write(self, record):
+        print(f"[{record['subsystem']}] {record.get('message') or record['event']}")
+
+    def records(self):
+        return []
+
+
+def make_sink(spec):
+    """Tạo sink từ chuỗi cấu hình: "ring[:capacity]", "jsonl:path" hoặc "stdout"."""
+    kind, _, arg = spec.partition(":")
+    if kind == "ring": return RingBufferSink(int(arg) if arg else 10000)
+    if kind == "jsonl": return JsonlSink(arg)
+    if kind == "stdout": return StdoutSink()
+    raise ValueError(f"Sink không hợp lệ: {spec}")
+
+# ==============================================================================
+# TRACER
+# ==============================================================================
+class Tracer:
+    """
+    Tracer của một phân hệ. Các cờ is_debug/is_info/is_warning/is_error được tính sẵn
+    mỗi khi cấu hình thay đổi, nên kiểm tra chỉ tốn một lần đọc thuộc tính.
+    """
+    __slots__ = ("subsystem", "level", "is_debug", "is_info", "is_warning", "is_error")
+
+    def __init__(self, subsystem, level):
+        self.subsystem = subsystem
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = level
+        self.is_debug = level <= DEBUG
+        self.is_info = level <= INFO
+        self.is_warning = level <= WARNING
+        self.is_error = level <= ERROR
+
+    def log(self, level, event, message=None, **fields):
+        if level < self.level: return
+        record = {"ts": time.time(), "subsystem": self.subsystem, "level": LEVEL_NAMES.get(level, level),
+                  "event": event}
+        if message is not None: record["message"] = message
+        if fields: record.update(fields)
+        _state.sink.write(record)
+
+    def debug(self, event, message=None, **fields): self.log(DEBUG, event, message, **fields)
+    def info(self, event, message=None, **fields): self.log(INFO, event, message, **fields)
+    def warning(self, event, message=None, **fields): self.log(WARNING, event, message, **fields)
+    def error(self, event, message=None, **fields): self.log(ERROR, event, message, **fields)
+
+
+class _State:
+    def __init__(self):
+        self.levels = {}        # {subsystem: level} từ cấu hình
+        self.default = WARNING  # Mức cho phân hệ không được nêu tên ("*")
+        self.tracers = {}       # {subsystem: Tracer}
+        self.sink = RingBufferSink()
+        self.lock = threading.Lock()
+
+_state = _State()
+
+
+def parse_spec(spec):
+    """"kb=debug,*=warning" -> ({"kb": DEBUG}, WARNING)."""
+    levels = {}; default = WARNING
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, level_name = part.partition("=")
+        level = _LEVELS_BY_NAME.get(level_name.strip().lower() or "debug")
+        if level is None: raise ValueError(f"Mức trace không hợp lệ: {part}")
+        if name.strip() == "*": default = level
+        else: levels[name.strip()] = level
+    return levels, default
+
+
+def get_tracer(subsystem):
+    """Tracer dùng chung của phân hệ (giữ tham chiếu ở cấp module, cấu hình lại vẫn có hiệu lực)."""
+    tracer = _state.tracers.get(subsystem)
+    if tracer is None:
+        with _state.lock:
+            tracer = _state.tracers.get(subsystem)
+            if tracer is None:
+                tracer = Tracer(subsystem, _state.levels.get(subsystem, _state.default))
+                _state.tracers[subsystem] = tracer
+    return tracer
+
+
+def configure(spec=None, sink=None):
+    """
+    Đổi mức trace (chuỗi spec) và/hoặc sink (đối tượng có write(record) hoặc chuỗi cấu hình).
+    Áp dụng ngay cho mọi Tracer đã tạo.
+    """
+    with _state.lock:
+        if spec is not None:
+            _state.levels, _state.default = parse_spec(spec)
+            for name, tracer in _state.tracers.items():
+                tracer.set_level(_state.levels.get(name, _state.default))
+        if sink is not None:
+            _state.sink = make_sink(sink) if isinstance(sink, str) else sink
+
+
+def get_sink():
+    return _state.sink
+
+
+def recent(subsystem=None):
+    """Các bản ghi hiện có trong sink (lọc theo phân hệ nếu cần)."""
+    records = _state.sink.records()
+    if subsystem is not None:
+        records = [r for r in records if r["subsystem"] == subsystem]
+    return records
+
+
+configure(os.getenv("GEOMETRY_TRACE", DEFAULT_SPEC), os.getenv("GEOMETRY_TRACE_SINK", DEFAULT_SINK))
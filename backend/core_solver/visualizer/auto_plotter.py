@@ -3,6 +3,9 @@ from core_solver.core.knowledge_base import KnowledgeGraph
 from core_solver.utils.geometry_utils import is_close
 from core_solver.visualizer.geometry_optimizer import GeometryOptimizer
 import math
+from core_solver.utils import tracing
+
+_trace = tracing.get_tracer("plotter")
 
 class AutoGeometryPlotter(GeometryPlotter):
     def __init__(self, kb: KnowledgeGraph):
@@ -12,7 +15,7 @@ class AutoGeometryPlotter(GeometryPlotter):
         self.ordered_vertices = None 
 
     def auto_draw(self, should_show=True):
-        print("--- BẮT ĐẦU VẼ HÌNH (SMART MODE) ---")
+        if _trace.is_info: _trace.info("start", "Bắt đầu vẽ hình (smart mode)")
       
         # 1. LẤY MỤC TIÊU VẼ
         self.ordered_vertices = None
@@ -63,7 +66,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                 optimized_points = optimizer.optimize(self.points)
                 self.points = optimized_points 
             except Exception as e:
-                print(f"⚠️ Lỗi Optimizer: {e}. Sử dụng tọa độ phác thảo.")
+                if _trace.is_warning: _trace.warning("optimizer_failed", f"Lỗi Optimizer: {e}. Sử dụng tọa độ phác thảo.")
 
         self._draw_missing_points_logic()
         self._draw_altitudes_and_orthocenter()
@@ -77,7 +80,7 @@ class AutoGeometryPlotter(GeometryPlotter):
         
         segments_to_draw = self._collect_segments()
         degenerate_msg = self.check_degenerate_polygon()
-        if degenerate_msg: print(f"⚠️ CẢNH BÁO: {degenerate_msg}")
+        if degenerate_msg and _trace.is_warning: _trace.warning("degenerate", degenerate_msg)
 
 
         self.draw(should_show=should_show, 
@@ -101,7 +104,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                         y_prime = 2*yO - yA
                         self.add_point(pA_prime, x_prime, y_prime)
                         count += 1
-                        print(f"   [+] Dựng điểm đối xứng tâm {pA_prime}")
+                        if _trace.is_debug: _trace.debug("construct", f"Dựng điểm đối xứng tâm {pA_prime}")
                 
                 elif subtype == "AXIAL" and len(fact.entities) == 4:
                     pA, pA_prime, pM, pN = fact.entities
@@ -114,7 +117,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                             y_prime = 2*hy - yA
                             self.add_point(pA_prime, x_prime, y_prime)
                             count += 1
-                            print(f"   [+] Dựng điểm đối xứng trục {pA_prime}")
+                            if _trace.is_debug: _trace.debug("construct", f"Dựng điểm đối xứng trục {pA_prime}")
         return count
 
     def _construct_from_bisector(self):
@@ -140,7 +143,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                             yD = (yB + k*yC) / (1 + k)
                             self.add_point(pD, xD, yD)
                             count += 1
-                            print(f"   [+] Dựng chân phân giác {pD}")
+                            if _trace.is_debug: _trace.debug("construct", f"Dựng chân phân giác {pD}")
         return count
 
     # =========================================================================
@@ -204,7 +207,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                 self.add_point_from_distances(ref1, ref2, target, r1, r2)
                 if target in self.points:
                     count += 1
-                    print(f"   [+] Dựng điểm {target} từ khoảng cách tới {ref1}, {ref2}")
+                    if _trace.is_debug: _trace.debug("construct", f"Dựng điểm {target} từ khoảng cách tới {ref1}, {ref2}")
         return count
 
     def _draw_exterior_angles(self):
@@ -255,7 +258,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                         inter = self._calculate_line_intersection(l1[0], l1[1], l2[0], l2[1])
                         if inter:
                             self.add_point(p_name, inter[0], inter[1])
-                            print(f"   [+] Dựng giao điểm {p_name}")
+                            if _trace.is_debug: _trace.debug("construct", f"Dựng giao điểm {p_name}")
 
     def _draw_known_angles(self):
         def resolve_point_name(raw_item):
@@ -294,10 +297,10 @@ class AutoGeometryPlotter(GeometryPlotter):
                         if p1 and v and p2:
                             if {p1, v, p2}.issubset(self.points.keys()):
                                 self.add_angle_marker(v, p1, p2, value=fact.value, color='red')
-                                print(f"   [Plotter] Đã vẽ góc {v} ({p1}-{v}-{p2}) = {fact.value}")
+                                if _trace.is_debug: _trace.debug("draw_angle", f"Đã vẽ góc {v} ({p1}-{v}-{p2}) = {fact.value}")
                     
                     except Exception as e:
-                        print(f"⚠️ Lỗi vẽ góc {getattr(fact, 'entities', '?')}: {e}")
+                        if _trace.is_warning: _trace.warning("angle_draw_failed", f"Lỗi vẽ góc {getattr(fact, 'entities', '?')}: {e}")
                         continue
     
     # =========================================================================
@@ -362,7 +365,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                             break
             
             if has_special_tri:
-                print("   [Smart Draw] Phát hiện tam giác đặc biệt, nhường quyền dựng hình.")
+                if _trace.is_debug: _trace.debug("smart_draw", "Phát hiện tam giác đặc biệt, nhường quyền dựng hình.")
                 self.drawn_points.update([pA, pB])
                 return True
 
@@ -544,7 +547,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                     
                     count += 1
                     type_str = "Đều" if is_equilateral else "Cân"
-                    print(f"   [+] Dựng đỉnh {target} ({type_str}) từ đáy {p1}{p2}")
+                    if _trace.is_debug: _trace.debug("construct", f"Dựng đỉnh {target} ({type_str}) từ đáy {p1}{p2}")
 
                 elif (vertex == target or (vertex is None and target not in self.points)) and is_right:
                     ang_p1 = self._get_angle_from_kb(target, p1, p2)
@@ -557,7 +560,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                     
                     self.add_point(target, target_x, target_y)
                     count += 1
-                    print(f"   [+] Dựng đỉnh vuông {target} từ huyền {p1}{p2}")
+                    if _trace.is_debug: _trace.debug("construct", f"Dựng đỉnh vuông {target} từ huyền {p1}{p2}")
 
         return count
 
@@ -709,7 +712,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                                     flatten = [p for line in lines for p in line]
                                     if set(flatten) == set(v):
                                         self.add_point(p_name, inter[0], inter[1])
-                                        print(f"   [+] Dựng giao điểm chéo {p_name}")
+                                        if _trace.is_debug: _trace.debug("construct", f"Dựng giao điểm chéo {p_name}")
                             except: continue
 
     def _draw_altitudes_and_orthocenter(self):
@@ -721,7 +724,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                 intersect = self._calculate_line_intersection(t1, f1, t2, f2)
                 if intersect: 
                     self.add_point('H', intersect[0], intersect[1])
-                    print("   [+] Dựng trực tâm H")
+                    if _trace.is_debug: _trace.debug("construct", "Dựng trực tâm H")
 
         for fact in alts:
             top, foot, b1, b2 = fact.entities
@@ -756,7 +759,7 @@ class AutoGeometryPlotter(GeometryPlotter):
             
             has_equidistant_proof = False
             for src in target_fact.sources:
-                if "cách đều" in src['reason']:
+                if "cách đều" in src.reason:
                     has_equidistant_proof = True
                     break
             
@@ -768,7 +771,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                         center_name = c_fact.center
                 
                 if center_name in self.points and self.ordered_vertices:
-                    print(f"   [+] [Visual] Vẽ thêm các bán kính từ tâm {center_name}")
+                    if _trace.is_debug: _trace.debug("construct", f"Vẽ thêm các bán kính từ tâm {center_name}")
                     for v in self.ordered_vertices:
                         if v in self.points:
                             segments.add(tuple(sorted((center_name, v))))
@@ -804,7 +807,7 @@ class AutoGeometryPlotter(GeometryPlotter):
 
     def _get_angle_from_kb(self, p1, v, p3):
         from core_solver.core.entities import Angle, Point
-        try: tid = Angle(Point(p1), Point(v), Point(p3)).canonical_id
+        try: tid = self.kb.canonical_angle(Angle(Point(p1), Point(v), Point(p3))).canonical_id
         except: return None
         if "VALUE" in self.kb.properties:
             for f in self.kb.properties["VALUE"]: 
@@ -889,7 +892,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                             ty = y1 + b * math.sin(target_angle)
                             
                             self.add_point(target, tx, ty)
-                            print(f"   [+] Dựng điểm {target} từ góc {v1}={ang1}, {v2}={ang2}")
+                            if _trace.is_debug: _trace.debug("construct", f"Dựng điểm {target} từ góc {v1}={ang1}, {v2}={ang2}")
                             count += 1
                             break
                     if target in self.points: break
@@ -919,7 +922,7 @@ class AutoGeometryPlotter(GeometryPlotter):
             missing_D = pD not in self.points
             
             if missing_C or missing_D:
-                print("   [Fallback] Vẽ bổ sung các đỉnh tứ giác còn thiếu.")
+                if _trace.is_debug: _trace.debug("fallback", "Vẽ bổ sung các đỉnh tứ giác còn thiếu.")
                 BASE_LEN = 6.0
                 angle_A = 80.0
                 angle_B = 75.0
@@ -950,7 +953,7 @@ class AutoGeometryPlotter(GeometryPlotter):
                          mx = sum(xs)/len(xs) if xs else 3
                          my = sum(ys)/len(ys) if ys else 3
                          self.add_point(c, mx, my)
-                         print(f"   [+] Seed điểm tâm {c} vào Optimizer")
+                         if _trace.is_debug: _trace.debug("construct", f"Seed điểm tâm {c} vào Optimizer")
 
         # 2. Tìm điểm trong EQUALITY 
         if "EQUALITY" in self.kb.properties:
@@ -976,4 +979,4 @@ class AutoGeometryPlotter(GeometryPlotter):
                             jitter_y = (hash(p_name + "y") % 100) / 50.0
                             
                             self.add_point(p_name, 2 + jitter_x, 2 + jitter_y)
-                            print(f"   [+] Seed điểm {p_name} (Random jitter)")
\ No newline at end of file
+                            if _trace.is_debug: _trace.debug("construct", f"Seed điểm {p_name} (Random jitter)")
\ No newline at end of file
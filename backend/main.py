@@ -8,10 +8,16 @@ import math
 
 from core_solver.parser.api_parser import LLMParser
 from core_solver.test_runner import setup_system
+from core_solver.inference.goal import Goal, SolveResult
+from core_solver.inference.budget import Budget
+from core_solver.inference.parallel import ParallelProver, merge_outcomes
+from core_solver.inference.session import SessionStore
+from core_solver.utils import tracing
 from core_solver.visualizer.auto_plotter import AutoGeometryPlotter
 from core_solver.proof.proof_generator import ProofGenerator
 
 app = FastAPI()
+_trace = tracing.get_tracer("api")
 
 # Cấu hình CORS
 origins = ["http://localhost:5173", "http://localhost:3000"]
@@ -23,8 +29,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Dừng suy diễn ngay khi tứ giác cần chứng minh có đủ số cách giải này
+MIN_PROOF_METHODS = 1
+# Ngân sách cho mỗi request: một đề bài bệnh lý không được giữ worker quá lâu
+SOLVE_TIME_LIMIT = 3.0        # giây
+SOLVE_MAX_FACTS = 20000
+SOLVE_MAX_EQUALITY_EDGES = 50000
+# Chế độ song song: sau lời giải đầu tiên, chờ thêm tối đa chừng này giây để thu các cách chứng minh khác
+PARALLEL_COLLECT_GRACE = 0.3  # giây
+
+# Phiên giải (/session): số phiên giữ trong bộ nhớ và thời gian sống khi không được dùng
+SESSION_MAX = 64
+SESSION_TTL = 1800.0          # giây
+
+_prover = None # ParallelProver dùng chung (tạo khi có request parallel đầu tiên)
+_sessions = SessionStore(SESSION_MAX, SESSION_TTL)
+
+def get_prover():
+    global _prover
+    if _prover is None: _prover = ParallelProver()
+    return _prover
+
 class ProblemRequest(BaseModel):
     text: str
+    debug: bool = False # Trả kèm thống kê thời gian chạy từng luật (engine.stats)
+    goal_directed: bool = False # Suy diễn lùi từ mục tiêu thay vì bão hòa toàn bộ
+    agenda: bool = False # Chạy luật theo hàng đợi ưu tiên (best-first) thay vì thứ tự cố định
+    sliced: bool = False # Suy diễn trước trên phần KB liên quan tới tứ giác mục tiêu
+    parallel: bool = False # Chạy từng cách chứng minh trên một tiến trình, lấy lời giải đến trước
+
+class SessionFactsRequest(BaseModel):
+    text: str = ""    # Giả thiết bổ sung dạng văn bản (gửi Gemini, chỉ phần mới)
+    facts: list = []  # Hoặc dữ kiện dạng JSON (cùng định dạng đầu ra của Gemini), không gọi API
+    debug: bool = False
+
+def build_goal(kb):
+    """Mục tiêu: tứ giác trong RENDER_ORDER nội tiếp (không có thì tứ giác nội tiếp bất kỳ)."""
+    if "RENDER_ORDER" in kb.properties:
+        render_fact = kb.properties["RENDER_ORDER"][0]
+        return Goal("IS_CYCLIC", render_fact.entities)
+    return Goal("IS_CYCLIC")
+
+def configure_engine(engine, request):
+    engine.goal_directed = request.goal_directed
+    engine.agenda = request.agenda
+    engine.sliced = request.sliced
+
+def session_factory(request):
+    """Hàm tạo (kb, engine) mới cấu hình theo request - phiên dùng lại khi phải dựng lại KB."""
+    def make():
+        kb, engine = setup_system()
+        configure_engine(engine, request)
+        return kb, engine
+    return make
+
+def make_budget():
+    return Budget(time_limit=SOLVE_TIME_LIMIT, max_facts=SOLVE_MAX_FACTS,
+                  max_equality_edges=SOLVE_MAX_EQUALITY_EDGES)
+
+def server_error(e):
+    print(f"Error: {e}")
+    import traceback
+    traceback.print_exc()
+    return HTTPException(status_code=500, detail=str(e))
 
 def plot_to_base64(plotter):
     """Chuyển hình vẽ matplotlib sang chuỗi base64."""
@@ -53,111 +120,207 @@ def check_coordinate_overlap(entities, plotter_points, threshold=0.2):
                 return f"Điểm {names[i]} trùng với điểm {names[j]}"
     return None
 
+def build_response(kb, result, stats, debug=False):
+    """Vẽ hình và tổng hợp lời giải / mâu thuẫn / cảnh báo từ KB sau suy diễn (stats: EngineStats của lần suy diễn đó)."""
+    # Vẽ hình
+    plotter = AutoGeometryPlotter(kb)
+    plotter.auto_draw(should_show=False)
+    
+    # Tổng hợp kết quả
+    solutions = []
+    status = "success"
+    proof_gen = ProofGenerator(kb)
+    
+    degenerate_msg = plotter.check_degenerate_polygon()
+    if degenerate_msg:
+        status = "contradiction"
+        solutions.append(f"⚠️ LỖI HÌNH HỌC: {degenerate_msg}")
+        solutions.append("Hình vẽ bị suy biến (đỉnh trùng nhau), bài toán không tồn tại.")
+
+    elif "CONTRADICTION" in kb.properties:
+        status = "contradiction"
+        solutions.append("⚠️ PHÁT HIỆN MÂU THUẪN TRONG ĐỀ BÀI:")
+        for fact in kb.properties["CONTRADICTION"]:
+            solutions.append(f"- {fact.reason}")
+
+    elif "IS_CYCLIC" in kb.properties:
+        target_fact = kb.properties["IS_CYCLIC"][0]
+        
+        if "RENDER_ORDER" in kb.properties:
+            render_fact = list(kb.properties["RENDER_ORDER"])[0]
+            target_set = set(render_fact.entities)
+            
+            for f in kb.properties["IS_CYCLIC"]:
+                if set(f.entities) == target_set:
+                    target_fact = f
+                    break
+        
+        if _trace.is_debug:
+            _trace.debug("target", f"Chọn Target Fact: {target_fact.id} với {len(target_fact.sources)} cách giải.",
+                         fact=target_fact.id, sources=len(target_fact.sources))
+
+        overlap_error = check_coordinate_overlap(target_fact.entities, plotter.points)
+        
+        if overlap_error:
+            status = "contradiction"
+            solutions.append(f"⚠️ PHÁT HIỆN MÂU THUẪN THỰC TẾ:")
+            solutions.append(f"- Lý thuyết chứng minh được, nhưng trên hình vẽ: {overlap_error}.")
+            solutions.append("- Có thể bài toán rơi vào trường hợp đặc biệt (suy biến).")
+        else:
+            status = "success"
+            proof_list = proof_gen.generate_proof(target_fact)
+            if proof_list and isinstance(proof_list, list):
+                solutions.extend(proof_list)
+            else:
+                solutions.append(target_fact.reason)
+
+    else:
+        status = "warning"
+        solutions.append("⚠️ KHÔNG TÌM THẤY LỜI GIẢI.")
+        solutions.append("Hệ thống đã phân tích các dữ kiện sau nhưng chưa đủ để kết luận:")
+        
+        SUBTYPE_MAP = {
+            "TRAPEZOID": "Hình thang thường",
+            "ISOSCELES_TRAPEZOID": "Hình thang cân",
+            "RIGHT_TRAPEZOID": "Hình thang vuông",
+            "PARALLELOGRAM": "Hình bình hành",
+            "RECTANGLE": "Hình chữ nhật",
+            "RHOMBUS": "Hình thoi",
+            "SQUARE": "Hình vuông",
+            None: "Tứ giác thường"
+        }
+
+        if "QUADRILATERAL" in kb.properties:
+            q = kb.properties["QUADRILATERAL"][0]
+            raw_type = getattr(q, 'subtype', None)
+            vn_type = SUBTYPE_MAP.get(raw_type, raw_type if raw_type else "Tứ giác thường")
+            solutions.append(f"- Tứ giác: {''.join(q.entities)} (Loại: {vn_type})")
+        
+        if "PARALLEL" in kb.properties:
+            solutions.append(f"- Có {len(kb.properties['PARALLEL'])} cặp cạnh song song.")
+        
+        if "VALUE" in kb.properties:
+            solutions.append(f"- Đã tính được {len(kb.properties['VALUE'])} giá trị góc/cạnh.")
+
+        if result.truncated:
+            solutions.append(f"- Quá trình suy luận bị dừng do vượt giới hạn ({result.detail}).")
+        solutions.append("➤ Gợi ý: Kiểm tra lại đề bài (chính tả, dữ kiện thiếu).")
+
+    # Xuất hình ảnh
+    image_base64 = plot_to_base64(plotter)
+    
+    response = {
+        "status": status,
+        "solutions": solutions, 
+        "image": f"data:image/png;base64,{image_base64}",
+        "debug_facts": f"Facts: {len(kb.facts)}",
+        "truncated": result.truncated
+    }
+    if debug:
+        response["stats"] = stats.to_dict()
+    return response
+
 @app.post("/solve")
 async def solve_problem(request: ProblemRequest):
     try:
         # 1. Setup hệ thống
         kb, engine = setup_system()
+        configure_engine(engine, request)
         
         # 2. Parse đề bài
         parser = LLMParser(kb)
         parser.parse(request.text)
         
-        # 3. Chạy suy luận
-        engine.solve()
-        
-        # 4. Vẽ hình
-        plotter = AutoGeometryPlotter(kb)
-        plotter.auto_draw(should_show=False)
-        
-        # 5. Tổng hợp kết quả
-        solutions = []
-        status = "success"
-        proof_gen = ProofGenerator(kb)
+        # 3. Chạy suy luận (dừng sớm khi đã chứng minh xong hoặc phát hiện mâu thuẫn)
+        goal = build_goal(kb)
+        result = None
+        if request.parallel:
+            race = get_prover().submit(kb, goal, MIN_PROOF_METHODS, SOLVE_TIME_LIMIT,
+                                       max_facts=SOLVE_MAX_FACTS, max_equality_edges=SOLVE_MAX_EQUALITY_EDGES)
+            first = race.first()
+            if first is not None:
+                outcomes = race.collect(timeout=PARALLEL_COLLECT_GRACE)
+                kb = first.kb
+                result = SolveResult(first.stop_reason, 0, merge_outcomes(first, outcomes), first.truncated)
+                stats = first.stats # Thống kê của job thắng
+                if _trace.is_info:
+                    _trace.info("parallel_done", f"Lời giải đầu tiên: {first.method} ({first.elapsed * 1000:.1f} ms)",
+                                method=first.method, outcomes=[repr(o) for o in outcomes])
+
+        if result is None:
+            result = engine.solve(goal=goal, min_methods=MIN_PROOF_METHODS,
+                                  stop_on_contradiction=True, budget=make_budget())
+            stats = engine.stats
+        if _trace.is_info:
+            _trace.info("solve_done", f"Suy diễn dừng do '{result.stop_reason}' sau {result.rounds} vòng.",
+                        stop_reason=result.stop_reason, rounds=result.rounds, truncated=result.truncated)
         
-        degenerate_msg = plotter.check_degenerate_polygon()
-        if degenerate_msg:
-            status = "contradiction"
-            solutions.append(f"⚠️ LỖI HÌNH HỌC: {degenerate_msg}")
-            solutions.append("Hình vẽ bị suy biến (đỉnh trùng nhau), bài toán không tồn tại.")
+        return build_response(kb, result, stats, request.debug)
 
-        elif "CONTRADICTION" in kb.properties:
-            status = "contradiction"
-            solutions.append("⚠️ PHÁT HIỆN MÂU THUẪN TRONG ĐỀ BÀI:")
-            for fact in kb.properties["CONTRADICTION"]:
-                solutions.append(f"- {fact.reason}")
+    except Exception as e:
+        raise server_error(e)
 
-        elif "IS_CYCLIC" in kb.properties:
-            target_fact = kb.properties["IS_CYCLIC"][0]
-            
-            if "RENDER_ORDER" in kb.properties:
-                render_fact = list(kb.properties["RENDER_ORDER"])[0]
-                target_set = set(render_fact.entities)
-                
-                for f in kb.properties["IS_CYCLIC"]:
-                    if set(f.entities) == target_set:
-                        target_fact = f
-                        break
-            
-            print(f"DEBUG_MAIN: Chọn Target Fact: {target_fact.id} với {len(target_fact.sources)} cách giải.")
+@app.post("/session")
+async def create_session(request: ProblemRequest):
+    """
+    Như /solve nhưng giữ KB + engine trong bộ nhớ (trả về session_id) để thêm giả thiết qua
+    /session/{id}/facts. Phiên luôn suy diễn tuần tự trong tiến trình này (bỏ qua parallel).
+    """
+    try:
+        factory = session_factory(request)
+        kb, engine = factory()
+        parser = LLMParser(kb)
+        parser.parse(request.text)
+        result = engine.solve(goal=build_goal(kb), min_methods=MIN_PROOF_METHODS,
+                              stop_on_contradiction=True, budget=make_budget())
+        session = _sessions.create(kb, engine, parser, factory)
+        session.solves += 1
 
-            overlap_error = check_coordinate_overlap(target_fact.entities, plotter.points)
-            
-            if overlap_error:
-                status = "contradiction"
-                solutions.append(f"⚠️ PHÁT HIỆN MÂU THUẪN THỰC TẾ:")
-                solutions.append(f"- Lý thuyết chứng minh được, nhưng trên hình vẽ: {overlap_error}.")
-                solutions.append("- Có thể bài toán rơi vào trường hợp đặc biệt (suy biến).")
-            else:
-                status = "success"
-                proof_list = proof_gen.generate_proof(target_fact)
-                if proof_list and isinstance(proof_list, list):
-                    solutions.extend(proof_list)
-                else:
-                    solutions.append(target_fact.reason)
+        response = build_response(kb, result, engine.stats, request.debug)
+        response["session_id"] = session.id
+        return response
 
-        else:
-            status = "warning"
-            solutions.append("⚠️ KHÔNG TÌM THẤY LỜI GIẢI.")
-            solutions.append("Hệ thống đã phân tích các dữ kiện sau nhưng chưa đủ để kết luận:")
-            
-            SUBTYPE_MAP = {
-                "TRAPEZOID": "Hình thang thường",
-                "ISOSCELES_TRAPEZOID": "Hình thang cân",
-                "RIGHT_TRAPEZOID": "Hình thang vuông",
-                "PARALLELOGRAM": "Hình bình hành",
-                "RECTANGLE": "Hình chữ nhật",
-                "RHOMBUS": "Hình thoi",
-                "SQUARE": "Hình vuông",
-                None: "Tứ giác thường"
-            }
-
-            if "QUADRILATERAL" in kb.properties:
-                q = kb.properties["QUADRILATERAL"][0]
-                raw_type = getattr(q, 'subtype', None)
-                vn_type = SUBTYPE_MAP.get(raw_type, raw_type if raw_type else "Tứ giác thường")
-                solutions.append(f"- Tứ giác: {''.join(q.entities)} (Loại: {vn_type})")
-            
-            if "PARALLEL" in kb.properties:
-                solutions.append(f"- Có {len(kb.properties['PARALLEL'])} cặp cạnh song song.")
-            
-            if "VALUE" in kb.properties:
-                solutions.append(f"- Đã tính được {len(kb.properties['VALUE'])} giá trị góc/cạnh.")
+    except Exception as e:
+        raise server_error(e)
 
-            solutions.append("➤ Gợi ý: Kiểm tra lại đề bài (chính tả, dữ kiện thiếu).")
+@app.post("/session/{session_id}/facts")
+async def add_session_facts(session_id: str, request: SessionFactsRequest):
+    """
+    Thêm giả thiết vào phiên rồi suy diễn tiếp: engine chỉ xử lý phần tri thức mới
+    (mốc semi-naive / mạng Rete của lần trước vẫn còn) thay vì bão hòa lại từ đầu.
+    Giả thiết làm đổi đường thẳng / tia (giao điểm, điểm thuộc đường...) thì phiên được dựng lại và giải lại từ đầu.
+    """
+    session = _sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Phiên không tồn tại hoặc đã hết hạn")
+    try:
+        with session.lock:
+            marker = session.kb.marker()
+            rebuilt = session.add_hypotheses(request.facts, request.text)
+            kb, engine = session.kb, session.engine
+            if rebuilt: marker = None # KB mới: mọi thao tác đều là mới
+            added = len(kb.diff(marker))
 
-        # Xuất hình ảnh
-        image_base64 = plot_to_base64(plotter)
-        
-        return {
-            "status": status,
-            "solutions": solutions, 
-            "image": f"data:image/png;base64,{image_base64}",
-            "debug_facts": f"Facts: {len(kb.facts)}"
-        }
+            result = engine.solve(goal=build_goal(kb), min_methods=MIN_PROOF_METHODS,
+                                  stop_on_contradiction=True, budget=make_budget())
+            session.solves += 1
+            changes = len(kb.diff(marker))
+            if _trace.is_info:
+                _trace.info("session_solve", f"Phiên {session.id}: +{added} thao tác giả thiết, dừng do '{result.stop_reason}'",
+                            session=session.id, hypotheses=added, changes=changes, rebuilt=rebuilt,
+                            stop_reason=result.stop_reason)
+
+            response = build_response(kb, result, engine.stats, request.debug)
+            response["session_id"] = session.id
+            response["changes"] = changes # Số thao tác trên KB (giả thiết mới + tri thức suy ra thêm)
+            response["rebuilt"] = rebuilt # Phiên đã được dựng lại và giải lại từ đầu
+            return response
 
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise server_error(e)
+
+@app.delete("/session/{session_id}")
+async def close_session(session_id: str):
+    if not _sessions.drop(session_id):
+        raise HTTPException(status_code=404, detail="Phiên không tồn tại hoặc đã hết hạn")
+    return {"status": "closed"}
\ No newline at end of file
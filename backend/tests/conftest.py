@@ -0,0 +1,20 @@
+import pytest
+
+from core_solver.inference.budget import Budget
+
+
+class CancelAfter(Budget):
+    """Ngân sách tự hủy sau n lần kiểm tra (engine giữa các luật, kb.check_budget() trong luật)."""
+    def __init__(self, n):
+        super().__init__()
+        self.n = n
+
+    def check(self, kb):
+        self.n -= 1
+        if self.n < 0: self.cancel()
+        super().check(kb)
+
+
+@pytest.fixture
+def cancel_after():
+    return CancelAfter
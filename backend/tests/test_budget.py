@@ -0,0 +1,54 @@
+"""
+Ngân sách suy diễn: solve() bị ngắt giữa chừng trả về kết quả truncated và để engine chạy tiếp được
+trên cùng KB - solve() lần sau phải cho cùng tri thức với một lần giải không bị ngắt.
+"""
+import pytest
+
+api_parser = pytest.importorskip("core_solver.parser.api_parser") # Cần google-generativeai, python-dotenv
+
+from core_solver.inference.budget import Budget
+from core_solver.inference.goal import SolveResult
+from core_solver.test_runner import setup_system
+
+PROBLEMS = {
+    "altitudes": [
+        {"type": "TRIANGLE", "points": ["A", "B", "C"], "properties": ["ACUTE"], "vertex": None},
+        {"type": "ALTITUDE", "top": "B", "foot": "M", "base": ["A", "C"]},
+        {"type": "ALTITUDE", "top": "C", "foot": "N", "base": ["A", "B"]},
+        {"type": "INTERSECTION", "point": "H", "lines": [["B", "M"], ["C", "N"]]},
+        {"type": "RENDER_ORDER", "points": ["A", "M", "H", "N"]},
+    ],
+    "bcmn": [
+        {"type": "TRIANGLE", "points": ["A", "B", "C"], "properties": ["ACUTE"], "vertex": None},
+        {"type": "ALTITUDE", "top": "B", "foot": "M", "base": ["A", "C"]},
+        {"type": "ALTITUDE", "top": "C", "foot": "N", "base": ["A", "B"]},
+        {"type": "RENDER_ORDER", "points": ["B", "C", "M", "N"]},
+    ],
+}
+
+
+def load(items):
+    kb, engine = setup_system()
+    api_parser.LLMParser(kb).add_items([dict(item) for item in items])
+    return kb, engine
+
+
+def test_budget_stops_with_truncated_result(cancel_after):
+    kb, engine = load(PROBLEMS["altitudes"])
+    result = engine.solve(budget=cancel_after(0))
+    assert result.stop_reason == SolveResult.BUDGET and result.truncated
+    assert result.detail == Budget.CANCELLED
+    assert kb.budget is None
+
+
+@pytest.mark.parametrize("name", PROBLEMS)
+@pytest.mark.parametrize("checks", [1, 3, 5, 10, 20])
+def test_engine_resumes_after_budget(name, checks, cancel_after):
+    kb, engine = load(PROBLEMS[name])
+    engine.solve(budget=cancel_after(checks))
+    result = engine.solve()
+    assert result.stop_reason != SolveResult.BUDGET
+
+    fresh, fresh_engine = load(PROBLEMS[name])
+    fresh_engine.solve()
+    assert {k for k in kb.facts if k[0] != "EQUALITY"} == {k for k in fresh.facts if k[0] != "EQUALITY"}
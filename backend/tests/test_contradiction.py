@@ -0,0 +1,44 @@
+"""
+Đề bài mâu thuẫn: mục tiêu (tứ giác nội tiếp) chứng minh được sớm không được che mất mâu thuẫn -
+các luật chẩn đoán vẫn phải được chạy trên KB trước khi dừng.
+"""
+import pytest
+
+api_parser = pytest.importorskip("core_solver.parser.api_parser") # Cần google-generativeai, python-dotenv
+
+from core_solver.inference.goal import Goal, SolveResult
+from core_solver.test_runner import setup_system
+
+# ∠A + ∠C = 180° (đủ để chứng minh nội tiếp) nhưng ∠B + ∠D = 200°, tổng bốn góc 440°
+ITEMS = [
+    {"type": "QUADRILATERAL", "points": ["A", "B", "C", "D"]},
+    {"type": "VALUE", "subtype": "angle", "points": ["D", "A", "B"], "value": 60},
+    {"type": "VALUE", "subtype": "angle", "points": ["A", "B", "C"], "value": 100},
+    {"type": "VALUE", "subtype": "angle", "points": ["B", "C", "D"], "value": 120},
+    {"type": "VALUE", "subtype": "angle", "points": ["C", "D", "A"], "value": 100},
+]
+
+
+def load(mode=None):
+    kb, engine = setup_system()
+    if mode: setattr(engine, mode, True)
+    api_parser.LLMParser(kb).add_items([dict(item) for item in ITEMS])
+    return kb, engine
+
+
+@pytest.mark.parametrize("mode", [None, "agenda", "goal_directed", "sliced"])
+def test_goal_stop_runs_contradiction_checks(mode):
+    kb, engine = load(mode)
+    result = engine.solve(Goal("IS_CYCLIC", ["A", "B", "C", "D"]), min_methods=1, stop_on_contradiction=True)
+    assert result.stop_reason == SolveResult.CONTRADICTION
+    assert any("= 200°" in f.reason for f in kb.properties["CONTRADICTION"])
+
+
+def test_build_response_reports_contradiction():
+    main = pytest.importorskip("main") # Cần fastapi, matplotlib
+    kb, engine = load()
+    result = engine.solve(goal=main.build_goal(kb), min_methods=main.MIN_PROOF_METHODS,
+                          stop_on_contradiction=True, budget=main.make_budget())
+    response = main.build_response(kb, result, engine.stats)
+    assert response["status"] == "contradiction"
+    assert not any("Tổng hai góc đối" in line for line in response["solutions"])